@@ -7,9 +7,32 @@ class Settings(BaseSettings):
     mongodb_url: str = "mongodb://localhost:27017"
     database_name: str = "soyTechno"
     
+    # Índices al iniciar: "verificar" (avisa si faltan), "crear" o "no" (ver app/indices.py)
+    indices_al_iniciar: str = "verificar"
+    
     # CORS
     frontend_url: str = "http://localhost:3000"
     
+    # Carga de archivos
+    upload_batch_size: int = 1000  # Filas por lote de insert_many/bulk_write
+    upload_procesos: int = 2  # Procesos para leer archivos (0: en el worker, bloquea el event loop)
+    excel_motor: str = "auto"  # "calamine", "openpyxl" o "auto" (calamine si está instalado)
+    staging_dir: str = ""  # Copia parquet de cada carga, por mes (vacío: no se guarda; requiere pyarrow)
+    
+    # Usuarios
+    transacciones_recientes: int = 20  # Transacciones embebidas en cada usuario
+    
+    # Caché de consultas de puntos y listados (TTL 0 la deshabilita)
+    cache_backend: str = "memoria"  # "memoria" (por worker) o "redis" (compartida)
+    cache_max_entradas: int = 10000  # Solo backend memoria
+    cache_ttl_segundos: float = 30.0
+    redis_url: str = "redis://localhost:6379/0"
+    
+    # Consultas lentas de MongoDB (ver app/consultas_lentas.py)
+    slow_query_ms: float = 0  # Umbral en milisegundos (0: no se registran)
+    slow_query_log: str = "consultas_lentas.jsonl"
+    slow_query_explain_segundos: float = 300  # Un explain por forma de consulta cada N segundos
+    
     class Config:
         env_file = ".env"
         extra = "ignore"
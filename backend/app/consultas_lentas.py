@@ -0,0 +1,289 @@
+"""
+Registro de consultas lentas de MongoDB (opcional: SLOW_QUERY_MS > 0).
+
+Cada comando que tarda más que el umbral se agrega como una línea JSON a
+SLOW_QUERY_LOG con su filtro, orden, documentos examinados vs. devueltos
+y el plan de explain("executionStats"). El explain se ejecuta en un hilo
+aparte con un cliente síncrono, así la consulta original no espera, y
+una sola vez por forma de consulta cada SLOW_QUERY_EXPLAIN_SEGUNDOS.
+
+Resumen de las peores consultas:
+    python manage.py consultas-lentas --top 10
+"""
+
+import json
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+from bson import json_util
+from pymongo import MongoClient, monitoring
+from app.config import get_settings
+
+# Comandos con filtro que se pueden pasar a explain sin efectos
+EXPLICABLES = {"find", "aggregate", "count", "distinct"}
+
+# Campos de sesión y del driver que explain no acepta en el comando interno
+CAMPOS_DRIVER = {
+    "lsid", "$db", "$clusterTime", "$readPreference", "txnNumber",
+    "autocommit", "startTransaction", "readConcern", "writeConcern",
+}
+
+# Elementos de una lista que se guardan en el log (ej. $in de 5000 cédulas)
+MAX_ELEMENTOS_LOG = 10
+
+
+def forma(valor):
+    """Filtro u orden sin los valores: las consultas que solo cambian la cédula se agrupan."""
+    if isinstance(valor, dict):
+        return {clave: forma(v) for clave, v in valor.items()}
+    if isinstance(valor, list) and valor and all(isinstance(v, dict) for v in valor):
+        return [forma(v) for v in valor]
+    
+    return "?"
+
+
+def _recortar(valor):
+    if isinstance(valor, dict):
+        return {clave: _recortar(v) for clave, v in valor.items()}
+    if isinstance(valor, list):
+        recortada = [_recortar(v) for v in valor[:MAX_ELEMENTOS_LOG]]
+        if len(valor) > MAX_ELEMENTOS_LOG:
+            recortada.append(f"... ({len(valor) - MAX_ELEMENTOS_LOG} más)")
+        return recortada
+    
+    return valor
+
+
+def _consulta(comando: str, documento: dict) -> dict:
+    """Filtro, orden y pipeline del comando (lo que identifica la consulta)."""
+    if comando in ("update", "delete"):
+        # Lote de sentencias: la primera como muestra
+        sentencias = documento.get("updates" if comando == "update" else "deletes") or [{}]
+        return {"filtro": sentencias[0].get("q"), "sentencias": len(sentencias)}
+    
+    consulta = {
+        "filtro": documento.get("filter", documento.get("query")),
+        "orden": documento.get("sort"),
+        "proyeccion": documento.get("projection", documento.get("fields")),
+        "limite": documento.get("limit"),
+        "pipeline": documento.get("pipeline"),
+        "campo": documento.get("key"),
+    }
+    
+    return {clave: valor for clave, valor in consulta.items() if valor is not None}
+
+
+def _devueltos(comando: str, respuesta: dict) -> Optional[int]:
+    """Documentos en la respuesta (en find/aggregate, solo el primer lote)."""
+    if "cursor" in respuesta:
+        cursor = respuesta["cursor"]
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+    if comando == "distinct":
+        return len(respuesta.get("values", []))
+    if "n" in respuesta:
+        return respuesta["n"]
+    
+    return None
+
+
+def resumen_plan(explain: dict) -> dict:
+    """
+    Etapas e índices del plan ganador y documentos examinados/devueltos
+    de un resultado de explain("executionStats") de find o aggregate.
+    """
+    etapas: List[str] = []
+    indices: List[str] = []
+    estadisticas: List[dict] = []
+    
+    def recorrer(nodo, en_plan: bool):
+        if isinstance(nodo, list):
+            for elemento in nodo:
+                recorrer(elemento, en_plan)
+            return
+        if not isinstance(nodo, dict):
+            return
+        
+        for clave, valor in nodo.items():
+            if clave == "rejectedPlans":
+                continue
+            if en_plan and clave == "stage" and isinstance(valor, str):
+                etapas.append(valor)
+            elif en_plan and clave == "indexName" and valor not in indices:
+                indices.append(valor)
+            elif clave == "executionStats" and isinstance(valor, dict):
+                estadisticas.append(valor)
+            else:
+                recorrer(valor, en_plan or clave == "winningPlan")
+    
+    recorrer(explain, False)
+    
+    resumen = {"etapas": etapas, "indices": indices}
+    if estadisticas:
+        # En aggregate hay uno por cada $cursor; el primero es la consulta a la colección
+        resumen.update({
+            "docs_examinados": sum(e.get("totalDocsExamined", 0) for e in estadisticas),
+            "claves_examinadas": sum(e.get("totalKeysExamined", 0) for e in estadisticas),
+            "devueltos": estadisticas[0].get("nReturned"),
+            "tiempo_ms": estadisticas[0].get("executionTimeMillis"),
+        })
+    
+    return resumen
+
+
+class MonitorConsultasLentas(monitoring.CommandListener):
+    """
+    Registra los comandos de MongoDB más lentos que SLOW_QUERY_MS. Se
+    pasa al cliente en event_listeners (ver app/database.py).
+    """
+    
+    def __init__(self):
+        settings = get_settings()
+        self.umbral_ms = settings.slow_query_ms
+        self.ruta = settings.slow_query_log
+        self.intervalo_explain = settings.slow_query_explain_segundos
+        self.mongodb_url = settings.mongodb_url
+        
+        # request_id -> (base, comando) de los comandos en curso
+        self._comandos: Dict[int, tuple] = {}
+        # forma -> momento del último explain
+        self._explicados: Dict[str, float] = {}
+        self._cliente: Optional[MongoClient] = None
+        self._hilo = ThreadPoolExecutor(max_workers=1, thread_name_prefix="consultas-lentas")
+    
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        self._comandos[event.request_id] = (event.database_name, event.command)
+    
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        base, documento = self._comandos.pop(event.request_id, (None, None))
+        if documento is not None and event.duration_micros >= self.umbral_ms * 1000:
+            self._hilo.submit(
+                self._registrar, event.command_name, base, documento, event.duration_micros, event.reply, None
+            )
+    
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        base, documento = self._comandos.pop(event.request_id, (None, None))
+        if documento is not None and event.duration_micros >= self.umbral_ms * 1000:
+            self._hilo.submit(
+                self._registrar, event.command_name, base, documento, event.duration_micros, {}, str(event.failure)
+            )
+    
+    def _explain(self, base: str, comando: str, documento: dict) -> dict:
+        """explain("executionStats") del comando con un cliente propio (sin este monitor)."""
+        if self._cliente is None:
+            self._cliente = MongoClient(self.mongodb_url, serverSelectionTimeoutMS=5000)
+        
+        interno = {clave: valor for clave, valor in documento.items() if clave not in CAMPOS_DRIVER}
+        
+        return self._cliente[base].command({"explain": interno, "verbosity": "executionStats"})
+    
+    def _registrar(
+        self,
+        comando: str,
+        base: str,
+        documento: dict,
+        duracion_micros: int,
+        respuesta: dict,
+        error: Optional[str]
+    ) -> None:
+        coleccion = documento.get("collection") if comando == "getMore" else documento.get(comando)
+        consulta = _consulta(comando, documento)
+        clave_forma = json.dumps(
+            [comando, coleccion, forma(consulta.get("filtro")), consulta.get("orden"), forma(consulta.get("pipeline"))],
+            default=str
+        )
+        
+        registro = {
+            "fecha": datetime.now(),
+            "comando": comando,
+            "base": base,
+            "coleccion": coleccion if isinstance(coleccion, str) else None,
+            "duracion_ms": round(duracion_micros / 1000, 2),
+            "forma": clave_forma,
+            **_recortar(consulta),
+            "devueltos": _devueltos(comando, respuesta),
+        }
+        if error:
+            registro["error"] = error
+        
+        pipeline = consulta.get("pipeline") or []
+        escribe = any("$out" in etapa or "$merge" in etapa for etapa in pipeline)
+        ahora = time.monotonic()
+        if (
+            comando in EXPLICABLES
+            and not escribe
+            and ahora - self._explicados.get(clave_forma, -self.intervalo_explain) >= self.intervalo_explain
+        ):
+            self._explicados[clave_forma] = ahora
+            try:
+                explain = self._explain(base, comando, documento)
+                registro["plan"] = resumen_plan(explain)
+                registro["explain"] = explain.get("queryPlanner", explain.get("stages"))
+            except Exception as e:
+                registro["plan"] = {"error": f"explain falló: {str(e)[:200]}"}
+        
+        plan = registro.get("plan", {})
+        detalle = ", ".join(plan.get("etapas", [])[:3])
+        if "docs_examinados" in plan:
+            detalle += f"; {plan['docs_examinados']} examinados / {plan['devueltos']} devueltos"
+        print(f"🐢 Consulta lenta: {comando} {registro['coleccion']} {registro['duracion_ms']:.0f} ms {detalle}".rstrip())
+        
+        try:
+            with open(self.ruta, "a", encoding="utf-8") as archivo:
+                archivo.write(json_util.dumps(registro, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"⚠️ Error escribiendo {self.ruta}: {e}")
+    
+    def cerrar(self) -> None:
+        """Espera los registros pendientes y cierra el cliente de explain."""
+        self._hilo.shutdown(wait=True)
+        if self._cliente:
+            self._cliente.close()
+
+
+def resumir(ruta: str, top: int = 10, desde: Optional[datetime] = None) -> List[dict]:
+    """
+    Agrupa el log de consultas lentas por forma de consulta y retorna las
+    `top` con más tiempo acumulado.
+    
+    Args:
+        ruta: Archivo SLOW_QUERY_LOG
+        top: Formas a retornar
+        desde: Ignorar los registros anteriores
+    """
+    grupos: Dict[str, dict] = defaultdict(lambda: {"veces": 0, "duraciones": [], "errores": 0})
+    
+    with open(ruta, encoding="utf-8") as archivo:
+        for linea in archivo:
+            if not linea.strip():
+                continue
+            registro = json_util.loads(linea)
+            if desde and registro["fecha"].replace(tzinfo=None) < desde:
+                continue
+            
+            grupo = grupos[registro["forma"]]
+            grupo["veces"] += 1
+            grupo["duraciones"].append(registro["duracion_ms"])
+            grupo["errores"] += "error" in registro
+            grupo["comando"] = registro["comando"]
+            grupo["coleccion"] = registro["coleccion"]
+            # El último registro como ejemplo; el último plan capturado
+            grupo["ejemplo"] = {clave: registro[clave] for clave in ("filtro", "orden", "pipeline") if clave in registro}
+            if "docs_examinados" in registro.get("plan", {}):
+                grupo["plan"] = registro["plan"]
+    
+    resumen = []
+    for grupo in grupos.values():
+        duraciones = sorted(grupo.pop("duraciones"))
+        resumen.append({
+            **grupo,
+            "total_ms": round(sum(duraciones), 1),
+            "promedio_ms": round(sum(duraciones) / len(duraciones), 1),
+            "max_ms": duraciones[-1],
+            "p95_ms": duraciones[min(len(duraciones) - 1, int(len(duraciones) * 0.95))],
+        })
+    
+    resumen.sort(key=lambda grupo: grupo["total_ms"], reverse=True)
+    
+    return resumen[:top]
@@ -1,37 +1,48 @@
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 from app.config import get_settings
+from app.metricas import MonitorComandos
+from app.consultas_lentas import MonitorConsultasLentas
+from app.indices import verificar_al_iniciar
+from app.services.canje_service import CanjeService
 
 settings = get_settings()
 
 client: AsyncIOMotorClient = None
 db: AsyncIOMotorDatabase = None
+monitor_lentas: MonitorConsultasLentas = None
 
 
-async def connect_to_mongo():
+async def connect_to_mongo(verificar: bool = True):
     """Conectar a MongoDB al iniciar la aplicación."""
-    global client, db
-    client = AsyncIOMotorClient(settings.mongodb_url)
-    db = client[settings.database_name]
+    global client, db, monitor_lentas
+    # Duración de cada comando en /metrics
+    listeners = [MonitorComandos()]
+    if settings.slow_query_ms > 0:
+        monitor_lentas = MonitorConsultasLentas()
+        listeners.append(monitor_lentas)
+        print(f"🐢 Consultas lentas (> {settings.slow_query_ms:g} ms) en {settings.slow_query_log}")
     
-    # Crear índices
-    await db.clientes.create_index("cedula", unique=True)
-    await db.transacciones.create_index("cedula")
-    await db.transacciones.create_index("fecha")
+    client = AsyncIOMotorClient(settings.mongodb_url, event_listeners=listeners)
+    db = client[settings.database_name]
     
-    # Índices para colección users
-    await db.users.create_index("cedula", unique=True)
-    await db.users.create_index("nivel")
-    await db.users.create_index("puntos_vigentes")
+    # Los índices y la vista canje_ready se crean con manage.py (indexes
+    # sync, reconstruir-canje); aquí solo se verifican
+    if verificar:
+        await verificar_al_iniciar(db)
+        await CanjeService(db).verificar_al_iniciar()
     
     print(f"✅ Conectado a MongoDB: {settings.database_name}")
 
 
 async def close_mongo_connection():
     """Cerrar conexión a MongoDB al detener la aplicación."""
-    global client
+    global client, monitor_lentas
     if client:
         client.close()
         print("❌ Conexión a MongoDB cerrada")
+    if monitor_lentas:
+        monitor_lentas.cerrar()
+        monitor_lentas = None
 
 
 def get_database() -> AsyncIOMotorDatabase:
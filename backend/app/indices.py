@@ -0,0 +1,243 @@
+"""
+Registro declarativo de los índices de MongoDB.
+
+Los índices se crean fuera del arranque con `python manage.py indexes sync`
+(en el despliegue), no en cada worker. Al iniciar, cada worker solo lee la
+versión del registro guardada por el último sync (una consulta) y, si no
+coincide, compara los índices y avisa de los que faltan
+(INDICES_AL_INICIAR=crear los construye, ej. en desarrollo).
+
+    python manage.py indexes check
+    python manage.py indexes sync
+    python manage.py indexes drop-unused --confirmar
+"""
+
+import json
+import hashlib
+from datetime import datetime
+from typing import Dict, List, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+from app.config import get_settings
+
+# Opciones que distinguen dos índices con las mismas claves
+OPCIONES = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+INDICES: Dict[str, List[IndexModel]] = {
+    "clientes": [
+        IndexModel("cedula", unique=True),
+    ],
+    "transacciones": [
+        # Historial por usuario, de la más reciente a la más antigua
+        # (GET /api/users/{cedula}/transacciones, recálculo y vencimiento)
+        IndexModel([("cedula", 1), ("fecha", -1), ("_id", -1)]),
+        IndexModel("fecha"),
+        # Clave natural: una transacción cargada dos veces se rechaza.
+        # Sparse para las transacciones anteriores sin clave (manage.py migrar-claves)
+        IndexModel("clave", unique=True, sparse=True),
+    ],
+    "users": [
+        IndexModel("cedula", unique=True),
+        IndexModel("nivel"),
+        # Próximo vencimiento de puntos (manage.py expirar)
+        IndexModel("fin_periodo"),
+        # Paginación por cursor del listado por nombre
+        IndexModel([("nombre", 1), ("cedula", 1)]),
+    ],
+    "canje_ready": [
+        # Vista listos para canje (users y clientes), paginada por puntaje.
+        # Consulta cubierta: el índice incluye todos los campos de PROYECCION_CANJE
+        IndexModel([("origen", 1), ("cedula", 1)], unique=True),
+        IndexModel([
+            ("origen", 1),
+            ("puntos_vigentes", -1),
+            ("cedula", 1),
+            ("nombre", 1),
+            ("nivel", 1),
+            ("puntos_totales", 1),
+            ("puntos_listos_canje", 1),
+            ("dolares_canjeables", 1),
+        ], name="listos_canje_cubierto"),
+    ],
+    "upload_jobs": [
+        # Cargas en segundo plano: se eliminan a los 7 días
+        IndexModel("creado", expireAfterSeconds=7 * 24 * 3600),
+    ],
+}
+
+# Documento en la colección esquema con la versión del último sync
+ID_VERSION = "indices"
+
+
+def version_indices() -> str:
+    """Hash del registro: cambia al agregar, quitar o modificar un índice."""
+    registro = [
+        [coleccion, modelo.document]
+        for coleccion, modelos in sorted(INDICES.items())
+        for modelo in modelos
+    ]
+    return hashlib.sha1(json.dumps(registro, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+
+def _claves(indice: dict) -> list:
+    # El servidor puede devolver la dirección como double (1.0)
+    return [
+        (campo, direccion if isinstance(direccion, str) else int(direccion))
+        for campo, direccion in indice["key"].items()
+    ]
+
+
+def _opciones(indice: dict) -> dict:
+    """Opciones del índice, sin las que valen lo mismo que no tenerlas (ej. unique=False)."""
+    return {opcion: indice[opcion] for opcion in OPCIONES if indice.get(opcion)}
+
+
+async def estado_indices(db: AsyncIOMotorDatabase) -> Dict[str, dict]:
+    """
+    Compara el registro con los índices de la base de datos.
+    
+    Returns:
+        Por colección: faltantes (IndexModel del registro que no existen),
+        distintos ((IndexModel, índice existente) con las mismas claves y
+        otras opciones), sobrantes (índices existentes fuera del registro)
+        y presentes (nombres de los del registro que ya existen)
+    """
+    existentes_db = set(await db.list_collection_names())
+    colecciones = sorted(set(INDICES) | {c for c in existentes_db if not c.startswith("system.")})
+    
+    estado = {}
+    for coleccion in colecciones:
+        existentes = []
+        if coleccion in existentes_db:
+            existentes = [indice async for indice in db[coleccion].list_indexes()]
+        
+        resultado = {"faltantes": [], "distintos": [], "sobrantes": [], "presentes": []}
+        usados = set()
+        for modelo in INDICES.get(coleccion, []):
+            documento = modelo.document
+            # Se busca por claves: un índice creado con otro nombre también vale
+            existente = next(
+                (indice for indice in existentes if _claves(indice) == _claves(documento)),
+                None
+            )
+            
+            if existente is None:
+                resultado["faltantes"].append(modelo)
+                continue
+            
+            usados.add(existente["name"])
+            if _opciones(existente) != _opciones(documento):
+                resultado["distintos"].append((modelo, existente))
+            else:
+                resultado["presentes"].append(existente["name"])
+        
+        resultado["sobrantes"] = [
+            indice for indice in existentes
+            if indice["name"] != "_id_" and indice["name"] not in usados
+        ]
+        estado[coleccion] = resultado
+    
+    return estado
+
+
+async def uso_indices(db: AsyncIOMotorDatabase, coleccion: str) -> Optional[Dict[str, dict]]:
+    """
+    Operaciones de cada índice desde que arrancó el servidor ($indexStats),
+    o None si el servidor no lo permite.
+    """
+    try:
+        return {
+            estadistica["name"]: estadistica["accesses"]
+            async for estadistica in db[coleccion].aggregate([{"$indexStats": {}}])
+        }
+    except (OperationFailure, NotImplementedError):
+        return None
+
+
+async def marcar_version(db: AsyncIOMotorDatabase) -> None:
+    """Guarda la versión del registro: el próximo arranque no compara los índices."""
+    await db.esquema.update_one(
+        {"_id": ID_VERSION},
+        {"$set": {"version": version_indices(), "sincronizado": datetime.now()}},
+        upsert=True
+    )
+
+
+async def sincronizar_indices(db: AsyncIOMotorDatabase) -> dict:
+    """
+    Crea los índices del registro que faltan, en un solo createIndexes por
+    colección y en segundo plano (las versiones de MongoDB anteriores a 4.2
+    bloquean la colección sin background; las posteriores lo ignoran y
+    construyen sin bloquear). No modifica ni elimina índices existentes.
+    
+    Returns:
+        Estadísticas: creados (colección.nombre), distintos (índices con
+        otras opciones, hay que recrearlos a mano) y sobrantes
+    """
+    stats = {"creados": [], "distintos": [], "sobrantes": 0}
+    
+    for coleccion, resultado in (await estado_indices(db)).items():
+        if resultado["faltantes"]:
+            modelos = [
+                IndexModel(list(modelo.document["key"].items()), background=True, **{
+                    clave: valor for clave, valor in modelo.document.items() if clave != "key"
+                })
+                for modelo in resultado["faltantes"]
+            ]
+            nombres = await db[coleccion].create_indexes(modelos)
+            stats["creados"].extend(f"{coleccion}.{nombre}" for nombre in nombres)
+        
+        stats["distintos"].extend(
+            f"{coleccion}.{existente['name']}" for _, existente in resultado["distintos"]
+        )
+        stats["sobrantes"] += len(resultado["sobrantes"])
+    
+    if not stats["distintos"]:
+        await marcar_version(db)
+    
+    return stats
+
+
+async def verificar_al_iniciar(db: AsyncIOMotorDatabase) -> None:
+    """
+    Arranque rápido: si el último sync fue con este registro no hace nada
+    más que una lectura; si no, compara y avisa (o crea, según
+    INDICES_AL_INICIAR).
+    """
+    modo = get_settings().indices_al_iniciar
+    if modo == "no":
+        return
+    
+    marca = await db.esquema.find_one({"_id": ID_VERSION})
+    if marca and marca.get("version") == version_indices():
+        return
+    
+    if modo == "crear":
+        stats = await sincronizar_indices(db)
+        if stats["creados"]:
+            print(f"🗂️  Índices creados: {', '.join(stats['creados'])}")
+        return
+    
+    estado = await estado_indices(db)
+    faltantes = [
+        f"{coleccion}.{modelo.document['name']}"
+        for coleccion, resultado in estado.items()
+        for modelo in resultado["faltantes"]
+    ]
+    distintos = [
+        f"{coleccion}.{existente['name']}"
+        for coleccion, resultado in estado.items()
+        for _, existente in resultado["distintos"]
+    ]
+    
+    if not faltantes and not distintos:
+        # Índices creados antes del registro: quedan marcados
+        await marcar_version(db)
+        return
+    
+    if faltantes:
+        print(f"⚠️  Faltan índices: {', '.join(faltantes)}")
+    if distintos:
+        print(f"⚠️  Índices con otras opciones: {', '.join(distintos)}")
+    print("⚠️  Ejecute: python manage.py indexes sync")
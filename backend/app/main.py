@@ -1,9 +1,13 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
 from app.config import get_settings
 from app.database import connect_to_mongo, close_mongo_connection
+from app.services.cache import get_cache_puntos
+from app.metricas import MiddlewareMetricas, exportar_metricas, marcar_proceso_terminado, CONTENT_TYPE_LATEST
+from starlette.concurrency import run_in_threadpool
+from app.services.lector_transacciones import get_pool_lectura, cerrar_pool_lectura
 from app.routers import puntos_router, data_router, users_router
 
 settings = get_settings()
@@ -14,9 +18,15 @@ async def lifespan(app: FastAPI):
     """Gestión del ciclo de vida de la aplicación."""
     # Startup
     await connect_to_mongo()
+    if settings.upload_procesos:
+        # Crear los procesos lectores antes de la primera carga
+        await run_in_threadpool(get_pool_lectura)
     yield
     # Shutdown
+    await get_cache_puntos().cerrar()
+    cerrar_pool_lectura()
     await close_mongo_connection()
+    marcar_proceso_terminado()
 
 
 app = FastAPI(
@@ -58,6 +68,9 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+# Peticiones y latencia por ruta para /metrics
+app.add_middleware(MiddlewareMetricas)
+
 # Registrar routers
 app.include_router(puntos_router)
 app.include_router(data_router)
@@ -75,9 +88,14 @@ async def root():
             "puntos_cliente": "GET /api/puntos/cliente/{cedula}",
             "listos_canje": "GET /api/puntos/listos-canje",
             "upload": "POST /api/data/upload",
+            "upload_async": "POST /api/data/upload/async",
+            "upload_job": "GET /api/data/jobs/{job_id}",
             "user_puntos": "GET /api/users/puntos/{cedula}",
             "user_completo": "GET /api/users/{cedula}",
+            "user_transacciones": "GET /api/users/{cedula}/transacciones",
             "users_listos_canje": "GET /api/users/listos-canje/",
+            "cache": "GET /health/cache",
+            "metricas": "GET /metrics",
         }
     }
 
@@ -86,3 +104,15 @@ async def root():
 async def health_check():
     """Verificar estado de la API."""
     return {"status": "healthy"}
+
+
+@app.get("/health/cache", tags=["Health"])
+async def cache_stats():
+    """Estadísticas de la caché de consultas de puntos y listados (hits, misses, evictions)."""
+    return await get_cache_puntos().estadisticas()
+
+
+@app.get("/metrics", tags=["Health"])
+async def metricas():
+    """Métricas en formato Prometheus (peticiones, MongoDB, cargas y caché), de todos los workers."""
+    return Response(exportar_metricas(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,165 @@
+"""
+Métricas Prometheus del backend, expuestas en GET /metrics.
+
+- Peticiones y latencia por ruta (la plantilla, ej. /api/users/puntos/{cedula})
+- Duración de cada comando de MongoDB por comando y colección
+- Filas cargadas y velocidad de las cargas de archivos
+- Consultas a la caché de puntos (hits/misses) y evictions
+
+Con varios workers (run.py --prod) cada proceso escribe sus valores en
+PROMETHEUS_MULTIPROC_DIR y /metrics suma los de todos (modo
+multiproceso de prometheus_client).
+"""
+
+import os
+import time
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from pymongo import monitoring
+
+PETICIONES = Counter(
+    "soytechno_http_peticiones_total",
+    "Peticiones HTTP por método, ruta y código de estado",
+    ["metodo", "ruta", "estado"],
+)
+DURACION_PETICION = Histogram(
+    "soytechno_http_peticion_segundos",
+    "Duración de las peticiones HTTP por método y ruta",
+    ["metodo", "ruta"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+
+DURACION_COMANDO = Histogram(
+    "soytechno_mongodb_comando_segundos",
+    "Duración de los comandos de MongoDB por comando y colección",
+    ["comando", "coleccion"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+ERRORES_COMANDO = Counter(
+    "soytechno_mongodb_comando_errores_total",
+    "Comandos de MongoDB fallidos por comando y colección",
+    ["comando", "coleccion"],
+)
+
+FILAS_CARGA = Counter(
+    "soytechno_upload_filas_total",
+    "Filas de las cargas de archivos: leidas, procesadas (insertadas) y duplicadas",
+    ["resultado"],
+)
+DURACION_CARGA = Histogram(
+    "soytechno_upload_segundos",
+    "Duración de cada carga de archivos",
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+VELOCIDAD_CARGA = Histogram(
+    "soytechno_upload_filas_por_segundo",
+    "Filas leídas por segundo en cada carga de archivos",
+    buckets=(100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000),
+)
+
+CONSULTAS_CACHE = Counter(
+    "soytechno_cache_consultas_total",
+    "Consultas a la caché de puntos por resultado (hit/miss)",
+    ["resultado"],
+)
+EVICTIONS_CACHE = Counter(
+    "soytechno_cache_evictions_total",
+    "Entradas descartadas de la caché en memoria por límite de tamaño",
+)
+
+
+class MiddlewareMetricas:
+    """
+    Middleware ASGI que registra cada petición HTTP con la plantilla de
+    su ruta, no la URL: /api/users/puntos/{cedula} es una sola serie.
+    Las peticiones que no coinciden con ninguna ruta van a "sin_ruta".
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        inicio = time.perf_counter()
+        estado = 500
+        
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+            await send(mensaje)
+        
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            # El router de FastAPI deja la ruta encontrada en el scope
+            ruta = getattr(scope.get("route"), "path", "sin_ruta")
+            metodo = scope["method"]
+            
+            PETICIONES.labels(metodo, ruta, str(estado)).inc()
+            DURACION_PETICION.labels(metodo, ruta).observe(time.perf_counter() - inicio)
+
+
+class MonitorComandos(monitoring.CommandListener):
+    """
+    Registra la duración de los comandos de MongoDB (command monitoring
+    de PyMongo). Se pasa al cliente en event_listeners.
+    """
+    
+    def __init__(self):
+        # request_id -> colección del comando en curso
+        self._colecciones = {}
+    
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        comando = event.command
+        if event.command_name == "getMore":
+            coleccion = comando.get("collection")
+        else:
+            coleccion = comando.get(event.command_name)
+        
+        self._colecciones[event.request_id] = coleccion if isinstance(coleccion, str) else ""
+    
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        coleccion = self._colecciones.pop(event.request_id, "")
+        DURACION_COMANDO.labels(event.command_name, coleccion).observe(event.duration_micros / 1e6)
+    
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        coleccion = self._colecciones.pop(event.request_id, "")
+        DURACION_COMANDO.labels(event.command_name, coleccion).observe(event.duration_micros / 1e6)
+        ERRORES_COMANDO.labels(event.command_name, coleccion).inc()
+
+
+def registrar_carga(filas_leidas: int, procesadas: int, duplicadas: int, segundos: float) -> None:
+    """Registra el resultado de una carga de archivos."""
+    FILAS_CARGA.labels("leidas").inc(filas_leidas)
+    FILAS_CARGA.labels("procesadas").inc(procesadas)
+    FILAS_CARGA.labels("duplicadas").inc(duplicadas)
+    DURACION_CARGA.observe(segundos)
+    if segundos > 0 and filas_leidas:
+        VELOCIDAD_CARGA.observe(filas_leidas / segundos)
+
+
+def exportar_metricas() -> bytes:
+    """Métricas en el formato de texto de Prometheus, sumadas entre workers si corresponde."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+        return generate_latest(registro)
+    
+    return generate_latest(REGISTRY)
+
+
+def marcar_proceso_terminado() -> None:
+    """Al detener un worker en modo multiproceso, descarta sus valores de estado."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
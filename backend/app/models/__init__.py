@@ -1,7 +1,22 @@
 from app.models.cliente import Cliente, ClienteCreate, ClienteResponse, ClientePuntosResponse
 from app.models.transaccion import Transaccion, TransaccionCreate
-from app.models.responses import UploadResponse, ClientesListosCanje, UsersListosCanje
-from app.models.user import User, UserCreate, UserResponse, UserPuntosResponse, TransaccionResumen
+from app.models.responses import (
+    UploadResponse,
+    ResultadoArchivo,
+    UploadJobResponse,
+    UploadJobEstado,
+    ClientesListosCanje,
+    UsersListosCanje,
+    UsersPuntosBatch,
+)
+from app.models.user import (
+    User,
+    UserCreate,
+    UserResponse,
+    UserPuntosResponse,
+    UsersPuntosBatchRequest,
+    TransaccionResumen,
+)
 
 __all__ = [
     "Cliente",
@@ -11,11 +26,16 @@ __all__ = [
     "Transaccion",
     "TransaccionCreate",
     "UploadResponse",
+    "ResultadoArchivo",
+    "UploadJobResponse",
+    "UploadJobEstado",
     "ClientesListosCanje",
     "UsersListosCanje",
+    "UsersPuntosBatch",
     "User",
     "UserCreate",
     "UserResponse",
     "UserPuntosResponse",
+    "UsersPuntosBatchRequest",
     "TransaccionResumen",
 ]
@@ -25,6 +25,8 @@ class Cliente(ClienteBase):
     puntos_vigentes: int = 0
     puntos_listos_canje: int = 0
     dolares_canjeables: float = 0.0
+    inicio_periodo: Optional[datetime] = None
+    fin_periodo: Optional[datetime] = None
     ultima_actualizacion: datetime = Field(default_factory=datetime.now)
     
     class Config:
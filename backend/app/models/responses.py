@@ -1,29 +1,78 @@
 from pydantic import BaseModel
-from typing import List, TYPE_CHECKING
+from typing import List, Optional, Literal, TYPE_CHECKING
+from datetime import datetime
 
 if TYPE_CHECKING:
     from app.models.cliente import ClientePuntosResponse
     from app.models.user import UserPuntosResponse
 
 
+class ResultadoArchivo(BaseModel):
+    """Resultado de un archivo dentro de una carga."""
+    nombre_archivo: str
+    hojas: int = 0  # Hojas leídas (1 para CSV)
+    filas_leidas: int = 0
+    registros_procesados: int = 0
+    duplicados_omitidos: int = 0
+    repetido: bool = False  # Mismo contenido que un archivo ya cargado
+    errores: List[str] = []
+
+
 class UploadResponse(BaseModel):
     """Respuesta al subir archivo de transacciones."""
     registros_procesados: int
     clientes_actualizados: int
     usuarios_actualizados: int = 0
+    duplicados_omitidos: int = 0  # Transacciones ya cargadas anteriormente
     errores: List[str] = []
+    archivos: List[ResultadoArchivo] = []  # Detalle por archivo
+
+
+EstadoJob = Literal["pendiente", "procesando", "completado", "error"]
+
+
+class UploadJobResponse(BaseModel):
+    """Respuesta al encolar un archivo para procesamiento en segundo plano."""
+    job_id: str
+    estado: EstadoJob
+
+
+class UploadJobEstado(BaseModel):
+    """Estado y progreso de una carga en segundo plano."""
+    job_id: str
+    estado: EstadoJob
+    nombre_archivo: str
+    filas_totales: Optional[int] = None  # Estimado; None si no se pudo calcular
+    filas_procesadas: int = 0
+    filas_fallidas: int = 0
+    filas_por_segundo: float = 0.0
+    eta_segundos: Optional[float] = None
+    creado: datetime
+    iniciado: Optional[datetime] = None
+    finalizado: Optional[datetime] = None
+    resultado: Optional[UploadResponse] = None
+    errores_totales: int = 0  # resultado.errores se trunca en cargas grandes
+    error: Optional[str] = None
 
 
 class ClientesListosCanje(BaseModel):
     """Respuesta para lista de clientes listos para canje."""
-    total: int
+    total: Optional[int] = None  # None si se pidió sin total
     clientes: List["ClientePuntosResponse"]
+    siguiente: Optional[str] = None  # Cursor para la siguiente página
+
+
+class UsersPuntosBatch(BaseModel):
+    """Respuesta para consulta de puntos de varios usuarios."""
+    users: List["UserPuntosResponse"]  # En el orden de las cédulas pedidas
+    no_encontradas: List[str] = []
 
 
 class UsersListosCanje(BaseModel):
     """Respuesta para lista de usuarios listos para canje."""
-    total: int
+    total: Optional[int] = None  # None si se pidió sin total
     users: List["UserPuntosResponse"]
+    siguiente: Optional[str] = None  # Cursor para la siguiente página
 
 
 # Resolver referencias forward
@@ -31,3 +80,4 @@ from app.models.cliente import ClientePuntosResponse
 from app.models.user import UserPuntosResponse
 ClientesListosCanje.model_rebuild()
 UsersListosCanje.model_rebuild()
+UsersPuntosBatch.model_rebuild()
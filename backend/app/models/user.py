@@ -43,6 +43,10 @@ class User(UserBase):
     puntos_listos_canje: int = 0     # Múltiplos de 500 disponibles
     dolares_canjeables: float = 0.0  # puntos_listos_canje / 50
     
+    # Período vigente actual (1 año desde fecha_suscripcion o su aniversario)
+    inicio_periodo: Optional[datetime] = None
+    fin_periodo: Optional[datetime] = None
+    
     # Nivel de fidelización
     nivel: NivelFidelizacion = "Kilobytes"
     
@@ -86,3 +90,12 @@ class UserPuntosResponse(BaseModel):
     puntos_vigentes: int
     puntos_listos_canje: int
     dolares_canjeables: float
+
+
+# Máximo de cédulas por consulta de puntos en lote
+MAX_CEDULAS_LOTE = 5000
+
+
+class UsersPuntosBatchRequest(BaseModel):
+    """Cédulas para consultar puntos en lote."""
+    cedulas: List[str] = Field(..., min_length=1, max_length=MAX_CEDULAS_LOTE)
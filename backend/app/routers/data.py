@@ -1,10 +1,45 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+import shutil
+import tempfile
+from typing import List
+from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
+from starlette.concurrency import run_in_threadpool
 from app.database import get_database
-from app.services import ExcelService
-from app.models import UploadResponse
+from app.services import ExcelService, JobService
+from app.models import UploadResponse, UploadJobResponse, UploadJobEstado
 
 router = APIRouter(prefix="/api/data", tags=["Data"])
 
+EXTENSIONES_VALIDAS = [".csv", ".xlsx", ".xls"]
+
+# La carga múltiple acepta además .zip con archivos de las extensiones válidas
+EXTENSIONES_MULTIPLES = EXTENSIONES_VALIDAS + [".zip"]
+
+
+def validar_archivo(file: UploadFile, extensiones: List[str] = EXTENSIONES_VALIDAS) -> str:
+    """Valida nombre, extensión y tamaño del archivo. Retorna la extensión."""
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="Nombre de archivo no proporcionado")
+    
+    extension = file.filename.lower()[file.filename.rfind("."):]
+    
+    if extension not in extensiones:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Formato no válido ({file.filename}). Extensiones permitidas: {', '.join(extensiones)}"
+        )
+    
+    if not file.size:
+        raise HTTPException(status_code=400, detail="Archivo vacío")
+    
+    return extension
+
+
+def guardar_temporal(file: UploadFile, extension: str) -> str:
+    """Copia el archivo subido a disco para procesarlo tras la respuesta."""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=extension) as destino:
+        shutil.copyfileobj(file.file, destino, 1024 * 1024)
+        return destino.name
+
 
 @router.post("/upload", response_model=UploadResponse)
 async def upload_transacciones(
@@ -30,43 +65,92 @@ async def upload_transacciones(
     - Numero
     
     El proceso:
-    1. Lee y valida el archivo
-    2. Inserta las transacciones en la base de datos
+    1. Lee y valida el archivo por bloques (sin cargarlo completo en memoria),
+       todas las hojas si es un libro Excel
+    2. Inserta las transacciones en la base de datos por lotes
     3. Calcula puntos generados ($1 = 1 punto)
     4. Actualiza o crea clientes
     5. Recalcula niveles de fidelización
+    
+    Las transacciones ya cargadas se omiten y se cuentan en
+    `duplicados_omitidos`; un archivo idéntico a uno ya procesado no se lee.
     """
-    # Validar extensión
-    if not file.filename:
-        raise HTTPException(status_code=400, detail="Nombre de archivo no proporcionado")
+    validar_archivo(file)
     
-    extensiones_validas = [".csv", ".xlsx", ".xls"]
-    extension = file.filename.lower()[file.filename.rfind("."):]
+    # Procesar por bloques directamente desde el archivo temporal
+    db = get_database()
+    service = ExcelService(db)
     
-    if extension not in extensiones_validas:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Formato no válido. Extensiones permitidas: {', '.join(extensiones_validas)}"
-        )
+    return await service.procesar_archivos([(file.file, file.filename)])
+
+
+@router.post("/upload/multiple", response_model=UploadResponse)
+async def upload_multiple(
+    files: List[UploadFile] = File(..., description="Archivos Excel/CSV, o .zip que los contenga")
+):
+    """
+    Subir varios archivos de transacciones en una sola petición.
     
-    # Leer contenido
-    contenido = await file.read()
+    Acepta el mismo formato que `POST /api/data/upload` para cada archivo,
+    o archivos .zip con varios .xlsx/.xls/.csv (por ejemplo uno por tienda).
+    Se leen todas las hojas de cada libro, varias a la vez, y las filas
+    repetidas entre archivos se omiten.
     
-    if not contenido:
-        raise HTTPException(status_code=400, detail="Archivo vacío")
+    Retorna los totales de la carga y, en `archivos`, las filas leídas,
+    registros, duplicados y errores de cada archivo.
+    """
+    for file in files:
+        validar_archivo(file, EXTENSIONES_MULTIPLES)
     
-    # Procesar
-    db = get_database()
-    service = ExcelService(db)
+    service = ExcelService(get_database())
+    
+    return await service.procesar_archivos([(file.file, file.filename) for file in files])
+
+
+@router.post("/upload/async", response_model=UploadJobResponse, status_code=202)
+async def upload_transacciones_async(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(..., description="Archivo Excel (.xlsx, .xls) o CSV")
+):
+    """
+    Subir archivo Excel/CSV de transacciones para procesarlo en segundo plano.
+    
+    Acepta el mismo formato que `POST /api/data/upload`, pero responde de
+    inmediato con un `job_id`. El avance se consulta en
+    `GET /api/data/jobs/{job_id}`.
+    """
+    extension = validar_archivo(file)
+    
+    # El archivo subido se cierra al terminar la petición
+    ruta = await run_in_threadpool(guardar_temporal, file, extension)
+    
+    service = JobService(get_database())
+    job_id = await service.crear_job(file.filename)
+    
+    background_tasks.add_task(service.ejecutar_carga, job_id, ruta, file.filename)
+    
+    return UploadJobResponse(job_id=job_id, estado="pendiente")
+
+
+@router.get("/jobs/{job_id}", response_model=UploadJobEstado)
+async def obtener_job(job_id: str):
+    """
+    Consulta el progreso de una carga en segundo plano.
+    
+    Retorna:
+    - Estado (pendiente, procesando, completado, error)
+    - Filas totales estimadas, procesadas y fallidas
+    - Velocidad (filas por segundo) y tiempo estimado restante
+    - Resultado final cuando la carga termina
+    """
+    service = JobService(get_database())
+    
+    job = await service.obtener_job(job_id)
+    
+    if not job:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Carga {job_id} no encontrada"
+        )
     
-    registros, clientes, usuarios, errores = await service.procesar_archivo(
-        contenido=contenido,
-        nombre_archivo=file.filename
-    )
-    
-    return UploadResponse(
-        registros_procesados=registros,
-        clientes_actualizados=clientes,
-        usuarios_actualizados=usuarios,
-        errores=errores
-    )
+    return job
@@ -1,7 +1,9 @@
 from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
 from app.database import get_database
 from app.services import PuntosService
 from app.models import ClientePuntosResponse, ClientesListosCanje
+from app.respuestas import RespuestaJSON
 
 router = APIRouter(prefix="/api/puntos", tags=["Puntos"])
 
@@ -31,13 +33,15 @@ async def obtener_puntos_cliente(cedula: str):
             detail=f"Cliente con cédula {cedula} no encontrado"
         )
     
-    return cliente
+    return RespuestaJSON(cliente)
 
 
 @router.get("/listos-canje", response_model=ClientesListosCanje)
 async def obtener_clientes_listos_canje(
     page: int = Query(1, ge=1, description="Número de página"),
     limit: int = Query(10, ge=1, le=100, description="Registros por página"),
+    after: Optional[str] = Query(None, description="Cursor de la página anterior (campo `siguiente`)"),
+    incluir_total: bool = Query(True, description="Incluir el total de clientes listos para canje (leído del contador de canje_ready; si la vista no está construida, se cuenta en clientes)"),
 ):
     """
     Consulta masiva de clientes listos para canje.
@@ -48,13 +52,22 @@ async def obtener_clientes_listos_canje(
     - Nombre
     - Nivel
     - Total de dólares disponibles para canje
+    
+    Para recorrer páginas profundas conviene enviar el cursor `siguiente`
+    en `after` en lugar de `page`.
     """
     db = get_database()
     service = PuntosService(db)
     
-    clientes, total = await service.obtener_clientes_listos_canje(page, limit)
+    try:
+        clientes, total, siguiente = await service.obtener_clientes_listos_canje(
+            page, limit, after, incluir_total
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    return ClientesListosCanje(
-        total=total,
-        clientes=clientes
-    )
+    return RespuestaJSON({
+        "total": total,
+        "clientes": clientes,
+        "siguiente": siguiente
+    })
@@ -1,9 +1,11 @@
 from fastapi import APIRouter, HTTPException, Query
 from datetime import datetime
+from typing import Optional
 from app.database import get_database
 from app.services import UserService
-from app.models.user import UserPuntosResponse, UserResponse
-from app.models.responses import UsersListosCanje
+from app.models.user import UserPuntosResponse, UserResponse, UsersPuntosBatchRequest
+from app.models.responses import UsersListosCanje, UsersPuntosBatch
+from app.respuestas import RespuestaJSON
 
 router = APIRouter(prefix="/api/users", tags=["Users"])
 
@@ -22,18 +24,20 @@ def format_datetime(dt) -> str:
 
 
 def format_user_dates(user: dict) -> dict:
-    """Formatea todas las fechas de un usuario."""
+    """
+    Prepara las fechas de un usuario para RespuestaJSON, que escribe los
+    datetime como dd/mm/yy H:M:S (también las de las transacciones, sin
+    recorrerlas aquí). Las demás fechas del usuario van en ISO.
+    """
     date_fields = ["fecha_registro", "fecha_suscripcion", "ultima_actualizacion"]
     
-    for field in date_fields:
-        if field in user and user[field]:
-            user[field] = format_datetime(user[field])
-    
-    # Formatear fechas en transacciones
-    if "transacciones" in user:
-        for tx in user["transacciones"]:
-            if "fecha" in tx and tx["fecha"]:
-                tx["fecha"] = format_datetime(tx["fecha"])
+    for field, value in user.items():
+        if field in date_fields:
+            # Fechas guardadas como texto
+            if value and not isinstance(value, datetime):
+                user[field] = format_datetime(value)
+        elif isinstance(value, datetime):
+            user[field] = value.isoformat()
     
     return user
 
@@ -47,21 +51,29 @@ def limpiar_cedula(cedula: str) -> str:
 async def obtener_todos_usuarios(
     page: int = Query(1, ge=1, description="Número de página"),
     limit: int = Query(50, ge=1, le=500, description="Registros por página"),
+    after: Optional[str] = Query(None, description="Cursor de la página anterior (campo `siguiente`)"),
 ):
     """
     Obtiene todos los usuarios con paginación.
+    
+    Para recorrer páginas profundas conviene enviar el cursor `siguiente`
+    en `after` en lugar de `page`. El total es un estimado.
     """
     db = get_database()
     service = UserService(db)
     
-    users, total = await service.obtener_todos_users(page, limit)
+    try:
+        users, total, siguiente = await service.obtener_todos_users(page, limit, after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    return {
+    return RespuestaJSON({
         "total": total,
         "page": page,
         "limit": limit,
+        "siguiente": siguiente,
         "users": users
-    }
+    })
 
 
 @router.get("/puntos/{cedula}", response_model=UserPuntosResponse)
@@ -92,13 +104,34 @@ async def obtener_puntos_usuario(cedula: str):
             detail=f"Usuario con cédula {cedula} no encontrado"
         )
     
-    return user
+    return RespuestaJSON(user)
+
+
+@router.post("/puntos/batch", response_model=UsersPuntosBatch)
+async def obtener_puntos_usuarios(solicitud: UsersPuntosBatchRequest):
+    """
+    Consulta de puntos de varios usuarios a la vez (hasta 5000 cédulas),
+    con los mismos campos que `GET /api/users/puntos/{cedula}`.
+    
+    Retorna los usuarios encontrados, en el orden pedido, y en
+    `no_encontradas` las cédulas sin usuario.
+    """
+    # Limpiar cédulas
+    cedulas = [limpiar_cedula(cedula) for cedula in solicitud.cedulas]
+    
+    db = get_database()
+    service = UserService(db)
+    
+    users, no_encontradas = await service.obtener_users_puntos(cedulas)
+    
+    return RespuestaJSON({"users": users, "no_encontradas": no_encontradas})
 
 
 @router.get("/{cedula}", response_model=dict)
 async def obtener_usuario_completo(cedula: str):
     """
-    Obtiene información completa de un usuario incluyendo todas sus transacciones.
+    Obtiene información completa de un usuario incluyendo sus transacciones
+    más recientes. El historial completo está en `GET /api/users/{cedula}/transacciones`.
     """
     # Limpiar cédula
     cedula = limpiar_cedula(cedula)
@@ -120,13 +153,49 @@ async def obtener_usuario_completo(cedula: str):
     # Formatear fechas a dd/mm/yy H:M:S
     user = format_user_dates(user)
     
-    return user
+    return RespuestaJSON(user)
+
+
+@router.get("/{cedula}/transacciones", response_model=dict)
+async def obtener_transacciones_usuario(
+    cedula: str,
+    limit: int = Query(50, ge=1, le=500, description="Registros por página"),
+    after: Optional[str] = Query(None, description="Cursor de la página anterior (campo `siguiente`)"),
+):
+    """
+    Historial completo de transacciones de un usuario, de la más reciente
+    a la más antigua, paginado por cursor.
+    
+    El usuario solo guarda sus transacciones más recientes; este endpoint
+    consulta la colección de transacciones. Para obtener la siguiente
+    página se envía el valor de `siguiente` en `after`.
+    """
+    # Limpiar cédula
+    cedula = limpiar_cedula(cedula)
+    
+    db = get_database()
+    service = UserService(db)
+    
+    try:
+        transacciones, siguiente = await service.obtener_transacciones(cedula, limit, after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # RespuestaJSON formatea las fechas a dd/mm/yy H:M:S
+    return RespuestaJSON({
+        "cedula": cedula,
+        "limit": limit,
+        "siguiente": siguiente,
+        "transacciones": transacciones
+    })
 
 
 @router.get("/listos-canje/", response_model=UsersListosCanje)
 async def obtener_usuarios_listos_canje(
     page: int = Query(1, ge=1, description="Número de página"),
     limit: int = Query(10, ge=1, le=100, description="Registros por página"),
+    after: Optional[str] = Query(None, description="Cursor de la página anterior (campo `siguiente`)"),
+    incluir_total: bool = Query(True, description="Incluir el total de usuarios listos para canje (leído del contador de canje_ready; si la vista no está construida, se cuenta en users)"),
 ):
     """
     Consulta masiva de usuarios listos para canje.
@@ -137,13 +206,22 @@ async def obtener_usuarios_listos_canje(
     - Nombre
     - Nivel
     - Total de dólares disponibles para canje
+    
+    Para recorrer páginas profundas conviene enviar el cursor `siguiente`
+    en `after` en lugar de `page`.
     """
     db = get_database()
     service = UserService(db)
     
-    users, total = await service.obtener_users_listos_canje(page, limit)
+    try:
+        users, total, siguiente = await service.obtener_users_listos_canje(
+            page, limit, after, incluir_total
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    return UsersListosCanje(
-        total=total,
-        users=users
-    )
+    return RespuestaJSON({
+        "total": total,
+        "users": users,
+        "siguiente": siguiente
+    })
@@ -1,5 +1,8 @@
 from app.services.puntos_service import PuntosService
 from app.services.excel_service import ExcelService
 from app.services.user_service import UserService
+from app.services.job_service import JobService
+from app.services.canje_service import CanjeService
+from app.services.staging_service import StagingService
 
-__all__ = ["PuntosService", "ExcelService", "UserService"]
+__all__ = ["PuntosService", "ExcelService", "UserService", "JobService", "CanjeService", "StagingService"]
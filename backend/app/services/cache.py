@@ -0,0 +1,291 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Iterable, Optional
+from app.config import get_settings
+from app.metricas import CONSULTAS_CACHE, EVICTIONS_CACHE
+
+
+# Espacio de los listados paginados: se invalida completo en cada escritura
+ESPACIO_LISTADOS = "listados"
+
+
+class CacheBackend:
+    """
+    Interfaz común de la caché de consultas.
+    
+    Las claves son str y los valores deben ser serializables a JSON
+    (dicts/listas de tipos simples), para que cualquier backend pueda
+    guardarlos. Los espacios de claves tienen una versión: cambiarla
+    invalida de una vez todas las claves construidas con la anterior.
+    """
+    
+    nombre = "base"
+    
+    def __init__(self, ttl_segundos: float):
+        self.ttl_segundos = ttl_segundos
+        
+        # Contadores para monitoreo (por proceso)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidaciones = 0
+        self.errores = 0
+    
+    @property
+    def habilitada(self) -> bool:
+        return self.ttl_segundos > 0
+    
+    async def obtener(self, clave: str) -> Optional[Any]:
+        """Retorna el valor guardado o None si no existe o expiró."""
+        raise NotImplementedError
+    
+    async def guardar(self, clave: str, valor: Any) -> None:
+        """Guarda un valor con el TTL configurado."""
+        raise NotImplementedError
+    
+    async def invalidar(self, claves: Iterable[str]) -> None:
+        """Elimina las claves indicadas (las inexistentes se ignoran)."""
+        raise NotImplementedError
+    
+    async def version(self, espacio: str) -> int:
+        """Versión actual de un espacio de claves (-1 si no se pudo leer)."""
+        raise NotImplementedError
+    
+    async def nueva_version(self, espacio: str) -> None:
+        """Invalida todas las claves de un espacio."""
+        raise NotImplementedError
+    
+    async def cerrar(self) -> None:
+        """Libera las conexiones del backend, si las hay."""
+    
+    def _registrar(self, valor: Optional[Any]) -> Optional[Any]:
+        if valor is None:
+            self.misses += 1
+            CONSULTAS_CACHE.labels("miss").inc()
+        else:
+            self.hits += 1
+            CONSULTAS_CACHE.labels("hit").inc()
+        return valor
+    
+    async def estadisticas(self) -> dict:
+        """Contadores de uso para monitoreo."""
+        consultas = self.hits + self.misses
+        return {
+            "backend": self.nombre,
+            "habilitada": self.habilitada,
+            "ttl_segundos": self.ttl_segundos,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidaciones": self.invalidaciones,
+            "errores": self.errores,
+            "hit_ratio": round(self.hits / consultas, 4) if consultas else 0.0,
+        }
+
+
+class CacheMemoria(CacheBackend):
+    """
+    Caché en memoria del proceso con límite de entradas (LRU) y
+    expiración por tiempo (TTL).
+    
+    Las entradas usadas hace más tiempo se descartan al superar
+    `max_entradas`. Cada worker tiene la suya: con varios workers usar
+    el backend redis para que las invalidaciones lleguen a todos.
+    """
+    
+    nombre = "memoria"
+    
+    def __init__(self, max_entradas: int, ttl_segundos: float):
+        super().__init__(ttl_segundos)
+        self.max_entradas = max_entradas
+        self._entradas: "OrderedDict[str, tuple]" = OrderedDict()
+        self._versiones = {}
+        self._lock = threading.Lock()
+    
+    @property
+    def habilitada(self) -> bool:
+        return self.max_entradas > 0 and self.ttl_segundos > 0
+    
+    async def obtener(self, clave: str) -> Optional[Any]:
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            
+            if entrada is not None and entrada[1] <= time.monotonic():
+                del self._entradas[clave]
+                entrada = None
+            
+            if entrada is not None:
+                self._entradas.move_to_end(clave)
+            
+            return self._registrar(entrada[0] if entrada else None)
+    
+    async def guardar(self, clave: str, valor: Any) -> None:
+        if not self.habilitada:
+            return
+        
+        with self._lock:
+            self._entradas[clave] = (valor, time.monotonic() + self.ttl_segundos)
+            self._entradas.move_to_end(clave)
+            
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+                self.evictions += 1
+                EVICTIONS_CACHE.inc()
+    
+    async def invalidar(self, claves: Iterable[str]) -> None:
+        with self._lock:
+            for clave in claves:
+                if self._entradas.pop(clave, None) is not None:
+                    self.invalidaciones += 1
+    
+    async def version(self, espacio: str) -> int:
+        return self._versiones.get(espacio, 0)
+    
+    async def nueva_version(self, espacio: str) -> None:
+        with self._lock:
+            self._versiones[espacio] = self._versiones.get(espacio, 0) + 1
+    
+    async def estadisticas(self) -> dict:
+        estadisticas = await super().estadisticas()
+        estadisticas["entradas"] = len(self._entradas)
+        estadisticas["max_entradas"] = self.max_entradas
+        return estadisticas
+
+
+class CacheRedis(CacheBackend):
+    """
+    Caché compartida entre workers sobre Redis (o un servidor compatible).
+    
+    Todos los procesos leen y escriben las mismas claves, así que una
+    invalidación hecha por cualquier worker la ven los demás. La
+    expiración y el límite de memoria los maneja el servidor.
+    
+    Si el servidor no responde la caché se comporta como vacía: las
+    consultas van a MongoDB y el fallo se cuenta en `errores`.
+    """
+    
+    nombre = "redis"
+    
+    def __init__(
+        self,
+        url: str,
+        ttl_segundos: float,
+        prefijo: str = "soytechno:",
+        cliente: Optional[Any] = None
+    ):
+        super().__init__(ttl_segundos)
+        self.prefijo = prefijo
+        
+        if cliente is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                raise RuntimeError(
+                    "CACHE_BACKEND=redis requiere el paquete redis (pip install redis)"
+                )
+            cliente = redis.from_url(url)
+        
+        # Cualquier cliente con la API asyncio de redis-py (get, set, delete, incr)
+        self.cliente = cliente
+    
+    def _clave(self, clave: str) -> str:
+        return f"{self.prefijo}{clave}"
+    
+    async def obtener(self, clave: str) -> Optional[Any]:
+        try:
+            guardado = await self.cliente.get(self._clave(clave))
+        except Exception as e:
+            self.errores += 1
+            print(f"⚠️ Error leyendo caché redis: {e}")
+            guardado = None
+        
+        return self._registrar(json.loads(guardado) if guardado is not None else None)
+    
+    async def guardar(self, clave: str, valor: Any) -> None:
+        if not self.habilitada:
+            return
+        
+        try:
+            await self.cliente.set(
+                self._clave(clave),
+                json.dumps(valor),
+                px=int(self.ttl_segundos * 1000)
+            )
+        except Exception as e:
+            self.errores += 1
+            print(f"⚠️ Error escribiendo caché redis: {e}")
+    
+    async def invalidar(self, claves: Iterable[str]) -> None:
+        claves = [self._clave(clave) for clave in claves]
+        if not claves:
+            return
+        
+        try:
+            self.invalidaciones += await self.cliente.delete(*claves)
+        except Exception as e:
+            self.errores += 1
+            print(f"⚠️ Error invalidando caché redis: {e}")
+    
+    async def version(self, espacio: str) -> int:
+        try:
+            version = await self.cliente.get(self._clave(f"version:{espacio}"))
+        except Exception as e:
+            self.errores += 1
+            print(f"⚠️ Error leyendo caché redis: {e}")
+            return -1
+        
+        return int(version) if version is not None else 0
+    
+    async def nueva_version(self, espacio: str) -> None:
+        try:
+            await self.cliente.incr(self._clave(f"version:{espacio}"))
+        except Exception as e:
+            self.errores += 1
+            print(f"⚠️ Error invalidando caché redis: {e}")
+    
+    async def cerrar(self) -> None:
+        await self.cliente.aclose()
+
+
+def clave_puntos(coleccion: str, cedula: str) -> str:
+    """Clave de la consulta de puntos de una cédula ("users" o "clientes")."""
+    return f"puntos:{coleccion}:{cedula}"
+
+
+async def clave_listado(cache: CacheBackend, nombre: str, *parametros) -> Optional[str]:
+    """
+    Clave de una página de listado con la versión vigente de los listados.
+    
+    Retorna None si no se pudo leer la versión (la página no se cachea).
+    """
+    version = await cache.version(ESPACIO_LISTADOS)
+    if version < 0:
+        return None
+    
+    return f"{ESPACIO_LISTADOS}:{version}:{nombre}:" + ":".join(str(p) for p in parametros)
+
+
+async def invalidar_cedulas(cache: CacheBackend, coleccion: str, cedulas: Iterable[str]) -> None:
+    """
+    Invalida las consultas de puntos de las cédulas modificadas y todas
+    las páginas de listados (el orden por puntos pudo cambiar).
+    """
+    await cache.invalidar(clave_puntos(coleccion, cedula) for cedula in cedulas)
+    await cache.nueva_version(ESPACIO_LISTADOS)
+
+
+@lru_cache()
+def get_cache_puntos() -> CacheBackend:
+    """
+    Caché compartida de las consultas de puntos y listados, según
+    CACHE_BACKEND ("memoria" o "redis").
+    """
+    settings = get_settings()
+    
+    if settings.cache_backend == "redis":
+        return CacheRedis(settings.redis_url, settings.cache_ttl_segundos)
+    
+    return CacheMemoria(settings.cache_max_entradas, settings.cache_ttl_segundos)
@@ -0,0 +1,254 @@
+"""
+Reglas del sistema de puntos (TechnoBits), compartidas por users y clientes.
+
+- $1 gastado = 1 punto; 50 puntos = $1 canjeable
+- Mínimo 500 puntos para canje, en múltiplos de 500
+- Los puntos vencen con cada período de 365 días desde la suscripción
+- Niveles por compras o monto gastado (ver calcular_nivel)
+
+Además de las funciones para un miembro, calcular_lote aplica las mismas
+reglas a muchos miembros a la vez con arrays de NumPy: las transacciones
+de todos llegan juntas, con el índice de su miembro, y se agregan con
+bincount en lugar de recorrerlas en Python.
+"""
+
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from app.models.user import NivelFidelizacion
+
+
+UMBRAL_CANJE = 500
+PUNTOS_POR_DOLAR = 50
+DIAS_PERIODO = 365
+
+# (nivel, compras mínimas, gastado mínimo), de mayor a menor
+NIVELES = [
+    ("TeraBytes", 13, 3000),
+    ("GigaBytes", 8, 1500),
+    ("MegaBytes", 3, 500),
+]
+NIVEL_BASE = "Kilobytes"
+
+_PERIODO = np.timedelta64(DIAS_PERIODO, "D")
+
+# Las mismas reglas de nivel y canje como pipeline de actualización, para
+# recalcular en el servidor después de un $inc de los totales
+PIPELINE_DERIVADOS = [
+    {
+        "$set": {
+            "nivel": {
+                "$switch": {
+                    "branches": [
+                        {
+                            "case": {"$or": [
+                                {"$gte": ["$total_gastado", gastado_minimo]},
+                                {"$gte": ["$compras_totales", compras_minimas]},
+                            ]},
+                            "then": nivel,
+                        }
+                        for nivel, compras_minimas, gastado_minimo in NIVELES
+                    ],
+                    "default": NIVEL_BASE,
+                }
+            },
+            # Con vigentes negativos (filas con monto negativo) queda en 0
+            "puntos_listos_canje": {
+                "$max": [0, {"$toInt": {"$multiply": [
+                    {"$floor": {"$divide": ["$puntos_vigentes", UMBRAL_CANJE]}}, UMBRAL_CANJE
+                ]}}]
+            },
+        }
+    },
+    {"$set": {"dolares_canjeables": {"$divide": ["$puntos_listos_canje", PUNTOS_POR_DOLAR]}}},
+]
+
+
+def calcular_nivel(compras_totales: int, total_gastado: float) -> NivelFidelizacion:
+    """
+    Calcula el nivel de fidelización según las reglas:
+    - Kilobytes: Sin historial de compra
+    - MegaBytes: ≥3 compras o ≥$500 gastado
+    - GigaBytes: ≥8 compras o ≥$1500 gastado
+    - TeraBytes: ≥13 compras o ≥$3000 gastado
+    """
+    for nivel, compras_minimas, gastado_minimo in NIVELES:
+        if compras_totales >= compras_minimas or total_gastado >= gastado_minimo:
+            return nivel
+    
+    return NIVEL_BASE
+
+
+def calcular_periodo(
+    fecha_suscripcion: datetime,
+    ahora: Optional[datetime] = None
+) -> Tuple[datetime, datetime]:
+    """
+    Calcula el período vigente actual a partir de la fecha de suscripción.
+    
+    Returns:
+        Tuple[inicio_periodo, fin_periodo]
+    """
+    ahora = ahora or datetime.now()
+    
+    años_transcurridos = (ahora - fecha_suscripcion).days // DIAS_PERIODO
+    inicio_periodo = fecha_suscripcion + timedelta(days=DIAS_PERIODO * años_transcurridos)
+    fin_periodo = inicio_periodo + timedelta(days=DIAS_PERIODO)
+    
+    return inicio_periodo, fin_periodo
+
+
+def calcular_puntos_vigentes(
+    movimientos: Iterable[Tuple[datetime, int]],
+    fecha_suscripcion: datetime,
+    ahora: Optional[datetime] = None
+) -> int:
+    """Suma los puntos de los movimientos (fecha, puntos) del período vigente."""
+    inicio_periodo, fin_periodo = calcular_periodo(fecha_suscripcion, ahora)
+    
+    return sum(puntos for fecha, puntos in movimientos if inicio_periodo <= fecha < fin_periodo)
+
+
+def calcular_puntos_canje(puntos_vigentes: int) -> Tuple[int, float]:
+    """
+    Calcula puntos listos para canje y su equivalente en dólares.
+    
+    Returns:
+        Tuple[puntos_listos_canje, dolares_canjeables]
+    """
+    if puntos_vigentes < UMBRAL_CANJE:
+        return 0, 0.0
+    
+    puntos_listos = (puntos_vigentes // UMBRAL_CANJE) * UMBRAL_CANJE
+    
+    return puntos_listos, puntos_listos / PUNTOS_POR_DOLAR
+
+
+def agrupar(cedulas: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Asigna a cada transacción el índice de su miembro.
+    
+    Returns:
+        Tuple[índice de miembro por transacción, cédulas únicas en orden de aparición]
+    """
+    miembro, unicas = pd.factorize(np.asarray(cedulas, dtype=object))
+    return miembro, np.asarray(unicas, dtype=object)
+
+
+def calcular_periodos(
+    fechas_suscripcion: np.ndarray,
+    ahora: Optional[datetime] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Versión vectorizada de calcular_periodo (arrays datetime64)."""
+    ahora = np.datetime64(ahora or datetime.now(), "us")
+    fechas_suscripcion = fechas_suscripcion.astype("datetime64[us]")
+    
+    # Días completos transcurridos, redondeando hacia abajo como timedelta.days
+    dias = (ahora - fechas_suscripcion) // np.timedelta64(1, "D")
+    inicio = fechas_suscripcion + (dias // DIAS_PERIODO) * _PERIODO
+    
+    return inicio, inicio + _PERIODO
+
+
+def calcular_canje(puntos_vigentes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Versión vectorizada de calcular_puntos_canje."""
+    puntos_listos = np.where(
+        puntos_vigentes >= UMBRAL_CANJE, (puntos_vigentes // UMBRAL_CANJE) * UMBRAL_CANJE, 0
+    )
+    return puntos_listos, puntos_listos / PUNTOS_POR_DOLAR
+
+
+def calcular_niveles(compras_totales: np.ndarray, total_gastado: np.ndarray) -> np.ndarray:
+    """Versión vectorizada de calcular_nivel."""
+    return np.select(
+        [(compras_totales >= compras) | (total_gastado >= gastado) for _, compras, gastado in NIVELES],
+        [nivel for nivel, _, _ in NIVELES],
+        default=NIVEL_BASE
+    )
+
+
+def calcular_lote(
+    miembro: np.ndarray,
+    fechas: np.ndarray,
+    puntos: np.ndarray,
+    montos: np.ndarray,
+    n_miembros: int,
+    fechas_suscripcion: Optional[np.ndarray] = None,
+    ahora: Optional[datetime] = None
+) -> Dict[str, np.ndarray]:
+    """
+    Calcula totales, período, puntos vigentes, canje y nivel de muchos
+    miembros a la vez.
+    
+    Args:
+        miembro: Índice (0..n_miembros-1) del miembro de cada transacción
+        fechas, puntos, montos: Datos de cada transacción
+        n_miembros: Cantidad de miembros (puede haber miembros sin transacciones)
+        fechas_suscripcion: Fecha de suscripción por miembro; NaT (o sin
+            array) usa la primera transacción, o `ahora` si no tiene
+        ahora: Fecha de referencia del período vigente
+    
+    Returns:
+        Arrays por miembro: compras_totales, total_gastado, puntos_totales,
+        fecha_suscripcion, inicio_periodo, fin_periodo, puntos_vigentes,
+        puntos_listos_canje, dolares_canjeables, nivel
+    """
+    ahora = ahora or datetime.now()
+    miembro = np.asarray(miembro, dtype=np.intp)
+    fechas = np.asarray(fechas, dtype="datetime64[us]")
+    puntos = np.asarray(puntos, dtype=np.int64)
+    montos = np.asarray(montos, dtype=np.float64)
+    
+    compras_totales = np.bincount(miembro, minlength=n_miembros)
+    total_gastado = np.bincount(miembro, weights=montos, minlength=n_miembros)
+    puntos_totales = np.bincount(miembro, weights=puntos, minlength=n_miembros).astype(np.int64)
+    
+    # Suscripción: la guardada o la primera transacción del miembro
+    if fechas_suscripcion is None:
+        fechas_suscripcion = np.full(n_miembros, np.datetime64("NaT", "us"))
+    fechas_suscripcion = np.asarray(fechas_suscripcion, dtype="datetime64[us]").copy()
+    
+    sin_fecha = np.isnat(fechas_suscripcion)
+    if sin_fecha.any():
+        primera = np.full(n_miembros, np.datetime64("NaT", "us"))
+        primera[np.unique(miembro)] = np.datetime64(datetime.max, "us")
+        np.minimum.at(primera, miembro, fechas)
+        fechas_suscripcion[sin_fecha] = primera[sin_fecha]
+        # Sin suscripción guardada ni transacciones: desde hoy
+        fechas_suscripcion[np.isnat(fechas_suscripcion)] = np.datetime64(ahora, "us")
+    
+    inicio_periodo, fin_periodo = calcular_periodos(fechas_suscripcion, ahora)
+    
+    # Puntos de las transacciones dentro del período de su miembro
+    en_periodo = (fechas >= inicio_periodo[miembro]) & (fechas < fin_periodo[miembro])
+    puntos_vigentes = np.bincount(
+        miembro, weights=np.where(en_periodo, puntos, 0), minlength=n_miembros
+    ).astype(np.int64)
+    
+    puntos_listos_canje, dolares_canjeables = calcular_canje(puntos_vigentes)
+    
+    return {
+        "compras_totales": compras_totales,
+        "total_gastado": total_gastado,
+        "puntos_totales": puntos_totales,
+        "fecha_suscripcion": fechas_suscripcion,
+        "inicio_periodo": inicio_periodo,
+        "fin_periodo": fin_periodo,
+        "puntos_vigentes": puntos_vigentes,
+        "puntos_listos_canje": puntos_listos_canje,
+        "dolares_canjeables": dolares_canjeables,
+        "nivel": calcular_niveles(compras_totales, total_gastado),
+    }
+
+
+def a_documentos(resultado: Dict[str, np.ndarray]) -> List[dict]:
+    """Convierte el resultado de calcular_lote a un dict por miembro con tipos de Python."""
+    columnas = {}
+    for campo, valores in resultado.items():
+        if np.issubdtype(valores.dtype, np.datetime64):
+            columnas[campo] = valores.astype("datetime64[us]").astype(object).tolist()
+        else:
+            columnas[campo] = valores.tolist()
+    
+    return [dict(zip(columnas, fila)) for fila in zip(*columnas.values())]
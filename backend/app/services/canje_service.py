@@ -0,0 +1,226 @@
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne, DeleteOne
+from pymongo.errors import BulkWriteError
+from app.services.calculo_puntos import UMBRAL_CANJE
+from app.services.paginacion import decodificar_cursor, filtro_keyset, cortar_pagina
+
+
+# Campos copiados desde users/clientes (los de UserPuntosResponse)
+CAMPOS_CANJE = [
+    "cedula",
+    "nombre",
+    "nivel",
+    "puntos_totales",
+    "puntos_vigentes",
+    "puntos_listos_canje",
+    "dolares_canjeables",
+]
+PROYECCION_CANJE = {"_id": 0, **{campo: 1 for campo in CAMPOS_CANJE}}
+
+
+class CanjeService:
+    """
+    Vista materializada de los miembros listos para canje.
+    
+    La colección canje_ready guarda una copia de los campos de puntos de
+    cada usuario/cliente con al menos UMBRAL_CANJE puntos vigentes, con
+    `origen` = "users" o "clientes". Se sincroniza después de cada
+    escritura de puntos: entra quien supera el umbral y sale quien baja
+    de él. El total de cada origen se mantiene en la colección contadores.
+    
+    La vista se construye con `python manage.py reconstruir-canje` (en el
+    despliegue, con --si-falta). Mientras no existe el contador del origen
+    no se sincroniza nada (la construcción toma a todos desde cero) y los
+    listados consultan `origen` directamente.
+    """
+    
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+    
+    @staticmethod
+    def _id_contador(origen: str) -> str:
+        return f"canje_ready:{origen}"
+    
+    async def sincronizar(self, origen: str, cedulas: Iterable[str]) -> dict:
+        """
+        Actualiza canje_ready para las cédulas indicadas a partir de su
+        documento actual en `origen`.
+        
+        Returns:
+            Estadísticas: agregados, eliminados, actualizados
+        """
+        cedulas = list(cedulas)
+        stats = {"agregados": 0, "eliminados": 0, "actualizados": 0}
+        if not cedulas:
+            return stats
+        
+        # Vista sin construir: un contador creado aquí contaría solo estas
+        # cédulas y dejaría fuera a los que ya superaban el umbral
+        if not await self.construida(origen):
+            return stats
+        
+        actuales = {}
+        async for doc in self.db[origen].find({"cedula": {"$in": cedulas}}, PROYECCION_CANJE):
+            actuales[doc["cedula"]] = doc
+        
+        ahora = datetime.now()
+        operaciones = []
+        for cedula in cedulas:
+            doc = actuales.get(cedula)
+            filtro = {"origen": origen, "cedula": cedula}
+            
+            if doc and doc.get("puntos_vigentes", 0) >= UMBRAL_CANJE:
+                operaciones.append(UpdateOne(
+                    filtro,
+                    {"$set": {**doc, "origen": origen, "actualizado": ahora}},
+                    upsert=True
+                ))
+            else:
+                operaciones.append(DeleteOne(filtro))
+        
+        try:
+            resultado = await self.db.canje_ready.bulk_write(operaciones, ordered=False)
+            detalles = resultado.bulk_api_result
+        except BulkWriteError as e:
+            # Las operaciones aplicadas igual cuentan para el total
+            detalles = e.details
+            print(f"⚠️ Error sincronizando canje_ready ({origen}): {e.details.get('writeErrors', [])[:1]}")
+        
+        stats["agregados"] = len(detalles.get("upserted", []))
+        stats["eliminados"] = detalles.get("nRemoved", 0)
+        stats["actualizados"] = detalles.get("nMatched", 0)
+        
+        # Solo las altas y bajas efectivas mueven el contador
+        if stats["agregados"] or stats["eliminados"]:
+            await self.db.contadores.update_one(
+                {"_id": self._id_contador(origen)},
+                {"$inc": {"total": stats["agregados"] - stats["eliminados"]}}
+            )
+        
+        return stats
+    
+    async def reconstruir(self, origen: str, batch_size: int = 1000) -> dict:
+        """
+        Regenera canje_ready y su contador para un origen desde cero.
+        
+        Returns:
+            Estadísticas: miembros, lotes, total
+        """
+        await self.db.canje_ready.delete_many({"origen": origen})
+        # Desde aquí las cargas concurrentes también sincronizan; el total
+        # se recalcula al final
+        await self.db.contadores.update_one(
+            {"_id": self._id_contador(origen)},
+            {"$setOnInsert": {"total": 0}},
+            upsert=True
+        )
+        
+        ahora = datetime.now()
+        miembros = 0
+        lotes = 0
+        lote = []
+        
+        cursor = self.db[origen].find(
+            {"puntos_vigentes": {"$gte": UMBRAL_CANJE}},
+            PROYECCION_CANJE
+        ).batch_size(batch_size)
+        
+        async for doc in cursor:
+            lote.append({**doc, "origen": origen, "actualizado": ahora})
+            
+            if len(lote) >= batch_size:
+                miembros += await self._insertar_lote(lote)
+                lotes += 1
+                lote = []
+        
+        if lote:
+            miembros += await self._insertar_lote(lote)
+            lotes += 1
+        
+        total = await self.db.canje_ready.count_documents({"origen": origen})
+        await self.db.contadores.update_one(
+            {"_id": self._id_contador(origen)},
+            {"$set": {"total": total}},
+            upsert=True
+        )
+        
+        return {"miembros": miembros, "lotes": lotes, "total": total}
+    
+    async def _insertar_lote(self, lote: List[dict]) -> int:
+        """Inserta un lote ignorando las cédulas que ya estaban (índice único)."""
+        try:
+            resultado = await self.db.canje_ready.insert_many(lote, ordered=False)
+            return len(resultado.inserted_ids)
+        except BulkWriteError as e:
+            return e.details.get("nInserted", 0)
+    
+    async def construida(self, origen: str) -> bool:
+        """True si la vista del origen ya se construyó (existe su contador)."""
+        return await self.db.contadores.find_one(
+            {"_id": self._id_contador(origen)}, {"_id": 1}
+        ) is not None
+    
+    async def total(self, origen: str) -> Optional[int]:
+        """
+        Total de miembros listos para canje de un origen, leído del contador
+        (None si la vista no se construyó).
+        """
+        contador = await self.db.contadores.find_one({"_id": self._id_contador(origen)})
+        
+        return contador["total"] if contador else None
+    
+    async def verificar_al_iniciar(self) -> None:
+        """Avisa al iniciar si falta construir la vista de algún origen."""
+        for origen in ("users", "clientes"):
+            if not await self.construida(origen):
+                print(f"⚠️  Vista canje_ready ({origen}) sin construir: los listados consultan {origen} directamente")
+                print("⚠️  Ejecute: python manage.py reconstruir-canje --si-falta")
+    
+    async def listar(
+        self,
+        origen: str,
+        page: int = 1,
+        limit: int = 10,
+        after: Optional[str] = None,
+        incluir_total: bool = True
+    ) -> Tuple[List[dict], Optional[int], Optional[str]]:
+        """
+        Página de miembros listos para canje, de mayor a menor puntaje.
+        
+        Si la vista no se construyó, la página se lee de `origen` con el
+        mismo filtro y orden (sin la consulta cubierta): el resultado es el
+        mismo, más lento.
+        
+        Returns:
+            Tuple[documentos, total (None si incluir_total es False), cursor_siguiente]
+        
+        Raises:
+            ValueError: si el cursor no es válido
+        """
+        total = await self.total(origen)
+        
+        if total is None:
+            coleccion = self.db[origen]
+            filtro = {"puntos_vigentes": {"$gte": UMBRAL_CANJE}}
+            if incluir_total:
+                total = await coleccion.count_documents(filtro)
+        else:
+            coleccion = self.db.canje_ready
+            filtro = {"origen": origen}
+        
+        orden = [("puntos_vigentes", -1), ("cedula", 1)]
+        if after:
+            filtro.update(filtro_keyset(orden, decodificar_cursor(after, len(orden))))
+            cursor = coleccion.find(filtro, PROYECCION_CANJE).sort(orden).limit(limit + 1)
+        else:
+            cursor = coleccion.find(filtro, PROYECCION_CANJE).sort(orden).skip(
+                (page - 1) * limit
+            ).limit(limit + 1)
+        
+        documentos, siguiente = cortar_pagina(
+            await cursor.to_list(length=limit + 1), limit, orden
+        )
+        
+        return documentos, total if incluir_total else None, siguiente
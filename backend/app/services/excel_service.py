@@ -1,241 +1,407 @@
-import pandas as pd
+import os
+import time
+import shutil
+import zipfile
+import tempfile
 from io import BytesIO
+from contextlib import aclosing
 from datetime import datetime
-from typing import List, Tuple
+from typing import List, Tuple, Optional, Set, Dict, Union, BinaryIO, Callable, Awaitable, AsyncIterator
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from starlette.concurrency import run_in_threadpool
+from app.config import get_settings
+from app.metricas import registrar_carga
+from app.models import UploadResponse, ResultadoArchivo
+from app.services.lector_transacciones import (
+    LectorTransacciones,
+    Fuente,
+    EventoLectura,
+    leer_fuentes,
+    leer_en_proceso,
+)
+from app.services.staging import staging_habilitado
 from app.services.puntos_service import PuntosService
 from app.services.user_service import UserService
 
 
-class ExcelService:
+class ExcelService(LectorTransacciones):
     """Servicio para procesar archivos Excel/CSV de transacciones."""
     
-    # Mapeo de columnas esperadas
-    COLUMNAS_ESPERADAS = [
-        "Tienda",
-        "Marca", 
-        "Fecha",
-        "Canal de Venta",
-        "Cedula",
-        "Nombre o Razon Social",
-        "Telefono",
-        "Correo Electronico",
-        "Articulo",
-        "Descripcion Articulo",
-        "Cantidad",
-        "Divisas de Venta",
-        "Categoria",
-        "Numero",
-    ]
-    
     def __init__(self, db: AsyncIOMotorDatabase):
         self.db = db
         self.puntos_service = PuntosService(db)
         self.user_service = UserService(db)
     
-    def _normalizar_columnas(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Normaliza los nombres de columnas del DataFrame."""
-        # Crear mapeo de nombres normalizados
-        mapeo = {}
-        for col in df.columns:
-            col_normalizado = col.strip().lower()
+    # Archivos que se leen dentro de un .zip
+    EXTENSIONES_ZIP = (".csv", ".xlsx", ".xls")
+    
+    async def _escribir_lote(
+        self,
+        lote: List[Tuple[int, dict]],
+        usuarios_actualizados: Set[str],
+        clientes_actualizados: Dict[str, dict],
+        errores: List[str]
+    ) -> Tuple[int, int, int]:
+        """
+        Inserta un lote de transacciones con insert_many y actualiza sus
+        usuarios con un único bulk_write.
+        
+        Las transacciones ya cargadas (misma clave natural) las rechaza el
+        índice único de `clave`; se omiten sin contarlas como error.
+        
+        Args:
+            lote: Pares (número de fila, documento de transacción)
             
-            if "tienda" in col_normalizado:
-                mapeo[col] = "tienda"
-            elif "marca" in col_normalizado:
-                mapeo[col] = "marca"
-            elif "fecha" in col_normalizado:
-                mapeo[col] = "fecha"
-            elif "canal" in col_normalizado:
-                mapeo[col] = "canal_venta"
-            elif "cedula" in col_normalizado or "cédula" in col_normalizado:
-                mapeo[col] = "cedula"
-            elif "nombre" in col_normalizado or "razon" in col_normalizado:
-                mapeo[col] = "nombre_razon_social"
-            elif "telefono" in col_normalizado or "teléfono" in col_normalizado:
-                mapeo[col] = "telefono"
-            elif "correo" in col_normalizado or "email" in col_normalizado:
-                mapeo[col] = "correo_electronico"
-            elif "articulo" in col_normalizado and "descripcion" not in col_normalizado:
-                mapeo[col] = "articulo"
-            elif "descripcion" in col_normalizado:
-                mapeo[col] = "descripcion_articulo"
-            elif "cantidad" in col_normalizado:
-                mapeo[col] = "cantidad"
-            elif "divisa" in col_normalizado or "venta" in col_normalizado:
-                mapeo[col] = "divisas_venta"
-            elif "categoria" in col_normalizado or "categoría" in col_normalizado:
-                mapeo[col] = "categoria"
-            elif "numero" in col_normalizado or "número" in col_normalizado:
-                mapeo[col] = "numero"
-        
-        return df.rename(columns=mapeo)
+        Returns:
+            Tuple[transacciones insertadas, duplicadas omitidas, errores de
+            escritura (inserción o usuarios, sin contar los duplicados)]
+        """
+        documentos = [transaccion for _, transaccion in lote]
+        fallidas = set()
+        duplicadas = 0
+        errores_escritura = 0
+        
+        try:
+            await self.db.transacciones.insert_many(documentos, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                fallidas.add(error["index"])
+                if error.get("code") == 11000:
+                    duplicadas += 1
+                else:
+                    errores_escritura += 1
+                    errores.append(f"Fila {lote[error['index']][0]}: {error.get('errmsg')}")
+        
+        insertadas = [doc for i, doc in enumerate(documentos) if i not in fallidas]
+        
+        cedulas, errores_usuarios = await self.user_service.agregar_transacciones_a_usuarios(insertadas)
+        usuarios_actualizados.update(cedulas)
+        errores.extend(errores_usuarios)
+        errores_escritura += len(errores_usuarios)
+        
+        # Marcar clientes para actualizar (compatibilidad); los datos de
+        # contacto de la última fila prevalecen
+        for tx in insertadas:
+            clientes_actualizados[tx["cedula"]] = {
+                "nombre": tx["nombre_razon_social"],
+                "telefono": tx["telefono"],
+                "correo": tx["correo_electronico"],
+            }
+        
+        return len(insertadas), duplicadas, errores_escritura
     
-    def _limpiar_cedula(self, cedula) -> str:
-        """Limpia y normaliza el formato de cédula."""
-        if pd.isna(cedula):
-            return ""
+    def _copiar_temporal(self, contenido: BinaryIO, nombre_archivo: str) -> str:
+        """Copia el contenido a un archivo temporal que otro proceso pueda abrir."""
+        extension = os.path.splitext(nombre_archivo)[1]
         
-        cedula_str = str(cedula).strip()
-        # Remover caracteres no deseados pero mantener V-, E-, J-, etc.
-        cedula_str = cedula_str.replace(" ", "").replace(".", "")
+        try:
+            with tempfile.NamedTemporaryFile(delete=False, suffix=extension) as destino:
+                shutil.copyfileobj(contenido, destino, 1024 * 1024)
+                return destino.name
+        finally:
+            contenido.seek(0)
+    
+    def _extraer_zip(self, contenido: BinaryIO, nombre_archivo: str) -> List[Tuple[str, str]]:
+        """
+        Extrae los archivos de transacciones (.csv, .xlsx, .xls) de un .zip
+        a archivos temporales.
         
-        return cedula_str
+        Returns:
+            Pares (ruta temporal, "nombre.zip/entrada")
+        """
+        extraidos = []
+        
+        try:
+            with zipfile.ZipFile(contenido) as archivo_zip:
+                for entrada in archivo_zip.infolist():
+                    base = os.path.basename(entrada.filename)
+                    
+                    # Carpetas, metadatos de macOS y archivos ocultos
+                    if entrada.is_dir() or base.startswith(".") or entrada.filename.startswith("__MACOSX/"):
+                        continue
+                    if not base.lower().endswith(self.EXTENSIONES_ZIP):
+                        continue
+                    
+                    with archivo_zip.open(entrada) as origen, tempfile.NamedTemporaryFile(
+                        delete=False, suffix=os.path.splitext(base)[1]
+                    ) as destino:
+                        extraidos.append((destino.name, f"{nombre_archivo}/{entrada.filename}"))
+                        shutil.copyfileobj(origen, destino, 1024 * 1024)
+        except Exception:
+            for ruta, _ in extraidos:
+                os.remove(ruta)
+            raise
+        
+        return extraidos
     
-    def _parsear_fecha(self, fecha) -> datetime:
-        """Parsea diferentes formatos de fecha."""
-        if pd.isna(fecha):
-            return datetime.now()
-        
-        if isinstance(fecha, datetime):
-            return fecha
-        
-        if isinstance(fecha, pd.Timestamp):
-            return fecha.to_pydatetime()
-        
-        # Intentar parsear string
-        fecha_str = str(fecha).strip()
-        formatos = [
-            "%Y-%m-%d",
-            "%d/%m/%Y",
-            "%d-%m-%Y",
-            "%Y/%m/%d",
-            "%d/%m/%y",
-            "%m/%d/%Y",
-        ]
+    @staticmethod
+    def _con_archivo(funcion: Callable, origen: Union[str, BinaryIO], *args):
+        """Aplica funcion(archivo, *args) a una ruta o a un archivo ya abierto."""
+        if isinstance(origen, str):
+            with open(origen, "rb") as contenido:
+                return funcion(contenido, *args)
+        return funcion(origen, *args)
+    
+    async def _eventos(self, fuentes: List[Fuente], batch_size: int) -> AsyncIterator[EventoLectura]:
+        """
+        Lotes normalizados (o errores) de todas las fuentes de una carga.
         
-        for fmt in formatos:
-            try:
-                return datetime.strptime(fecha_str, fmt)
-            except ValueError:
-                continue
+        Con UPLOAD_PROCESOS > 0 la lectura (pandas/openpyxl, limitada por
+        CPU) corre en el pool de procesos, varias fuentes a la vez, y no
+        bloquea el event loop; las fuentes deben ser rutas. Con 0 se leen
+        una tras otra en este proceso.
+        """
+        if not get_settings().upload_procesos:
+            for evento in leer_fuentes(fuentes, batch_size):
+                yield evento
+            return
         
-        return datetime.now()
+        async with aclosing(leer_en_proceso(fuentes, batch_size)) as eventos:
+            async for evento in eventos:
+                yield evento
     
-    async def procesar_archivo(
+    async def procesar_archivos(
         self,
-        contenido: bytes,
-        nombre_archivo: str
-    ) -> Tuple[int, int, int, List[str]]:
+        archivos: List[Tuple[Union[bytes, BinaryIO], str]],
+        batch_size: Optional[int] = None,
+        progreso: Optional[Callable[[int, int], Awaitable[None]]] = None
+    ) -> UploadResponse:
         """
-        Procesa un archivo Excel o CSV de transacciones.
+        Procesa uno o varios archivos Excel/CSV de transacciones (o .zip
+        con ellos), con todas las hojas de cada libro.
+        
+        Cada archivo/hoja se lee por bloques de `batch_size` filas en el
+        pool de procesos, varios a la vez; los lotes de todos llegan a una
+        sola secuencia que se inserta con insert_many, y sus usuarios se
+        actualizan con un bulk_write. La memoria depende del tamaño del
+        lote y no de los archivos.
+        
+        Volver a cargar un archivo es seguro: si su contenido ya se procesó
+        completo (colección cargas) no se lee, y las filas repetidas (en
+        archivos que se solapan o en la misma carga) se omiten por su clave
+        natural.
+        
+        Con STAGING_DIR, cada archivo/hoja leído completo queda también en
+        staging (parquet por mes) para manage.py replay.
         
         Args:
-            contenido: Bytes del archivo
-            nombre_archivo: Nombre del archivo para detectar formato
-            
+            archivos: Pares (bytes o archivo binario, nombre del archivo)
+            batch_size: Filas por lote (default: settings.upload_batch_size)
+            progreso: Callback opcional (filas_leidas, filas_fallidas) tras cada lote
+        
         Returns:
-            Tuple[registros_procesados, clientes_actualizados, usuarios_actualizados, errores]
+            UploadResponse con los totales y el resultado de cada archivo
         """
+        inicio = time.perf_counter()
+        batch_size = batch_size or get_settings().upload_batch_size
+        usar_procesos = bool(get_settings().upload_procesos)
+        
         errores = []
-        registros_procesados = 0
-        clientes_actualizados = set()
+        resultados: List[ResultadoArchivo] = []
+        hashes: Dict[int, str] = {}  # índice en resultados -> hash del contenido
+        incompletos: Set[int] = set()  # archivos con alguna hoja o lote que no se pudo leer o escribir
+        fuentes: List[Fuente] = []
+        origen_fuente: List[Tuple[int, Optional[str]]] = []  # fuente -> (archivo, hoja)
+        temporales = []
+        
+        filas_leidas = 0
+        clientes_actualizados = {}
         usuarios_actualizados = set()
         
         try:
-            # Leer archivo según extensión
-            if nombre_archivo.lower().endswith(".csv"):
-                df = pd.read_csv(BytesIO(contenido), encoding="utf-8")
-            else:
-                df = pd.read_excel(BytesIO(contenido))
-            
-            # Normalizar columnas
-            df = self._normalizar_columnas(df)
-            
-            # Verificar columnas requeridas
-            columnas_requeridas = ["cedula", "nombre_razon_social", "divisas_venta", "fecha"]
-            columnas_faltantes = [col for col in columnas_requeridas if col not in df.columns]
-            
-            if columnas_faltantes:
-                errores.append(f"Columnas faltantes: {', '.join(columnas_faltantes)}")
-                return 0, 0, 0, errores
+            # Archivos sueltos y contenido de los .zip
+            entradas = []
+            for contenido, nombre_archivo in archivos:
+                if isinstance(contenido, bytes):
+                    contenido = BytesIO(contenido)
+                
+                if nombre_archivo.lower().endswith(".zip"):
+                    extraidos = await run_in_threadpool(self._extraer_zip, contenido, nombre_archivo)
+                    temporales.extend(ruta for ruta, _ in extraidos)
+                    entradas.extend(extraidos)
+                else:
+                    entradas.append((contenido, nombre_archivo))
             
-            # Procesar cada fila
-            for idx, row in df.iterrows():
+            for origen, nombre_archivo in entradas:
+                indice = len(resultados)
+                resultado = ResultadoArchivo(nombre_archivo=nombre_archivo)
+                resultados.append(resultado)
+                
+                if usar_procesos and not isinstance(origen, str):
+                    # Los procesos lectores abren el archivo por ruta
+                    ruta = getattr(origen, "name", None)
+                    if isinstance(ruta, str) and os.path.isfile(ruta):
+                        origen = ruta
+                    else:
+                        origen = await run_in_threadpool(self._copiar_temporal, origen, nombre_archivo)
+                        temporales.append(origen)
+                
+                hash_archivo = await run_in_threadpool(self._con_archivo, self.hash_archivo, origen)
+                carga = await self.db.cargas.find_one({"_id": hash_archivo})
+                
+                if carga:
+                    resultado.repetido = True
+                    resultado.duplicados_omitidos = carga["registros_procesados"] + carga["duplicados_omitidos"]
+                    resultado.errores.append(
+                        f"Archivo ya cargado el {carga['cargado']:%d/%m/%Y %H:%M} "
+                        f"({carga['nombre_archivo']}): no se procesó de nuevo"
+                    )
+                    continue
+                
+                if hash_archivo in hashes.values():
+                    resultado.repetido = True
+                    resultado.errores.append("Mismo contenido que otro archivo de esta carga: no se procesó")
+                    continue
+                
+                hashes[indice] = hash_archivo
+                
                 try:
-                    cedula = self._limpiar_cedula(row.get("cedula"))
+                    hojas = await run_in_threadpool(
+                        self._con_archivo, self.listar_hojas, origen, nombre_archivo
+                    )
+                except Exception as e:
+                    resultado.errores.append(f"Error procesando archivo: {str(e)}")
+                    incompletos.add(indice)
+                    continue
+                
+                resultado.hojas = len(hojas)
+                for numero, hoja in enumerate(hojas):
+                    staging = f"{hash_archivo}-{numero}" if staging_habilitado() else None
+                    fuentes.append((origen, nombre_archivo, hoja, staging))
+                    origen_fuente.append((indice, hoja))
+            
+            async with aclosing(self._eventos(fuentes, batch_size)) as eventos:
+                async for indice_fuente, lote, error in eventos:
+                    indice, hoja = origen_fuente[indice_fuente]
+                    resultado = resultados[indice]
+                    prefijo = f"Hoja {hoja}: " if resultado.hojas > 1 else ""
                     
-                    if not cedula:
-                        errores.append(f"Fila {idx + 2}: Cédula vacía o inválida")
+                    if error:
+                        resultado.errores.append(prefijo + error)
+                        incompletos.add(indice)
                         continue
                     
-                    # Parsear valores
-                    divisas_venta = float(row.get("divisas_venta", 0) or 0)
-                    cantidad = int(row.get("cantidad", 1) or 1)
-                    fecha = self._parsear_fecha(row.get("fecha"))
+                    filas_bloque, filas, errores_lote = lote
                     
-                    # Calcular puntos: $1 = 1 punto
-                    puntos_generados = int(divisas_venta)
-                    
-                    nombre = str(row.get("nombre_razon_social", "") or "")
-                    telefono = str(row.get("telefono", "") or "") if pd.notna(row.get("telefono")) else None
-                    correo = str(row.get("correo_electronico", "") or "") if pd.notna(row.get("correo_electronico")) else None
-                    tienda = str(row.get("tienda", "") or "")
-                    articulo = str(row.get("articulo", "") or "")
-                    
-                    # Crear documento de transacción
-                    transaccion = {
-                        "tienda": tienda,
-                        "marca": str(row.get("marca", "") or ""),
-                        "fecha": fecha,
-                        "canal_venta": str(row.get("canal_venta", "") or ""),
-                        "cedula": cedula,
-                        "nombre_razon_social": nombre,
-                        "telefono": telefono,
-                        "correo_electronico": correo,
-                        "articulo": articulo,
-                        "descripcion_articulo": str(row.get("descripcion_articulo", "") or ""),
-                        "cantidad": cantidad,
-                        "divisas_venta": divisas_venta,
-                        "categoria": str(row.get("categoria", "") or ""),
-                        "numero": str(row.get("numero", "") or ""),
-                        "puntos_generados": puntos_generados,
-                    }
-                    
-                    # Insertar transacción y obtener ID
-                    result = await self.db.transacciones.insert_one(transaccion)
-                    transaccion_id = str(result.inserted_id)
-                    registros_procesados += 1
-                    
-                    # Actualizar usuario con la transacción
-                    try:
-                        await self.user_service.agregar_transaccion_a_usuario(
-                            cedula=cedula,
-                            nombre=nombre,
-                            telefono=telefono,
-                            correo=correo,
-                            transaccion_id=transaccion_id,
-                            fecha=fecha,
-                            tienda=tienda,
-                            articulo=articulo,
-                            cantidad=cantidad,
-                            monto=divisas_venta,
-                            puntos_generados=puntos_generados
+                    if filas:
+                        insertadas, duplicadas, errores_escritura = await self._escribir_lote(
+                            filas,
+                            usuarios_actualizados,
+                            clientes_actualizados,
+                            errores_lote
                         )
-                        usuarios_actualizados.add(cedula)
-                    except Exception as e:
-                        errores.append(f"Error actualizando usuario {cedula}: {str(e)}")
+                        resultado.registros_procesados += insertadas
+                        resultado.duplicados_omitidos += duplicadas
+                        # Las filas que no se escribieron deben poder cargarse de nuevo
+                        if errores_escritura:
+                            incompletos.add(indice)
                     
-                    # Marcar cliente para actualizar (compatibilidad)
-                    clientes_actualizados.add((cedula, nombre, telefono, correo))
+                    resultado.errores.extend(prefijo + mensaje for mensaje in errores_lote)
+                    resultado.filas_leidas += filas_bloque
+                    filas_leidas += filas_bloque
                     
-                except Exception as e:
-                    errores.append(f"Fila {idx + 2}: {str(e)}")
+                    if progreso:
+                        procesadas = sum(r.registros_procesados + r.duplicados_omitidos for r in resultados)
+                        await progreso(filas_leidas, filas_leidas - procesadas)
             
-            # Actualizar clientes (colección legacy)
-            for cedula, nombre, telefono, correo in clientes_actualizados:
-                try:
-                    await self.puntos_service.actualizar_cliente(
-                        cedula=cedula,
-                        nombre=nombre,
-                        telefono=telefono,
-                        correo=correo,
-                    )
-                except Exception as e:
-                    errores.append(f"Error actualizando cliente {cedula}: {str(e)}")
+            # Actualizar clientes (colección legacy) en una sola pasada
+            try:
+                _, errores_clientes = await self.puntos_service.actualizar_clientes(clientes_actualizados)
+                errores.extend(errores_clientes)
+            except Exception as e:
+                errores.append(f"Error actualizando clientes: {str(e)}")
             
+            # Solo un archivo procesado completo y sin errores de escritura
+            # se omite en la próxima carga
+            for indice, hash_archivo in hashes.items():
+                if indice in incompletos:
+                    continue
+                
+                await self.db.cargas.update_one(
+                    {"_id": hash_archivo},
+                    {
+                        "$setOnInsert": {
+                            "nombre_archivo": resultados[indice].nombre_archivo,
+                            "cargado": datetime.now(),
+                            "registros_procesados": resultados[indice].registros_procesados,
+                            "duplicados_omitidos": resultados[indice].duplicados_omitidos,
+                        }
+                    },
+                    upsert=True
+                )
+        
         except Exception as e:
             errores.append(f"Error procesando archivo: {str(e)}")
+        finally:
+            for ruta in temporales:
+                os.remove(ruta)
+        
+        # Con varios archivos, cada error indica de cuál viene
+        errores_archivos = [
+            f"{resultado.nombre_archivo}: {mensaje}" if len(resultados) > 1 else mensaje
+            for resultado in resultados
+            for mensaje in resultado.errores
+        ]
+        
+        respuesta = UploadResponse(
+            registros_procesados=sum(r.registros_procesados for r in resultados),
+            clientes_actualizados=len(clientes_actualizados),
+            usuarios_actualizados=len(usuarios_actualizados),
+            duplicados_omitidos=sum(r.duplicados_omitidos for r in resultados),
+            errores=errores_archivos + errores,
+            archivos=resultados,
+        )
+        registrar_carga(
+            filas_leidas,
+            respuesta.registros_procesados,
+            respuesta.duplicados_omitidos,
+            time.perf_counter() - inicio
+        )
+        
+        return respuesta
+    
+    async def migrar_claves(self, batch_size: int = 1000) -> dict:
+        """
+        Calcula la clave natural de las transacciones cargadas antes de que
+        existiera, para que futuras cargas las reconozcan.
+        
+        Las transacciones que ya estaban duplicadas quedan sin clave (el
+        índice único rechaza la segunda) y se cuentan en `duplicadas`.
+        
+        Returns:
+            Estadísticas: transacciones, duplicadas, lotes
+        """
+        stats = {"transacciones": 0, "duplicadas": 0, "lotes": 0}
+        
+        cursor = self.db.transacciones.find(
+            {"clave": {"$exists": False}},
+            {campo: 1 for campo in self.CAMPOS_CLAVE}
+        ).batch_size(batch_size)
+        
+        operaciones = []
+        async for tx in cursor:
+            clave = self.clave_transaccion(*(tx.get(campo, "") for campo in self.CAMPOS_CLAVE))
+            operaciones.append(UpdateOne({"_id": tx["_id"]}, {"$set": {"clave": clave}}))
+            
+            if len(operaciones) >= batch_size:
+                await self._guardar_claves(operaciones, stats)
+                operaciones = []
+        
+        if operaciones:
+            await self._guardar_claves(operaciones, stats)
+        
+        return stats
+    
+    async def _guardar_claves(self, operaciones: List[UpdateOne], stats: dict) -> None:
+        try:
+            resultado = await self.db.transacciones.bulk_write(operaciones, ordered=False)
+            stats["transacciones"] += resultado.modified_count
+        except BulkWriteError as e:
+            stats["transacciones"] += e.details.get("nModified", 0)
+            stats["duplicadas"] += sum(
+                1 for error in e.details.get("writeErrors", []) if error.get("code") == 11000
+            )
         
-        return registros_procesados, len(clientes_actualizados), len(usuarios_actualizados), errores
+        stats["lotes"] += 1
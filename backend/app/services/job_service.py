@@ -0,0 +1,167 @@
+import os
+from datetime import datetime
+from typing import Optional
+from bson import ObjectId
+from bson.errors import InvalidId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from starlette.concurrency import run_in_threadpool
+from app.models import UploadJobEstado
+from app.services.excel_service import ExcelService
+
+
+class JobService:
+    """
+    Servicio para cargas de archivos en segundo plano.
+    
+    El estado de cada carga se guarda en la colección upload_jobs, de modo
+    que cualquier worker de uvicorn puede responder la consulta de progreso.
+    """
+    
+    # Máximo de errores guardados en el documento del job
+    MAX_ERRORES = 1000
+    
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+    
+    async def crear_job(self, nombre_archivo: str) -> str:
+        """Registra una carga pendiente y retorna su ID."""
+        ahora = datetime.now()
+        
+        result = await self.db.upload_jobs.insert_one({
+            "estado": "pendiente",
+            "nombre_archivo": nombre_archivo,
+            "filas_totales": None,
+            "filas_procesadas": 0,
+            "filas_fallidas": 0,
+            "creado": ahora,
+            "actualizado": ahora,
+        })
+        
+        return str(result.inserted_id)
+    
+    async def actualizar_progreso(self, job_id: str, filas_procesadas: int, filas_fallidas: int) -> None:
+        """Registra el avance de una carga tras cada lote."""
+        await self.db.upload_jobs.update_one(
+            {"_id": ObjectId(job_id)},
+            {
+                "$set": {
+                    "filas_procesadas": filas_procesadas,
+                    "filas_fallidas": filas_fallidas,
+                    "actualizado": datetime.now(),
+                }
+            }
+        )
+    
+    async def ejecutar_carga(self, job_id: str, ruta: str, nombre_archivo: str) -> None:
+        """
+        Procesa el archivo de una carga y guarda su resultado.
+        
+        Args:
+            job_id: ID del job creado con crear_job
+            ruta: Archivo temporal con el contenido subido (se elimina al terminar)
+            nombre_archivo: Nombre original para detectar formato
+        """
+        filtro = {"_id": ObjectId(job_id)}
+        service = ExcelService(self.db)
+        
+        try:
+            with open(ruta, "rb") as archivo:
+                filas_totales = await run_in_threadpool(service.contar_filas, archivo, nombre_archivo)
+                
+                await self.db.upload_jobs.update_one(
+                    filtro,
+                    {
+                        "$set": {
+                            "estado": "procesando",
+                            "filas_totales": filas_totales,
+                            "iniciado": datetime.now(),
+                            "actualizado": datetime.now(),
+                        }
+                    }
+                )
+                
+                resultado = await service.procesar_archivos(
+                    [(archivo, nombre_archivo)],
+                    progreso=lambda procesadas, fallidas: self.actualizar_progreso(
+                        job_id, procesadas, fallidas
+                    ),
+                )
+            
+            errores_totales = len(resultado.errores)
+            resultado.errores = resultado.errores[:self.MAX_ERRORES]
+            for archivo in resultado.archivos:
+                archivo.errores = archivo.errores[:self.MAX_ERRORES]
+            
+            await self.db.upload_jobs.update_one(
+                filtro,
+                {
+                    "$set": {
+                        "estado": "completado",
+                        "resultado": resultado.model_dump(),
+                        "errores_totales": errores_totales,
+                        "finalizado": datetime.now(),
+                        "actualizado": datetime.now(),
+                    }
+                }
+            )
+        except Exception as e:
+            await self.db.upload_jobs.update_one(
+                filtro,
+                {
+                    "$set": {
+                        "estado": "error",
+                        "error": str(e),
+                        "finalizado": datetime.now(),
+                        "actualizado": datetime.now(),
+                    }
+                }
+            )
+        finally:
+            os.remove(ruta)
+    
+    async def obtener_job(self, job_id: str) -> Optional[UploadJobEstado]:
+        """Obtiene el estado de una carga con su velocidad y tiempo estimado."""
+        try:
+            filtro = {"_id": ObjectId(job_id)}
+        except InvalidId:
+            return None
+        
+        job = await self.db.upload_jobs.find_one(filtro)
+        
+        if not job:
+            return None
+        
+        filas_totales = job.get("filas_totales")
+        filas_procesadas = job.get("filas_procesadas", 0)
+        iniciado = job.get("iniciado")
+        
+        # Velocidad promedio desde el inicio del procesamiento
+        filas_por_segundo = 0.0
+        if iniciado:
+            referencia = job.get("finalizado") or datetime.now()
+            segundos = (referencia - iniciado).total_seconds()
+            if segundos > 0:
+                filas_por_segundo = filas_procesadas / segundos
+        
+        eta_segundos = None
+        if job["estado"] in ("completado", "error"):
+            eta_segundos = 0.0
+        elif filas_totales is not None and filas_por_segundo > 0:
+            eta_segundos = max(filas_totales - filas_procesadas, 0) / filas_por_segundo
+        
+        return UploadJobEstado(
+            job_id=str(job["_id"]),
+            estado=job["estado"],
+            nombre_archivo=job["nombre_archivo"],
+            filas_totales=filas_totales,
+            filas_procesadas=filas_procesadas,
+            filas_fallidas=job.get("filas_fallidas", 0),
+            filas_por_segundo=round(filas_por_segundo, 2),
+            eta_segundos=round(eta_segundos, 1) if eta_segundos is not None else None,
+            creado=job["creado"],
+            iniciado=iniciado,
+            finalizado=job.get("finalizado"),
+            resultado=job.get("resultado"),
+            errores_totales=job.get("errores_totales", 0),
+            error=job.get("error"),
+        )
@@ -0,0 +1,811 @@
+import queue
+import pickle
+import asyncio
+import hashlib
+import importlib.util
+import multiprocessing
+import numpy as np
+import pandas as pd
+from datetime import date, datetime
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from contextlib import closing
+from typing import List, Tuple, Optional, Union, BinaryIO, Iterator, AsyncIterator
+from openpyxl import load_workbook
+from openpyxl.cell.cell import ERROR_CODES
+from app.config import get_settings
+from app.services.staging import EscritorStaging
+
+
+# Lote normalizado: (filas leídas del archivo, pares (fila, documento), errores por fila)
+LoteNormalizado = Tuple[int, List[Tuple[int, dict]], List[str]]
+
+# Parte de una carga que se lee por separado: (ruta o archivo, nombre_archivo, hoja,
+# nombre en staging). hoja None es la primera hoja (o el CSV completo); sin
+# nombre en staging no se guarda
+Fuente = Tuple[Union[str, BinaryIO], str, Optional[str], Optional[str]]
+
+# Resultado de leer una fuente: (índice de la fuente, lote, mensaje de error);
+# cada evento trae un lote o un error
+EventoLectura = Tuple[int, Optional[LoteNormalizado], Optional[str]]
+
+
+class ColumnasFaltantesError(ValueError):
+    """El archivo no tiene alguna de las columnas requeridas."""
+
+
+class LectorTransacciones:
+    """
+    Lectura y normalización de archivos Excel/CSV de transacciones.
+    
+    No usa la base de datos, de modo que puede ejecutarse en otro proceso
+    (ver leer_en_proceso).
+    """
+    
+    # Mapeo de columnas esperadas
+    COLUMNAS_ESPERADAS = [
+        "Tienda",
+        "Marca", 
+        "Fecha",
+        "Canal de Venta",
+        "Cedula",
+        "Nombre o Razon Social",
+        "Telefono",
+        "Correo Electronico",
+        "Articulo",
+        "Descripcion Articulo",
+        "Cantidad",
+        "Divisas de Venta",
+        "Categoria",
+        "Numero",
+    ]
+    
+    # Columnas sin las cuales no se puede procesar el archivo
+    COLUMNAS_REQUERIDAS = ["cedula", "nombre_razon_social", "divisas_venta", "fecha"]
+    
+    def _campo(self, columna) -> Optional[str]:
+        """Campo del documento de transacción al que corresponde una columna del archivo."""
+        col_normalizado = str(columna).strip().lower()
+        
+        if "tienda" in col_normalizado:
+            return "tienda"
+        elif "marca" in col_normalizado:
+            return "marca"
+        elif "fecha" in col_normalizado:
+            return "fecha"
+        elif "canal" in col_normalizado:
+            return "canal_venta"
+        elif "cedula" in col_normalizado or "cédula" in col_normalizado:
+            return "cedula"
+        elif "nombre" in col_normalizado or "razon" in col_normalizado:
+            return "nombre_razon_social"
+        elif "telefono" in col_normalizado or "teléfono" in col_normalizado:
+            return "telefono"
+        elif "correo" in col_normalizado or "email" in col_normalizado:
+            return "correo_electronico"
+        elif "articulo" in col_normalizado and "descripcion" not in col_normalizado:
+            return "articulo"
+        elif "descripcion" in col_normalizado:
+            return "descripcion_articulo"
+        elif "cantidad" in col_normalizado:
+            return "cantidad"
+        elif "divisa" in col_normalizado or "venta" in col_normalizado:
+            return "divisas_venta"
+        elif "categoria" in col_normalizado or "categoría" in col_normalizado:
+            return "categoria"
+        elif "numero" in col_normalizado or "número" in col_normalizado:
+            return "numero"
+        
+        return None
+    
+    def _normalizar_columnas(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Normaliza los nombres de columnas del DataFrame."""
+        mapeo = {col: self._campo(col) for col in df.columns}
+        return df.rename(columns={col: campo for col, campo in mapeo.items() if campo})
+    
+    # Formatos de fecha aceptados, en orden de prioridad
+    FORMATOS_FECHA = [
+        "%Y-%m-%d",
+        "%d/%m/%Y",
+        "%d-%m-%Y",
+        "%Y/%m/%d",
+        "%d/%m/%y",
+        "%m/%d/%Y",
+    ]
+    
+    # Columnas de texto del documento de transacción
+    COLUMNAS_TEXTO = [
+        "tienda",
+        "marca",
+        "canal_venta",
+        "nombre_razon_social",
+        "articulo",
+        "descripcion_articulo",
+        "categoria",
+        "numero",
+    ]
+    
+    def _limpiar_cedulas(self, serie: pd.Series) -> pd.Series:
+        """Limpia y normaliza el formato de cédula de toda una columna."""
+        cedulas = serie.astype(str).str.strip()
+        # Remover caracteres no deseados pero mantener V-, E-, J-, etc.
+        cedulas = cedulas.str.replace(" ", "", regex=False).str.replace(".", "", regex=False)
+        
+        return cedulas.where(serie.notna(), "")
+    
+    def _parsear_fechas(self, serie: pd.Series) -> pd.Series:
+        """
+        Parsea una columna de fechas probando cada formato aceptado sobre
+        las celdas que aún no se han podido interpretar.
+        
+        Las celdas vacías o con formato desconocido quedan en NaT.
+        """
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            fechas = serie.copy()
+        else:
+            fechas = pd.Series(pd.NaT, index=serie.index, dtype="datetime64[ns]")
+            
+            # Celdas que ya son fechas (Excel con tipos mezclados)
+            es_fecha = serie.map(lambda valor: isinstance(valor, datetime))
+            if es_fecha.any():
+                fechas[es_fecha] = pd.to_datetime(serie[es_fecha])
+            
+            textos = serie[~es_fecha & serie.notna()].astype(str).str.strip()
+            for fmt in self.FORMATOS_FECHA:
+                if textos.empty:
+                    break
+                parseadas = pd.to_datetime(textos, format=fmt, errors="coerce")
+                validas = parseadas.notna()
+                fechas[parseadas.index[validas]] = parseadas[validas]
+                textos = textos[~validas]
+        
+        return fechas
+    
+    def _columna_numerica(
+        self,
+        df: pd.DataFrame,
+        columna: str,
+        defecto: int,
+        entero: bool = False
+    ) -> Tuple[pd.Series, pd.Series]:
+        """
+        Convierte una columna con la misma semántica que
+        `float(valor or defecto)` o `int(valor or defecto)`.
+        
+        Returns:
+            Tuple[valores (float), mensajes de error por fila (None si es válida)]
+        """
+        errores = pd.Series(None, index=df.index, dtype=object)
+        
+        if columna not in df.columns:
+            return pd.Series(float(defecto), index=df.index), errores
+        
+        serie = df[columna]
+        
+        if pd.api.types.is_numeric_dtype(serie):
+            valores = serie.astype(float)
+            valores[valores == 0] = defecto
+        else:
+            valores = pd.to_numeric(serie, errors="coerce").astype(float)
+            valores[~serie.astype(bool)] = defecto
+            
+            # Celdas que to_numeric no resolvió igual que float()/int()
+            revisar = valores.isna()
+            if entero:
+                es_texto = serie.map(lambda valor: isinstance(valor, str))
+                literales = serie[es_texto].str.strip().str.fullmatch(r"[+-]?\d+")
+                revisar[literales.index[~literales]] = True
+            
+            conversor = int if entero else float
+            for idx, valor in serie[revisar].items():
+                try:
+                    valores[idx] = conversor(valor or defecto)
+                except Exception as e:
+                    errores[idx] = str(e)
+        
+        if entero:
+            errores = errores.where(errores.notna(), self._errores_entero(valores))
+        
+        return valores, errores
+    
+    def _errores_entero(self, valores: pd.Series) -> pd.Series:
+        """Mensajes de int() para valores float que no se pueden convertir."""
+        errores = pd.Series(None, index=valores.index, dtype=object)
+        errores[valores.isna()] = "cannot convert float NaN to integer"
+        errores[np.isinf(valores)] = "cannot convert float infinity to integer"
+        return errores
+    
+    def _columna_texto(self, df: pd.DataFrame, columna: str, opcional: bool = False) -> pd.Series:
+        """
+        Convierte una columna a texto con la semántica de `str(valor or "")`.
+        
+        Si `opcional` es True, las celdas vacías se convierten en None.
+        """
+        if columna not in df.columns:
+            return pd.Series([None if opcional else ""] * len(df), index=df.index, dtype=object)
+        
+        serie = df[columna]
+        textos = serie.astype(str).where(serie.astype(bool), "")
+        
+        if opcional:
+            textos = textos.astype(object).where(serie.notna(), None)
+        
+        return textos
+    
+    # Campos que identifican una transacción entre cargas (clave natural)
+    CAMPOS_CLAVE = ["numero", "tienda", "articulo", "fecha", "cedula", "divisas_venta"]
+    
+    @staticmethod
+    def clave_transaccion(
+        numero: str,
+        tienda: str,
+        articulo: str,
+        fecha: Optional[datetime],
+        cedula: str,
+        divisas_venta: float
+    ) -> str:
+        """
+        Hash de la clave natural de una transacción.
+        
+        La misma fila cargada de nuevo (mismo archivo o archivos que se
+        solapan) produce la misma clave, y el índice único la rechaza.
+        Sin fecha (celda vacía o ilegible) la clave usa una fecha vacía,
+        no la del momento de la carga, que cambiaría en cada carga.
+        """
+        texto = "\x1f".join([
+            str(numero), str(tienda), str(articulo),
+            fecha.isoformat() if fecha else "", str(cedula), repr(float(divisas_venta)),
+        ])
+        return hashlib.sha1(texto.encode("utf-8")).hexdigest()
+    
+    def _normalizar_filas(self, df: pd.DataFrame) -> Tuple[List[Tuple[int, dict]], List[str]]:
+        """
+        Normaliza el DataFrame columna a columna y genera los documentos
+        de transacción listos para insertar.
+        
+        Returns:
+            Tuple[pares (número de fila, documento), errores por fila]
+        """
+        filas = pd.Series(df.index + 2, index=df.index)
+        
+        cedulas = self._limpiar_cedulas(df["cedula"])
+        divisas_venta, errores_divisas = self._columna_numerica(df, "divisas_venta", 0)
+        cantidades, errores_cantidad = self._columna_numerica(df, "cantidad", 1, entero=True)
+        fechas = self._parsear_fechas(df["fecha"])
+        # Las filas sin fecha se guardan con la fecha actual (no entra en la clave)
+        sin_fecha = fechas.isna()
+        fechas = fechas.fillna(pd.Timestamp(datetime.now()))
+        
+        # Calcular puntos: $1 = 1 punto
+        errores_puntos = self._errores_entero(divisas_venta)
+        
+        # El primer error de cada fila es el que se reporta
+        mensajes = errores_divisas.where(errores_divisas.notna(), errores_cantidad)
+        mensajes = mensajes.where(mensajes.notna(), errores_puntos)
+        mensajes[cedulas == ""] = "Cédula vacía o inválida"
+        
+        invalidas = mensajes.notna()
+        errores = [
+            f"Fila {fila}: {mensaje}"
+            for fila, mensaje in zip(filas[invalidas].tolist(), mensajes[invalidas].tolist())
+        ]
+        
+        validas = ~invalidas
+        divisas_validas = divisas_venta[validas]
+        
+        columnas = {
+            columna: self._columna_texto(df, columna)[validas].tolist()
+            for columna in self.COLUMNAS_TEXTO
+        }
+        columnas.update({
+            "fecha": fechas[validas].astype("datetime64[us]").to_numpy().astype(object).tolist(),
+            "cedula": cedulas[validas].tolist(),
+            "telefono": self._columna_texto(df, "telefono", opcional=True)[validas].tolist(),
+            "correo_electronico": self._columna_texto(df, "correo_electronico", opcional=True)[validas].tolist(),
+            "cantidad": cantidades[validas].astype(np.int64).tolist(),
+            "divisas_venta": divisas_validas.tolist(),
+            "puntos_generados": np.trunc(divisas_validas).astype(np.int64).tolist(),
+        })
+        fechas_clave = [
+            None if vacia else fecha
+            for fecha, vacia in zip(columnas["fecha"], sin_fecha[validas].tolist())
+        ]
+        columnas["clave"] = [
+            self.clave_transaccion(*valores)
+            for valores in zip(*(
+                fechas_clave if campo == "fecha" else columnas[campo] for campo in self.CAMPOS_CLAVE
+            ))
+        ]
+        
+        # Orden de campos del documento de transacción
+        claves = [
+            "tienda", "marca", "fecha", "canal_venta", "cedula", "nombre_razon_social",
+            "telefono", "correo_electronico", "articulo", "descripcion_articulo",
+            "cantidad", "divisas_venta", "categoria", "numero", "puntos_generados", "clave",
+        ]
+        documentos = [
+            dict(zip(claves, valores))
+            for valores in zip(*(columnas[clave] for clave in claves))
+        ]
+        
+        return list(zip(filas[validas].tolist(), documentos)), errores
+    
+    # Columnas que se leen como texto: con números y celdas vacías en el
+    # mismo bloque pandas las convertiría a float ("12345678.0")
+    COLUMNAS_STR = ["cedula", "numero", "articulo", "telefono"]
+    
+    @staticmethod
+    def motor_excel() -> str:
+        """
+        Motor de lectura de Excel según EXCEL_MOTOR: "calamine",
+        "openpyxl" o "auto" (calamine si python-calamine está instalado).
+        """
+        motor = get_settings().excel_motor
+        if motor == "auto":
+            return "calamine" if importlib.util.find_spec("python_calamine") else "openpyxl"
+        return motor
+    
+    def _convertir_celda(self, valor):
+        """Convierte una celda de openpyxl/calamine igual que pd.read_excel."""
+        if valor is None or valor == "" or valor in ERROR_CODES:
+            return np.nan
+        if isinstance(valor, float) and valor.is_integer():
+            return int(valor)
+        if type(valor) is date:
+            return datetime(valor.year, valor.month, valor.day)
+        return valor
+    
+    def _celda_texto(self, valor):
+        """Valor de una columna de COLUMNAS_STR: texto, o NaN si está vacía."""
+        if isinstance(valor, float):
+            if np.isnan(valor):
+                return valor
+            if valor.is_integer():
+                return str(int(valor))
+        return str(valor)
+    
+    def _columnas_utiles(self, columnas: List[str]) -> List[int]:
+        """
+        Posiciones de las columnas que se mapean a un campo; las demás no
+        se leen. Si ninguna se mapea se conservan todas, para que el error
+        de columnas faltantes las muestre.
+        """
+        utiles = [i for i, columna in enumerate(columnas) if self._campo(columna)]
+        return utiles or list(range(len(columnas)))
+    
+    def _bloques(
+        self,
+        filas: Iterator[tuple],
+        batch_size: int
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Arma bloques de `batch_size` filas con las filas de una hoja (la
+        primera es el encabezado), solo con las columnas útiles y las de
+        COLUMNAS_STR como texto.
+        """
+        encabezado = next(filas, None)
+        
+        if encabezado is None:
+            return
+        
+        columnas = [
+            str(valor) if valor not in (None, "") else f"Unnamed: {i}"
+            for i, valor in enumerate(encabezado)
+        ]
+        utiles = self._columnas_utiles(columnas)
+        nombres = [columnas[i] for i in utiles]
+        convertidores = [
+            (lambda valor: self._celda_texto(self._convertir_celda(valor)))
+            if self._campo(columnas[i]) in self.COLUMNAS_STR else self._convertir_celda
+            for i in utiles
+        ]
+        ultima = max(utiles)
+        
+        bloque, indices = [], []
+        # La fila 1 es el encabezado; índice = fila - 2 como en pandas
+        for numero, fila in enumerate(filas, start=2):
+            if all(valor is None or valor == "" for valor in fila):
+                continue
+            
+            if len(fila) <= ultima:
+                fila = tuple(fila) + (None,) * (ultima + 1 - len(fila))
+            
+            bloque.append([convertir(fila[i]) for i, convertir in zip(utiles, convertidores)])
+            indices.append(numero - 2)
+            
+            if len(bloque) >= batch_size:
+                yield pd.DataFrame(bloque, columns=nombres, index=indices)
+                bloque, indices = [], []
+        
+        if bloque:
+            yield pd.DataFrame(bloque, columns=nombres, index=indices)
+    
+    def _leer_xlsx(
+        self,
+        contenido: BinaryIO,
+        batch_size: int,
+        hoja: Optional[str] = None
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Itera una hoja de un .xlsx (la primera si no se indica) con openpyxl
+        en modo read_only, entregando bloques de `batch_size` filas.
+        """
+        libro = load_workbook(contenido, read_only=True, data_only=True, keep_links=False)
+        
+        try:
+            hoja_libro = libro[hoja] if hoja else libro.worksheets[0]
+            yield from self._bloques(hoja_libro.iter_rows(values_only=True), batch_size)
+        finally:
+            libro.close()
+    
+    def _libro_calamine(self, contenido: BinaryIO):
+        try:
+            from python_calamine import CalamineWorkbook
+        except ImportError:
+            raise RuntimeError(
+                "EXCEL_MOTOR=calamine requiere el paquete python-calamine (pip install python-calamine)"
+            )
+        
+        return CalamineWorkbook.from_filelike(contenido)
+    
+    def _leer_calamine(
+        self,
+        contenido: BinaryIO,
+        batch_size: int,
+        hoja: Optional[str] = None
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Itera una hoja de un .xlsx/.xls con python-calamine (lector en Rust,
+        varias veces más rápido que openpyxl), en bloques de `batch_size` filas.
+        """
+        libro = self._libro_calamine(contenido)
+        hoja_libro = libro.get_sheet_by_name(hoja) if hoja else libro.get_sheet_by_index(0)
+        
+        yield from self._bloques(iter(hoja_libro.iter_rows()), batch_size)
+    
+    def _leer_csv(self, contenido: BinaryIO, batch_size: int) -> Iterator[pd.DataFrame]:
+        """Lee un CSV en bloques, solo las columnas útiles y las de COLUMNAS_STR como texto."""
+        columnas = list(pd.read_csv(contenido, encoding="utf-8", nrows=0).columns)
+        contenido.seek(0)
+        
+        utiles = self._columnas_utiles(columnas)
+        tipos = {
+            columnas[i]: str
+            for i in utiles
+            if self._campo(columnas[i]) in self.COLUMNAS_STR
+        }
+        
+        with pd.read_csv(
+            contenido,
+            encoding="utf-8",
+            chunksize=batch_size,
+            usecols=utiles,
+            dtype=tipos
+        ) as lector:
+            yield from lector
+    
+    def _leer_lotes(
+        self,
+        contenido: BinaryIO,
+        nombre_archivo: str,
+        batch_size: int,
+        hoja: Optional[str] = None
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Lee el archivo (o una hoja, para Excel) por bloques de `batch_size`
+        filas sin cargarlo completo en memoria.
+        
+        El índice de cada bloque conserva la posición en el archivo, de modo
+        que la fila reportada en los errores es índice + 2.
+        """
+        nombre = nombre_archivo.lower()
+        
+        if nombre.endswith(".csv"):
+            yield from self._leer_csv(contenido, batch_size)
+        elif self.motor_excel() == "calamine":
+            yield from self._leer_calamine(contenido, batch_size, hoja)
+        elif nombre.endswith(".xls"):
+            # openpyxl no lee el formato binario antiguo: pandas (xlrd) lo carga completo
+            df = pd.read_excel(
+                contenido,
+                sheet_name=hoja or 0,
+                usecols=lambda columna: self._campo(columna) is not None
+            )
+            for columna in df.columns:
+                if self._campo(columna) in self.COLUMNAS_STR:
+                    df[columna] = df[columna].map(self._celda_texto)
+            for inicio in range(0, len(df), batch_size):
+                yield df.iloc[inicio:inicio + batch_size]
+        else:
+            yield from self._leer_xlsx(contenido, batch_size, hoja)
+    
+    def listar_hojas(self, contenido: BinaryIO, nombre_archivo: str) -> List[Optional[str]]:
+        """
+        Hojas de un libro Excel, en orden. Para CSV retorna [None] (una
+        sola tabla). Deja el archivo posicionado al inicio.
+        """
+        nombre = nombre_archivo.lower()
+        
+        try:
+            if nombre.endswith(".csv"):
+                return [None]
+            if self.motor_excel() == "calamine":
+                return list(self._libro_calamine(contenido).sheet_names)
+            if nombre.endswith(".xls"):
+                return list(pd.ExcelFile(contenido).sheet_names)
+            
+            libro = load_workbook(contenido, read_only=True)
+            try:
+                return list(libro.sheetnames)
+            finally:
+                libro.close()
+        finally:
+            contenido.seek(0)
+    
+    def contar_filas(self, contenido: BinaryIO, nombre_archivo: str) -> Optional[int]:
+        """
+        Estima la cantidad de filas de datos sin parsear el archivo.
+        
+        Para CSV cuenta saltos de línea; para XLSX usa las dimensiones
+        declaradas por la hoja. Deja el archivo posicionado al inicio.
+        
+        Returns:
+            Filas estimadas (sin encabezado) o None si no se puede estimar
+        """
+        nombre = nombre_archivo.lower()
+        
+        try:
+            if nombre.endswith(".csv"):
+                lineas = 0
+                ultimo = b""
+                for bloque in iter(lambda: contenido.read(1024 * 1024), b""):
+                    lineas += bloque.count(b"\n")
+                    ultimo = bloque[-1:]
+                if ultimo and ultimo != b"\n":
+                    lineas += 1
+                return max(lineas - 1, 0)
+            
+            if nombre.endswith(".xlsx"):
+                libro = load_workbook(contenido, read_only=True)
+                try:
+                    max_row = libro.worksheets[0].max_row
+                finally:
+                    libro.close()
+                return max(max_row - 1, 0) if max_row else None
+        except Exception:
+            return None
+        finally:
+            contenido.seek(0)
+        
+        return None
+    
+    def hash_archivo(self, contenido: BinaryIO) -> str:
+        """SHA-256 del contenido del archivo. Deja el archivo posicionado al inicio."""
+        resumen = hashlib.sha256()
+        
+        try:
+            for bloque in iter(lambda: contenido.read(1024 * 1024), b""):
+                resumen.update(bloque)
+        finally:
+            contenido.seek(0)
+        
+        return resumen.hexdigest()
+    
+    def lotes_normalizados(
+        self,
+        contenido: BinaryIO,
+        nombre_archivo: str,
+        batch_size: int,
+        hoja: Optional[str] = None
+    ) -> Iterator[LoteNormalizado]:
+        """
+        Lee el archivo (o una de sus hojas) por bloques y entrega cada uno
+        normalizado, listo para insertar.
+        
+        Raises:
+            ColumnasFaltantesError: si falta alguna columna requerida
+        """
+        for df in self._leer_lotes(contenido, nombre_archivo, batch_size, hoja):
+            # Normalizar columnas
+            df = self._normalizar_columnas(df)
+            
+            # Verificar columnas requeridas
+            columnas_faltantes = [col for col in self.COLUMNAS_REQUERIDAS if col not in df.columns]
+            
+            if columnas_faltantes:
+                raise ColumnasFaltantesError(f"Columnas faltantes: {', '.join(columnas_faltantes)}")
+            
+            # Normalizar columna a columna
+            filas, errores_filas = self._normalizar_filas(df)
+            
+            yield len(df), filas, errores_filas
+
+
+def _mensaje_error(error: Exception) -> str:
+    if isinstance(error, ColumnasFaltantesError):
+        return str(error)
+    return f"Error procesando archivo: {error}"
+
+
+def _lotes_fuente(
+    contenido: BinaryIO,
+    nombre_archivo: str,
+    batch_size: int,
+    hoja: Optional[str],
+    staging: Optional[str]
+) -> Iterator[LoteNormalizado]:
+    """
+    Lotes normalizados de una fuente; con `staging` también los guarda en
+    STAGING_DIR, y solo si la fuente se lee completa.
+    """
+    lotes = LectorTransacciones().lotes_normalizados(contenido, nombre_archivo, batch_size, hoja)
+    
+    if not staging:
+        yield from lotes
+        return
+    
+    escritor = EscritorStaging(get_settings().staging_dir, staging)
+    try:
+        for lote in lotes:
+            escritor.escribir([documento for _, documento in lote[1]])
+            yield lote
+    except BaseException:
+        # Error, o lectura interrumpida (GeneratorExit)
+        escritor.descartar()
+        raise
+    
+    escritor.cerrar()
+
+
+def leer_fuentes(fuentes: List[Fuente], batch_size: int) -> Iterator[EventoLectura]:
+    """
+    Lee las fuentes una tras otra en este proceso.
+    
+    Un error en una fuente (ej. hoja sin las columnas requeridas) se
+    entrega como evento y la lectura sigue con las demás.
+    """
+    for indice, (origen, nombre_archivo, hoja, staging) in enumerate(fuentes):
+        try:
+            if isinstance(origen, str):
+                with open(origen, "rb") as contenido:
+                    for lote in _lotes_fuente(contenido, nombre_archivo, batch_size, hoja, staging):
+                        yield indice, lote, None
+            else:
+                origen.seek(0)
+                for lote in _lotes_fuente(origen, nombre_archivo, batch_size, hoja, staging):
+                    yield indice, lote, None
+        except Exception as e:
+            yield indice, None, _mensaje_error(e)
+
+
+def _leer_fuente(
+    indice: int,
+    ruta: str,
+    nombre_archivo: str,
+    hoja: Optional[str],
+    staging: Optional[str],
+    batch_size: int,
+    cola: "queue.Queue",
+    cancelada: "multiprocessing.synchronize.Event"
+) -> None:
+    """
+    Tarea del proceso lector: normaliza una fuente y envía cada lote por
+    la cola. Siempre termina con ("fin", indice, None), también si hubo
+    error o si la carga se canceló.
+    """
+    try:
+        if cancelada.is_set():
+            return
+        
+        with open(ruta, "rb") as contenido, closing(
+            _lotes_fuente(contenido, nombre_archivo, batch_size, hoja, staging)
+        ) as lotes:
+            for lote in lotes:
+                if cancelada.is_set():
+                    break
+                # Serializado aquí: el manager solo reenvía bytes
+                cola.put(("lote", indice, pickle.dumps(lote, pickle.HIGHEST_PROTOCOL)))
+    except Exception as e:
+        cola.put(("error", indice, _mensaje_error(e)))
+    finally:
+        cola.put(("fin", indice, None))
+
+
+@lru_cache()
+def get_pool_lectura() -> Tuple[ProcessPoolExecutor, "multiprocessing.managers.SyncManager"]:
+    """
+    Procesos para leer archivos (UPLOAD_PROCESOS) y el manager que crea
+    las colas entre ellos y el worker de uvicorn.
+    
+    Se usa "spawn" para no copiar el estado del event loop al proceso hijo.
+    """
+    procesos = get_settings().upload_procesos
+    contexto = multiprocessing.get_context("spawn")
+    manager = contexto.Manager()
+    pool = ProcessPoolExecutor(max_workers=procesos, mp_context=contexto)
+    
+    # Arrancar los procesos ahora y no en la primera carga
+    for futuro in [pool.submit(int) for _ in range(procesos)]:
+        futuro.result()
+    
+    return pool, manager
+
+
+def cerrar_pool_lectura() -> None:
+    """Detiene los procesos lectores, si se llegaron a crear."""
+    if get_pool_lectura.cache_info().currsize:
+        pool, manager = get_pool_lectura()
+        pool.shutdown(cancel_futures=True)
+        manager.shutdown()
+        get_pool_lectura.cache_clear()
+
+
+async def leer_en_proceso(
+    fuentes: List[Tuple[str, str, Optional[str], Optional[str]]],
+    batch_size: int,
+    lotes_en_cola: int = 4
+) -> AsyncIterator[EventoLectura]:
+    """
+    Normaliza las fuentes en los procesos del pool, varias a la vez, y
+    entrega sus lotes a medida que están listos (mezclados entre fuentes),
+    sin ocupar el event loop.
+    
+    Todas las fuentes comparten una cola de `lotes_en_cola` lotes: si la
+    escritura en MongoDB va más lenta que la lectura, los procesos esperan.
+    
+    Args:
+        fuentes: (ruta, nombre_archivo, hoja, staging); cada proceso abre su ruta
+    
+    Raises:
+        RuntimeError: si un proceso lector termina sin avisar
+    """
+    loop = asyncio.get_running_loop()
+    
+    def preparar():
+        # Crear los proxies abre conexiones con el manager: fuera del event loop
+        pool, manager = get_pool_lectura()
+        return pool, manager.Queue(maxsize=lotes_en_cola), manager.Event()
+    
+    pool, cola, cancelada = await loop.run_in_executor(None, preparar)
+    
+    futuros = [
+        loop.run_in_executor(
+            pool, _leer_fuente, indice, ruta, nombre_archivo, hoja, staging, batch_size, cola, cancelada
+        )
+        for indice, (ruta, nombre_archivo, hoja, staging) in enumerate(fuentes)
+    ]
+    pendientes = len(fuentes)
+    
+    def obtener():
+        tipo, indice, valor = cola.get(True, 1.0)
+        return tipo, indice, pickle.loads(valor) if tipo == "lote" else valor
+    
+    async def recibir():
+        while True:
+            try:
+                return await loop.run_in_executor(None, obtener)
+            except queue.Empty:
+                if all(futuro.done() for futuro in futuros):
+                    # Un proceso murió sin enviar "fin" (ej. BrokenProcessPool)
+                    for futuro in futuros:
+                        futuro.result()
+                    raise RuntimeError("El proceso lector terminó inesperadamente")
+    
+    try:
+        while pendientes:
+            tipo, indice, valor = await recibir()
+            
+            if tipo == "fin":
+                pendientes -= 1
+            elif tipo == "error":
+                yield indice, None, valor
+            else:
+                yield indice, valor, None
+    finally:
+        # Si la carga se interrumpe, liberar a los procesos lectores
+        if pendientes:
+            cancelada.set()
+            while pendientes:
+                if (await recibir())[0] == "fin":
+                    pendientes -= 1
+        await asyncio.gather(*futuros, return_exceptions=True)
@@ -0,0 +1,68 @@
+import base64
+from typing import List, Tuple, Optional
+from bson import json_util
+
+
+def codificar_cursor(valores: List) -> str:
+    """
+    Codifica la clave de orden del último elemento de una página en un
+    token opaco para la siguiente consulta (soporta datetime y ObjectId).
+    """
+    return base64.urlsafe_b64encode(json_util.dumps(valores).encode()).decode()
+
+
+def decodificar_cursor(cursor: str, longitud: int) -> List:
+    """
+    Decodifica un token generado por codificar_cursor con `longitud` valores.
+    
+    Raises:
+        ValueError: si el token no es válido
+    """
+    try:
+        valores = json_util.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Cursor de paginación inválido")
+    
+    if not isinstance(valores, list) or len(valores) != longitud:
+        raise ValueError("Cursor de paginación inválido")
+    
+    return valores
+
+
+def filtro_keyset(orden: List[Tuple[str, int]], valores: List) -> dict:
+    """
+    Construye el filtro de los documentos posteriores a `valores` según
+    el orden indicado, para paginar sin skip.
+    
+    Ejemplo: orden [("puntos_vigentes", -1), ("cedula", 1)] y valores
+    [800, "V-1"] -> puntos_vigentes < 800 o (puntos_vigentes = 800 y cedula > "V-1").
+    """
+    condiciones = []
+    
+    for i, (campo, direccion) in enumerate(orden):
+        condicion = {anterior: valor for (anterior, _), valor in zip(orden[:i], valores[:i])}
+        condicion[campo] = {"$gt" if direccion == 1 else "$lt": valores[i]}
+        condiciones.append(condicion)
+    
+    return {"$or": condiciones}
+
+
+def cortar_pagina(
+    documentos: List[dict],
+    limit: int,
+    orden: List[Tuple[str, int]]
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Recorta una consulta hecha con limit + 1 y genera el cursor de la
+    siguiente página a partir del último documento.
+    
+    Returns:
+        Tuple[documentos de la página, cursor_siguiente (None si no hay más)]
+    """
+    if len(documentos) <= limit:
+        return documentos, None
+    
+    documentos = documentos[:limit]
+    siguiente = codificar_cursor([documentos[-1][campo] for campo, _ in orden])
+    
+    return documentos, siguiente
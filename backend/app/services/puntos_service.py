@@ -1,8 +1,15 @@
-from datetime import datetime, timedelta
-from typing import Optional, List, Tuple
+import numpy as np
+from datetime import datetime
+from typing import Optional, List, Tuple, Dict
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from app.models import Cliente, ClientePuntosResponse
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from app.models import Cliente
 from app.models.cliente import NivelFidelizacion
+from app.services.cache import get_cache_puntos, clave_puntos, clave_listado, invalidar_cedulas
+from app.services.canje_service import CanjeService, PROYECCION_CANJE
+from app.services import calculo_puntos
+from app.respuestas import campos_puntos
 
 
 class PuntosService:
@@ -10,28 +17,15 @@ class PuntosService:
     
     def __init__(self, db: AsyncIOMotorDatabase):
         self.db = db
+        self.cache = get_cache_puntos()
+        self.canje = CanjeService(db)
+    
+    # Reglas de puntos: ver app/services/calculo_puntos.py
     
     @staticmethod
     def calcular_nivel(compras_totales: int, total_gastado: float) -> NivelFidelizacion:
-        """
-        Calcula el nivel de fidelización según las reglas:
-        - Kilobytes: Sin historial de compra
-        - MegaBytes: ≥3 compras o ≥$500 gastado
-        - GigaBytes: Ser MegaBytes + 5 compras en ese nivel o ≥$1500 total
-        - TeraBytes: Ser GigaBytes + 5 compras en ese nivel o ≥$3000 total
-        """
-        if compras_totales == 0 and total_gastado == 0:
-            return "Kilobytes"
-        
-        # Verificar condiciones de nivel (simplificado con totales acumulados)
-        if total_gastado >= 3000 or compras_totales >= 13:
-            return "TeraBytes"
-        elif total_gastado >= 1500 or compras_totales >= 8:
-            return "GigaBytes"
-        elif total_gastado >= 500 or compras_totales >= 3:
-            return "MegaBytes"
-        
-        return "Kilobytes"
+        """Calcula el nivel de fidelización (ver calculo_puntos.calcular_nivel)."""
+        return calculo_puntos.calcular_nivel(compras_totales, total_gastado)
     
     @staticmethod
     def calcular_puntos_vigentes(
@@ -42,28 +36,14 @@ class PuntosService:
         Calcula los puntos vigentes (dentro del año de suscripción).
         Los puntos tienen vigencia de 1 año desde la fecha de suscripción.
         """
-        ahora = datetime.now()
-        
-        # Calcular el inicio del período vigente actual
-        años_transcurridos = (ahora - fecha_suscripcion).days // 365
-        inicio_periodo = fecha_suscripcion + timedelta(days=365 * años_transcurridos)
-        fin_periodo = inicio_periodo + timedelta(days=365)
-        
-        # Si ya pasó el período, reiniciar
-        if ahora > fin_periodo:
-            return 0
-        
-        # Sumar puntos de transacciones dentro del período vigente
-        puntos = 0
+        movimientos = []
         for tx in transacciones:
             fecha_tx = tx.get("fecha")
             if isinstance(fecha_tx, str):
                 fecha_tx = datetime.fromisoformat(fecha_tx)
-            
-            if inicio_periodo <= fecha_tx < fin_periodo:
-                puntos += tx.get("puntos_generados", 0)
+            movimientos.append((fecha_tx, tx.get("puntos_generados", 0)))
         
-        return puntos
+        return calculo_puntos.calcular_puntos_vigentes(movimientos, fecha_suscripcion)
     
     @staticmethod
     def calcular_puntos_canje(puntos_vigentes: int) -> Tuple[int, float]:
@@ -75,14 +55,7 @@ class PuntosService:
         Returns:
             Tuple[puntos_listos_canje, dolares_canjeables]
         """
-        if puntos_vigentes < 500:
-            return 0, 0.0
-        
-        # Múltiplos de 500 (o de 50 para el cálculo de dólares)
-        puntos_listos = (puntos_vigentes // 500) * 500
-        dolares = puntos_listos / 50
-        
-        return puntos_listos, dolares
+        return calculo_puntos.calcular_puntos_canje(puntos_vigentes)
     
     async def actualizar_cliente(
         self,
@@ -90,119 +63,196 @@ class PuntosService:
         nombre: str,
         telefono: Optional[str] = None,
         correo: Optional[str] = None
-    ) -> dict:
+    ) -> Optional[dict]:
         """
         Actualiza o crea un cliente y recalcula sus puntos y nivel.
         """
-        # Buscar cliente existente
-        cliente_existente = await self.db.clientes.find_one({"cedula": cedula})
-        
-        # Obtener todas las transacciones del cliente
-        transacciones = await self.db.transacciones.find(
-            {"cedula": cedula}
-        ).to_list(length=None)
-        
-        # Calcular totales
-        total_gastado = sum(tx.get("divisas_venta", 0) for tx in transacciones)
-        compras_totales = len(transacciones)
-        puntos_totales = sum(tx.get("puntos_generados", 0) for tx in transacciones)
-        
-        # Fecha de suscripción (mantener existente o usar la primera transacción)
-        if cliente_existente:
-            fecha_suscripcion = cliente_existente.get("fecha_suscripcion", datetime.now())
-        elif transacciones:
-            # Usar la fecha de la primera transacción como fecha de suscripción
-            fechas = [tx.get("fecha") for tx in transacciones if tx.get("fecha")]
-            fecha_suscripcion = min(fechas) if fechas else datetime.now()
-        else:
-            fecha_suscripcion = datetime.now()
-        
-        # Calcular puntos vigentes
-        puntos_vigentes = self.calcular_puntos_vigentes(transacciones, fecha_suscripcion)
-        
-        # Calcular puntos para canje
-        puntos_listos_canje, dolares_canjeables = self.calcular_puntos_canje(puntos_vigentes)
-        
-        # Calcular nivel
-        nivel = self.calcular_nivel(compras_totales, total_gastado)
-        
-        # Preparar documento del cliente
-        cliente_doc = {
-            "cedula": cedula,
-            "nombre": nombre,
-            "telefono": telefono,
-            "correo": correo,
-            "fecha_suscripcion": fecha_suscripcion,
-            "nivel": nivel,
-            "total_gastado": total_gastado,
-            "compras_totales": compras_totales,
-            "puntos_totales": puntos_totales,
-            "puntos_vigentes": puntos_vigentes,
-            "puntos_listos_canje": puntos_listos_canje,
-            "dolares_canjeables": dolares_canjeables,
-            "ultima_actualizacion": datetime.now(),
-        }
-        
-        # Upsert (insertar o actualizar)
-        await self.db.clientes.update_one(
-            {"cedula": cedula},
-            {"$set": cliente_doc},
-            upsert=True
-        )
+        contacto = {"nombre": nombre, "telefono": telefono, "correo": correo}
+        
+        _, errores = await self.actualizar_clientes({cedula: contacto})
+        
+        if errores:
+            raise RuntimeError(errores[0])
         
-        return cliente_doc
+        return await self.db.clientes.find_one({"cedula": cedula}, {"_id": 0})
     
-    async def obtener_cliente_puntos(self, cedula: str) -> Optional[ClientePuntosResponse]:
-        """Obtiene información de puntos de un cliente por cédula."""
-        cliente = await self.db.clientes.find_one({"cedula": cedula})
+    @staticmethod
+    def _pipeline_historial(cedulas: List[str]) -> List[dict]:
+        """
+        Agrupa en una sola pasada por transacciones (índice cedula + fecha)
+        las fechas, puntos y montos de cada cliente, junto con su fecha de
+        suscripción guardada en clientes (si existe).
+        """
+        return [
+            {"$match": {"cedula": {"$in": cedulas}}},
+            {
+                "$group": {
+                    "_id": "$cedula",
+                    "fechas": {"$push": "$fecha"},
+                    "puntos": {"$push": {"$ifNull": ["$puntos_generados", 0]}},
+                    "montos": {"$push": {"$ifNull": ["$divisas_venta", 0]}},
+                }
+            },
+            {
+                "$lookup": {
+                    "from": "clientes",
+                    "localField": "_id",
+                    "foreignField": "cedula",
+                    "as": "cliente",
+                }
+            },
+            {
+                "$project": {
+                    "fechas": 1,
+                    "puntos": 1,
+                    "montos": 1,
+                    "fecha_suscripcion": {"$arrayElemAt": ["$cliente.fecha_suscripcion", 0]},
+                }
+            },
+        ]
+    
+    async def actualizar_clientes(
+        self,
+        contactos: Dict[str, Optional[dict]]
+    ) -> Tuple[int, List[str]]:
+        """
+        Recalcula varios clientes a partir de sus transacciones y los
+        escribe con un único bulk_write.
+        
+        Una agregación trae el historial agrupado por cédula y los puntos,
+        período, canje y nivel de todos se calculan juntos (calculo_puntos).
+        La fecha de suscripción es la guardada o la primera transacción.
+        
+        Args:
+            contactos: cedula -> {"nombre", "telefono", "correo"}, o None
+                para conservar los datos de contacto guardados
+            
+        Returns:
+            Tuple[clientes_actualizados, errores]
+        """
+        if not contactos:
+            return 0, []
+        
+        errores = []
+        ahora = datetime.now()
+        cedulas = list(contactos)
+        indices = {cedula: i for i, cedula in enumerate(cedulas)}
+        
+        try:
+            miembro, fechas, puntos, montos = [], [], [], []
+            fechas_suscripcion = np.full(len(cedulas), np.datetime64("NaT", "us"))
+            
+            async for grupo in self.db.transacciones.aggregate(
+                self._pipeline_historial(cedulas),
+                allowDiskUse=True
+            ):
+                i = indices[grupo["_id"]]
+                miembro.extend([i] * len(grupo["fechas"]))
+                fechas.extend(grupo["fechas"])
+                puntos.extend(grupo["puntos"])
+                montos.extend(grupo["montos"])
+                if grupo.get("fecha_suscripcion"):
+                    fechas_suscripcion[i] = np.datetime64(grupo["fecha_suscripcion"], "us")
+            
+            calculados = calculo_puntos.a_documentos(calculo_puntos.calcular_lote(
+                miembro, fechas, puntos, montos, len(cedulas), fechas_suscripcion, ahora
+            ))
+            
+            operaciones = []
+            cedulas_ops = []
+            for cedula, calculado in zip(cedulas, calculados):
+                contacto = contactos[cedula]
+                
+                # Sin transacciones ni datos de contacto no hay nada que guardar
+                if not calculado["compras_totales"] and contacto is None:
+                    continue
+                
+                operaciones.append(UpdateOne(
+                    {"cedula": cedula},
+                    {"$set": {
+                        "cedula": cedula,
+                        **(contacto or {}),
+                        **calculado,
+                        "ultima_actualizacion": ahora,
+                    }},
+                    upsert=True
+                ))
+                cedulas_ops.append(cedula)
+            
+            if not operaciones:
+                return 0, errores
+            
+            fallidas = 0
+            try:
+                await self.db.clientes.bulk_write(operaciones, ordered=False)
+            except BulkWriteError as e:
+                for error in e.details.get("writeErrors", []):
+                    fallidas += 1
+                    errores.append(f"Error actualizando cliente {cedulas_ops[error['index']]}: {error.get('errmsg')}")
+            
+            await self.canje.sincronizar("clientes", cedulas)
+        finally:
+            await invalidar_cedulas(self.cache, "clientes", contactos)
+        
+        return len(operaciones) - fallidas, errores
+    
+    async def obtener_cliente_puntos(self, cedula: str) -> Optional[dict]:
+        """
+        Obtiene información de puntos de un cliente por cédula, con los
+        campos de ClientePuntosResponse.
+        
+        El resultado se guarda en la caché de puntos; actualizar_cliente
+        la invalida.
+        """
+        clave = clave_puntos("clientes", cedula)
+        guardado = await self.cache.obtener(clave)
+        if guardado is not None:
+            return guardado
+        
+        cliente = await self.db.clientes.find_one({"cedula": cedula}, PROYECCION_CANJE)
         
         if not cliente:
             return None
         
-        return ClientePuntosResponse(
-            cedula=cliente["cedula"],
-            nombre=cliente["nombre"],
-            nivel=cliente["nivel"],
-            puntos_totales=cliente["puntos_totales"],
-            puntos_vigentes=cliente["puntos_vigentes"],
-            puntos_listos_canje=cliente["puntos_listos_canje"],
-            dolares_canjeables=cliente["dolares_canjeables"],
-        )
+        respuesta = campos_puntos(cliente)
+        await self.cache.guardar(clave, respuesta)
+        
+        return respuesta
     
     async def obtener_clientes_listos_canje(
         self,
         page: int = 1,
-        limit: int = 10
-    ) -> Tuple[List[ClientePuntosResponse], int]:
+        limit: int = 10,
+        after: Optional[str] = None,
+        incluir_total: bool = True
+    ) -> Tuple[List[dict], Optional[int], Optional[str]]:
         """
-        Obtiene lista de clientes con al menos 500 puntos vigentes.
+        Obtiene lista de clientes con al menos 500 puntos vigentes desde
+        la vista canje_ready (ver CanjeService), con los campos de
+        ClientePuntosResponse.
+        
+        Con `after` (cursor de la página anterior) la consulta continúa
+        desde el último (puntos_vigentes, cedula) sin usar skip.
         
         Returns:
-            Tuple[lista_clientes, total]
+            Tuple[lista_clientes, total (None si incluir_total es False), cursor_siguiente]
+            
+        Raises:
+            ValueError: si el cursor no es válido
         """
-        skip = (page - 1) * limit
-        
-        # Filtrar clientes con puntos vigentes >= 500
-        filtro = {"puntos_vigentes": {"$gte": 500}}
-        
-        # Contar total
-        total = await self.db.clientes.count_documents(filtro)
-        
-        # Obtener página
-        cursor = self.db.clientes.find(filtro).sort(
-            "puntos_vigentes", -1
-        ).skip(skip).limit(limit)
-        
-        clientes = []
-        async for cliente in cursor:
-            clientes.append(ClientePuntosResponse(
-                cedula=cliente["cedula"],
-                nombre=cliente["nombre"],
-                nivel=cliente["nivel"],
-                puntos_totales=cliente["puntos_totales"],
-                puntos_vigentes=cliente["puntos_vigentes"],
-                puntos_listos_canje=cliente["puntos_listos_canje"],
-                dolares_canjeables=cliente["dolares_canjeables"],
-            ))
+        clave = await clave_listado(self.cache, "clientes-canje", page, limit, after, incluir_total)
+        guardado = await self.cache.obtener(clave) if clave else None
+        if guardado is not None:
+            return guardado["clientes"], guardado["total"], guardado["siguiente"]
+        
+        # Vista canje_ready: lectura por rango indexado y total desde el contador
+        documentos, total, siguiente = await self.canje.listar(
+            "clientes", page, limit, after, incluir_total
+        )
+        
+        clientes = [campos_puntos(cliente) for cliente in documentos]
+        
+        if clave:
+            await self.cache.guardar(clave, {"clientes": clientes, "total": total, "siguiente": siguiente})
         
-        return clientes, total
+        return clientes, total, siguiente
@@ -0,0 +1,150 @@
+"""
+Staging columnar de las transacciones cargadas.
+
+Cada archivo/hoja leído completo se guarda en STAGING_DIR como parquet
+(comprimido con zstd), particionado por mes de la transacción:
+
+    STAGING_DIR/mes=2025-01/<hash del archivo>-<hoja>.parquet
+
+Así se puede reprocesar lo cargado (manage.py replay) sin pedir de nuevo
+los Excel a las tiendas. Requiere pyarrow (pip install pyarrow).
+"""
+
+import os
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+from app.config import get_settings
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.dataset
+        import pyarrow.fs
+    except ImportError:
+        raise RuntimeError("STAGING_DIR requiere el paquete pyarrow (pip install pyarrow)")
+    
+    return pyarrow
+
+
+def staging_habilitado() -> bool:
+    """Si las cargas se guardan en staging (STAGING_DIR configurado)."""
+    return bool(get_settings().staging_dir)
+
+
+def esquema():
+    """Esquema de los archivos de staging: los campos del documento de transacción."""
+    pa = _pyarrow()
+    
+    return pa.schema([
+        ("tienda", pa.string()),
+        ("marca", pa.string()),
+        ("fecha", pa.timestamp("us")),
+        ("canal_venta", pa.string()),
+        ("cedula", pa.string()),
+        ("nombre_razon_social", pa.string()),
+        ("telefono", pa.string()),
+        ("correo_electronico", pa.string()),
+        ("articulo", pa.string()),
+        ("descripcion_articulo", pa.string()),
+        ("cantidad", pa.int64()),
+        ("divisas_venta", pa.float64()),
+        ("categoria", pa.string()),
+        ("numero", pa.string()),
+        ("puntos_generados", pa.int64()),
+        ("clave", pa.string()),
+    ])
+
+
+class EscritorStaging:
+    """
+    Escribe los documentos de una fuente en sus archivos de staging, uno
+    por mes, a medida que se leen los lotes.
+    
+    Los archivos se escriben con nombre oculto (".<nombre>.parquet", que
+    los lectores ignoran) y solo cerrar() los publica: una lectura
+    interrumpida no deja datos a medias.
+    """
+    
+    def __init__(self, directorio: str, nombre: str):
+        self.pa = _pyarrow()
+        self.esquema = esquema()
+        self.directorio = directorio
+        self.nombre = nombre
+        # mes -> (escritor, ruta temporal, ruta final)
+        self.escritores: Dict[str, Tuple[object, str, str]] = {}
+    
+    def _escritor(self, mes: str):
+        if mes not in self.escritores:
+            carpeta = os.path.join(self.directorio, f"mes={mes}")
+            os.makedirs(carpeta, exist_ok=True)
+            
+            temporal = os.path.join(carpeta, f".{self.nombre}.parquet")
+            escritor = self.pa.parquet.ParquetWriter(temporal, self.esquema, compression="zstd")
+            self.escritores[mes] = (escritor, temporal, os.path.join(carpeta, f"{self.nombre}.parquet"))
+        
+        return self.escritores[mes][0]
+    
+    def escribir(self, documentos: List[dict]) -> None:
+        """Agrega documentos de transacción (un row group por mes y lote)."""
+        por_mes: Dict[str, List[dict]] = {}
+        for documento in documentos:
+            por_mes.setdefault(f"{documento['fecha']:%Y-%m}", []).append(documento)
+        
+        for mes, filas in por_mes.items():
+            tabla = self.pa.Table.from_pylist(filas, schema=self.esquema)
+            self._escritor(mes).write_table(tabla)
+    
+    def cerrar(self) -> None:
+        """Cierra los archivos y los publica, reemplazando los de una carga anterior."""
+        for escritor, temporal, final in self.escritores.values():
+            escritor.close()
+            os.replace(temporal, final)
+        self.escritores = {}
+    
+    def descartar(self) -> None:
+        """Cierra y elimina los archivos sin publicarlos."""
+        for escritor, temporal, _ in self.escritores.values():
+            escritor.close()
+            os.remove(temporal)
+        self.escritores = {}
+
+
+def leer_staging(
+    directorio: str,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    columnas: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """
+    Lee las transacciones en staging, con memory map y solo las
+    particiones de los meses pedidos.
+    
+    Args:
+        desde, hasta: Meses "YYYY-MM" (inclusive); None sin límite
+        columnas: Columnas a leer (default: todas)
+    """
+    pa = _pyarrow()
+    
+    if not os.path.isdir(directorio):
+        return pd.DataFrame(columns=columnas or esquema().names)
+    
+    dataset = pa.dataset.dataset(
+        os.path.abspath(directorio),
+        schema=esquema().append(pa.field("mes", pa.string())),
+        format="parquet",
+        partitioning=pa.dataset.partitioning(pa.schema([("mes", pa.string())]), flavor="hive"),
+        filesystem=pa.fs.LocalFileSystem(use_mmap=True),
+    )
+    
+    filtro = None
+    if desde:
+        filtro = pa.dataset.field("mes") >= desde
+    if hasta:
+        condicion = pa.dataset.field("mes") <= hasta
+        filtro = condicion if filtro is None else filtro & condicion
+    
+    tabla = dataset.to_table(columns=columnas or esquema().names, filter=filtro)
+    
+    return tabla.to_pandas(timestamp_as_object=False)
@@ -0,0 +1,326 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Optional, List, Dict, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from starlette.concurrency import run_in_threadpool
+from app.config import get_settings
+from app.services import calculo_puntos
+from app.services.cache import get_cache_puntos, invalidar_cedulas
+from app.services.canje_service import CanjeService
+from app.services.staging import EscritorStaging, leer_staging, esquema
+
+
+class StagingService:
+    """
+    Reprocesamiento de las cargas guardadas en staging (STAGING_DIR).
+    
+    Ver app/services/staging.py para el formato de los archivos.
+    """
+    
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self.directorio = get_settings().staging_dir
+        self.transacciones_recientes = get_settings().transacciones_recientes
+        self.cache = get_cache_puntos()
+        self.canje = CanjeService(db)
+        
+        if not self.directorio:
+            raise RuntimeError("STAGING_DIR no está configurado")
+    
+    def _leer(self, desde: Optional[str], hasta: Optional[str]) -> pd.DataFrame:
+        """
+        Historial completo en staging de las cédulas con transacciones entre
+        `desde` y `hasta`, sin repetidas (misma clave), ordenado por cédula y fecha.
+        """
+        df = leer_staging(self.directorio)
+        if desde or hasta:
+            # El rango solo elige a los miembros: los totales son de todo su historial
+            cedulas = leer_staging(self.directorio, desde, hasta, columnas=["cedula"])["cedula"].unique()
+            df = df[df["cedula"].isin(cedulas)]
+        df = df.drop_duplicates("clave")
+        
+        return df.sort_values(["cedula", "fecha"], kind="stable").reset_index(drop=True)
+    
+    @staticmethod
+    def _documentos(df: pd.DataFrame) -> List[dict]:
+        """Filas de staging como documentos de la colección transacciones."""
+        columnas = {campo: df[campo].tolist() for campo in esquema().names}
+        columnas["fecha"] = df["fecha"].to_numpy().astype("datetime64[us]").astype(object).tolist()
+        
+        return [dict(zip(columnas, valores)) for valores in zip(*columnas.values())]
+    
+    async def _ids_transacciones(self, lote: pd.DataFrame, stats: dict) -> Dict[str, object]:
+        """
+        _id de las transacciones del lote en la colección transacciones
+        (por clave); las que no están se insertan.
+        """
+        ids = {}
+        async for tx in self.db.transacciones.find(
+            {"clave": {"$in": lote["clave"].tolist()}},
+            {"clave": 1}
+        ):
+            ids[tx["clave"]] = tx["_id"]
+        
+        faltantes = lote[~lote["clave"].isin(ids)]
+        if faltantes.empty:
+            return ids
+        
+        # insert_many asigna el _id en cada documento
+        documentos = self._documentos(faltantes)
+        fallidas = set()
+        try:
+            await self.db.transacciones.insert_many(documentos, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                fallidas.add(error["index"])
+                stats["errores"].append(
+                    f"Error insertando transacción {documentos[error['index']]['clave']}: {error.get('errmsg')}"
+                )
+        
+        for i, documento in enumerate(documentos):
+            if i not in fallidas:
+                ids[documento["clave"]] = documento["_id"]
+        stats["transacciones_insertadas"] += len(documentos) - len(fallidas)
+        
+        return ids
+    
+    async def _sin_staging(self, lote: pd.DataFrame) -> Tuple[int, List[str]]:
+        """
+        Transacciones de la colección de las cédulas del lote que no están
+        en staging (cargadas antes de STAGING_DIR o sin clave).
+        
+        Returns:
+            Tuple[cantidad, cédulas afectadas]
+        """
+        claves = set(lote["clave"])
+        cantidad = 0
+        cedulas = set()
+        
+        async for tx in self.db.transacciones.find(
+            {"cedula": {"$in": lote["cedula"].unique().tolist()}},
+            {"_id": 0, "cedula": 1, "clave": 1}
+        ):
+            if tx.get("clave") not in claves:
+                cantidad += 1
+                cedulas.add(tx["cedula"])
+        
+        return cantidad, sorted(cedulas)
+    
+    async def _suscripciones(self, coleccion: str, cedulas: List[str]) -> np.ndarray:
+        """Fecha de suscripción guardada de cada cédula (NaT si no tiene)."""
+        indices = {cedula: i for i, cedula in enumerate(cedulas)}
+        fechas = np.full(len(cedulas), np.datetime64("NaT", "us"))
+        
+        async for doc in self.db[coleccion].find(
+            {"cedula": {"$in": cedulas}},
+            {"cedula": 1, "fecha_suscripcion": 1}
+        ):
+            if doc.get("fecha_suscripcion"):
+                fechas[indices[doc["cedula"]]] = np.datetime64(doc["fecha_suscripcion"], "us")
+        
+        return fechas
+    
+    async def _escribir(self, coleccion: str, operaciones: List[UpdateOne], cedulas: List[str], stats: dict) -> None:
+        try:
+            await self.db[coleccion].bulk_write(operaciones, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                stats["errores"].append(
+                    f"Error actualizando {coleccion} {cedulas[error['index']]}: {error.get('errmsg')}"
+                )
+        
+        await self.canje.sincronizar(coleccion, cedulas)
+        await invalidar_cedulas(self.cache, coleccion, cedulas)
+    
+    async def _replay_lote(self, lote: pd.DataFrame, stats: dict) -> None:
+        """Recalcula y reemplaza los users y clientes de las cédulas de un lote."""
+        ahora = datetime.now()
+        ids = await self._ids_transacciones(lote, stats)
+        
+        # Filas ordenadas por cédula: índice del miembro de cada transacción
+        inicio_grupo = np.r_[True, lote["cedula"].to_numpy()[1:] != lote["cedula"].to_numpy()[:-1]]
+        miembro = np.cumsum(inicio_grupo) - 1
+        cedulas = lote["cedula"][inicio_grupo].tolist()
+        
+        # Los datos de contacto de la transacción más reciente prevalecen
+        ultimas = lote.groupby(miembro).tail(1)
+        contactos = [
+            {"nombre": nombre, "telefono": telefono, "correo": correo}
+            for nombre, telefono, correo in zip(
+                ultimas["nombre_razon_social"], ultimas["telefono"], ultimas["correo_electronico"]
+            )
+        ]
+        
+        # Historial embebido de users: las más recientes, con el _id de transacciones
+        recientes: List[List[dict]] = [[] for _ in cedulas]
+        filas = lote.groupby(miembro).tail(self.transacciones_recientes)
+        for i, tx in zip(miembro[filas.index], self._documentos(filas)):
+            if tx["clave"] in ids:
+                recientes[i].append({
+                    "transaccion_id": str(ids[tx["clave"]]),
+                    "fecha": tx["fecha"],
+                    "tienda": tx["tienda"],
+                    "articulo": tx["articulo"],
+                    "cantidad": tx["cantidad"],
+                    "monto": tx["divisas_venta"],
+                    "puntos_generados": tx["puntos_generados"],
+                })
+        
+        for coleccion in ("users", "clientes"):
+            # La suscripción guardada se conserva; si no hay, la primera transacción
+            calculados = calculo_puntos.a_documentos(calculo_puntos.calcular_lote(
+                miembro=miembro,
+                fechas=lote["fecha"].to_numpy(),
+                puntos=lote["puntos_generados"].to_numpy(),
+                montos=lote["divisas_venta"].to_numpy(),
+                n_miembros=len(cedulas),
+                fechas_suscripcion=await self._suscripciones(coleccion, cedulas),
+                ahora=ahora,
+            ))
+            
+            if coleccion == "users":
+                operaciones = [
+                    UpdateOne(
+                        {"cedula": cedula},
+                        {
+                            "$set": {
+                                **contacto,
+                                **calculado,
+                                "transacciones": transacciones,
+                                "ultima_actualizacion": ahora,
+                            },
+                            "$setOnInsert": {"fecha_registro": ahora},
+                        },
+                        upsert=True
+                    )
+                    for cedula, contacto, calculado, transacciones in zip(cedulas, contactos, calculados, recientes)
+                ]
+            else:
+                operaciones = [
+                    UpdateOne(
+                        {"cedula": cedula},
+                        {"$set": {"cedula": cedula, **contacto, **calculado, "ultima_actualizacion": ahora}},
+                        upsert=True
+                    )
+                    for cedula, contacto, calculado in zip(cedulas, contactos, calculados)
+                ]
+            
+            await self._escribir(coleccion, operaciones, cedulas, stats)
+        
+        stats["miembros"] += len(cedulas)
+    
+    async def replay(
+        self,
+        desde: Optional[str] = None,
+        hasta: Optional[str] = None,
+        batch_size: int = 1000
+    ) -> dict:
+        """
+        Reconstruye users y clientes desde las transacciones en staging,
+        sin volver a leer los Excel (ej. tras corregir una regla de nivel).
+        
+        Cada miembro con transacciones en staging se recalcula con todo su
+        historial de staging y se reemplaza; los demás no se tocan. Las
+        transacciones que no están en la colección transacciones (ej. base
+        restaurada) se insertan.
+        
+        Antes de escribir se verifica que la colección no tenga transacciones
+        de esos miembros fuera del staging: el reemplazo las perdería.
+        
+        Args:
+            desde, hasta: Meses "YYYY-MM" (inclusive): solo se reconstruyen
+                los miembros con transacciones en ese rango, siempre con todo
+                su historial
+            batch_size: Miembros por lote
+        
+        Returns:
+            Estadísticas: transacciones, transacciones_insertadas, miembros, lotes, errores
+        
+        Raises:
+            RuntimeError: si algún miembro tiene transacciones que no están
+                en staging (ejecute manage.py exportar-staging)
+        """
+        df = await run_in_threadpool(self._leer, desde, hasta)
+        
+        stats = {
+            "transacciones": len(df),
+            "transacciones_insertadas": 0,
+            "miembros": 0,
+            "lotes": 0,
+            "errores": [],
+        }
+        
+        if df.empty:
+            return stats
+        
+        # Primera fila de cada cédula: los lotes no parten a un miembro
+        inicios = np.flatnonzero(np.r_[True, df["cedula"].to_numpy()[1:] != df["cedula"].to_numpy()[:-1]])
+        limites = np.r_[inicios[::batch_size], len(df)]
+        lotes = [df.iloc[inicio:fin].reset_index(drop=True) for inicio, fin in zip(limites[:-1], limites[1:])]
+        
+        # Todo o nada: se verifica antes de reemplazar a cualquier miembro
+        faltantes = 0
+        afectadas: List[str] = []
+        for lote in lotes:
+            cantidad, cedulas = await self._sin_staging(lote)
+            faltantes += cantidad
+            afectadas.extend(cedulas)
+        
+        if faltantes:
+            raise RuntimeError(
+                f"{faltantes} transacciones de {len(afectadas)} miembros no están en staging "
+                f"(ej. {', '.join(afectadas[:5])}): ejecute manage.py migrar-claves y "
+                f"exportar-staging antes del replay"
+            )
+        
+        for lote in lotes:
+            await self._replay_lote(lote, stats)
+            stats["lotes"] += 1
+        
+        return stats
+    
+    async def exportar(self, batch_size: int = 5000) -> dict:
+        """
+        Copia la colección transacciones al staging, para las cargas
+        anteriores a STAGING_DIR. Reemplaza la exportación anterior.
+        
+        Las transacciones sin clave natural se omiten (manage.py migrar-claves).
+        
+        Returns:
+            Estadísticas: transacciones, sin_clave, lotes
+        """
+        escritor = EscritorStaging(self.directorio, "exportado")
+        stats = {"transacciones": 0, "lotes": 0}
+        
+        proyeccion = {campo: 1 for campo in esquema().names}
+        proyeccion["_id"] = 0
+        
+        try:
+            lote = []
+            async for tx in self.db.transacciones.find(
+                {"clave": {"$exists": True}},
+                proyeccion
+            ).batch_size(batch_size):
+                lote.append(tx)
+                
+                if len(lote) >= batch_size:
+                    await run_in_threadpool(escritor.escribir, lote)
+                    stats["transacciones"] += len(lote)
+                    stats["lotes"] += 1
+                    lote = []
+            
+            if lote:
+                await run_in_threadpool(escritor.escribir, lote)
+                stats["transacciones"] += len(lote)
+                stats["lotes"] += 1
+        except BaseException:
+            escritor.descartar()
+            raise
+        
+        escritor.cerrar()
+        stats["sin_clave"] = await self.db.transacciones.count_documents({"clave": {"$exists": False}})
+        
+        return stats
@@ -1,8 +1,17 @@
-from datetime import datetime, timedelta
-from typing import Optional, List, Tuple
+import numpy as np
+from datetime import datetime
+from typing import Optional, List, Tuple, Dict, Set
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
-from app.models.user import User, UserPuntosResponse, TransaccionResumen, NivelFidelizacion
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from app.config import get_settings
+from app.services.paginacion import decodificar_cursor, filtro_keyset, cortar_pagina
+from app.services.cache import get_cache_puntos, clave_puntos, clave_listado, invalidar_cedulas
+from app.services.canje_service import CanjeService
+from app.services import calculo_puntos
+from app.models.user import User, TransaccionResumen, NivelFidelizacion
+from app.respuestas import campos_puntos
 
 
 class UserService:
@@ -10,73 +19,353 @@ class UserService:
     
     def __init__(self, db: AsyncIOMotorDatabase):
         self.db = db
+        # El historial completo vive en la colección transacciones; el
+        # usuario solo guarda las más recientes
+        self.transacciones_recientes = get_settings().transacciones_recientes
+        self.cache = get_cache_puntos()
+        self.canje = CanjeService(db)
+    
+    # Reglas de puntos: ver app/services/calculo_puntos.py
     
     @staticmethod
     def calcular_nivel(compras_totales: int, total_gastado: float) -> NivelFidelizacion:
+        """Calcula el nivel de fidelización (ver calculo_puntos.calcular_nivel)."""
+        return calculo_puntos.calcular_nivel(compras_totales, total_gastado)
+    
+    @staticmethod
+    def calcular_periodo(
+        fecha_suscripcion: datetime,
+        ahora: Optional[datetime] = None
+    ) -> Tuple[datetime, datetime]:
         """
-        Calcula el nivel de fidelización según las reglas:
-        - Kilobytes: Sin historial de compra
-        - MegaBytes: ≥3 compras o ≥$500 gastado
-        - GigaBytes: ≥8 compras o ≥$1500 gastado
-        - TeraBytes: ≥13 compras o ≥$3000 gastado
-        """
-        if compras_totales == 0 and total_gastado == 0:
-            return "Kilobytes"
+        Calcula el período vigente actual a partir de la fecha de suscripción.
         
-        if total_gastado >= 3000 or compras_totales >= 13:
-            return "TeraBytes"
-        elif total_gastado >= 1500 or compras_totales >= 8:
-            return "GigaBytes"
-        elif total_gastado >= 500 or compras_totales >= 3:
-            return "MegaBytes"
-        
-        return "Kilobytes"
+        Returns:
+            Tuple[inicio_periodo, fin_periodo]
+        """
+        return calculo_puntos.calcular_periodo(fecha_suscripcion, ahora)
     
     @staticmethod
     def calcular_puntos_vigentes(
         transacciones: List[TransaccionResumen],
         fecha_suscripcion: datetime
     ) -> int:
+        """Calcula los puntos vigentes (dentro del año de suscripción en curso)."""
+        return calculo_puntos.calcular_puntos_vigentes(
+            ((tx.fecha, tx.puntos_generados) for tx in transacciones),
+            fecha_suscripcion
+        )
+    
+    @staticmethod
+    def calcular_puntos_canje(puntos_vigentes: int) -> Tuple[int, float]:
+        """
+        Calcula puntos listos para canje y su equivalente en dólares.
+        
+        Returns:
+            Tuple[puntos_listos_canje, dolares_canjeables]
+        """
+        return calculo_puntos.calcular_puntos_canje(puntos_vigentes)
+    
+    # Campos de UserPuntosResponse: las consultas de puntos no traen el
+    # historial embebido
+    PROYECCION_PUNTOS = {
+        "_id": 0,
+        "cedula": 1,
+        "nombre": 1,
+        "nivel": 1,
+        "puntos_totales": 1,
+        "puntos_vigentes": 1,
+        "puntos_listos_canje": 1,
+        "dolares_canjeables": 1,
+    }
+    
+    # Listado general: los de puntos más contacto y totales
+    PROYECCION_LISTADO = {
+        **PROYECCION_PUNTOS,
+        "telefono": 1,
+        "correo": 1,
+        "total_gastado": 1,
+        "compras_totales": 1,
+    }
+    
+    # Recalcula nivel y canje en el servidor a partir de los totales ya incrementados
+    PIPELINE_DERIVADOS = calculo_puntos.PIPELINE_DERIVADOS
+    
+    def _operacion_incremental(
+        self,
+        user: dict,
+        contacto: dict,
+        resumenes: List[dict]
+    ) -> UpdateOne:
+        """
+        Construye el $push/$inc que agrega transacciones a un usuario cuyo
+        período vigente está guardado y sigue en curso.
+        
+        El filtro exige el mismo fin_periodo leído, de modo que un cambio de
+        período concurrente no aplica el incremento. Los duplicados no se
+        detectan aquí: el historial embebido está recortado a
+        transacciones_recientes ($slice) y el $nin solo cubre ese tramo. Las
+        transacciones llegan recién insertadas en la colección transacciones,
+        cuyo índice único (clave en las cargas, _id en
+        agregar_transaccion_a_usuario) ya rechazó las repetidas.
+        """
+        inicio_periodo = user["inicio_periodo"]
+        fin_periodo = user["fin_periodo"]
+        
+        puntos_vigentes = sum(
+            tx["puntos_generados"] for tx in resumenes
+            if inicio_periodo <= tx["fecha"] < fin_periodo
+        )
+        
+        incremento = {"total_gastado": 0, "compras_totales": 0, "puntos_totales": 0}
+        for tx in resumenes:
+            incremento["total_gastado"] += tx["monto"]
+            incremento["compras_totales"] += 1
+            incremento["puntos_totales"] += tx["puntos_generados"]
+        incremento["puntos_vigentes"] = puntos_vigentes
+        
+        return UpdateOne(
+            {
+                "cedula": user["cedula"],
+                "fin_periodo": fin_periodo,
+                "transacciones.transaccion_id": {"$nin": [tx["transaccion_id"] for tx in resumenes]},
+            },
+            {
+                "$push": {
+                    "transacciones": {
+                        "$each": resumenes,
+                        "$sort": {"fecha": 1},
+                        "$slice": -self.transacciones_recientes,
+                    }
+                },
+                "$inc": incremento,
+                "$set": {**contacto, "ultima_actualizacion": datetime.now()},
+            }
+        )
+    
+    async def _aplicar_resumenes(
+        self,
+        grupos: Dict[str, Tuple[dict, List[dict]]]
+    ) -> Tuple[Set[str], List[str]]:
         """
-        Calcula los puntos vigentes (dentro del año de suscripción).
-        Los puntos tienen vigencia de 1 año desde la fecha de suscripción.
+        Agrega transacciones (en formato TransaccionResumen) a sus usuarios.
+        
+        Los usuarios con período vigente guardado y en curso se actualizan de
+        forma incremental ($push + $inc y un pipeline para nivel y canje),
+        sin leer su historial. Los usuarios nuevos, los que no tienen período
+        guardado o cuyo período terminó se recalculan con el historial completo.
+        
+        Args:
+            grupos: cedula -> (datos de contacto, resúmenes de transacción)
+            
+        Returns:
+            Tuple[cedulas_actualizadas, errores]
         """
+        errores = []
+        actualizadas = set()
         ahora = datetime.now()
         
-        # Calcular el inicio del período vigente actual
-        años_transcurridos = (ahora - fecha_suscripcion).days // 365
-        inicio_periodo = fecha_suscripcion + timedelta(days=365 * años_transcurridos)
-        fin_periodo = inicio_periodo + timedelta(days=365)
+        # Solo campos escalares: el historial no se transfiere
+        existentes = {}
+        async for user in self.db.users.find(
+            {"cedula": {"$in": list(grupos)}},
+            {"cedula": 1, "inicio_periodo": 1, "fin_periodo": 1}
+        ):
+            existentes[user["cedula"]] = user
         
-        # Si ya pasó el período, reiniciar
-        if ahora > fin_periodo:
-            return 0
+        incrementales = []
+        operaciones = []
+        completas = set()
         
-        # Sumar puntos de transacciones dentro del período vigente
-        puntos = 0
-        for tx in transacciones:
-            if inicio_periodo <= tx.fecha < fin_periodo:
-                puntos += tx.puntos_generados
+        for cedula, (contacto, resumenes) in grupos.items():
+            user = existentes.get(cedula)
+            
+            if user and user.get("fin_periodo") and user["fin_periodo"] > ahora:
+                operaciones.append(self._operacion_incremental(user, contacto, resumenes))
+                incrementales.append(cedula)
+            else:
+                completas.add(cedula)
+        
+        if operaciones:
+            try:
+                resultado = await self.db.users.bulk_write(operaciones, ordered=False)
+                aplicadas = resultado.matched_count
+            except BulkWriteError as e:
+                aplicadas = e.details.get("nMatched", 0)
+                for error in e.details.get("writeErrors", []):
+                    cedula = incrementales[error["index"]]
+                    errores.append(f"Error actualizando usuario {cedula}: {error.get('errmsg')}")
+                    incrementales[error["index"]] = None
+            incrementales = [cedula for cedula in incrementales if cedula]
+            
+            # Las que no coincidieron (duplicadas o período cambiado) se recalculan
+            # completas. Se confirman solo las que tienen todas las transacciones
+            # del grupo: con una ya cargada el filtro $nin no aplicó las demás. Las
+            # que el $slice dejó fuera también se recalculan (los totales se
+            # reemplazan, no se suman)
+            if aplicadas < len(incrementales):
+                confirmadas = set()
+                async for user in self.db.users.find(
+                    {"$or": [
+                        {
+                            "cedula": cedula,
+                            "transacciones.transaccion_id": {
+                                "$all": [tx["transaccion_id"] for tx in grupos[cedula][1]]
+                            },
+                        }
+                        for cedula in incrementales
+                    ]},
+                    {"cedula": 1}
+                ):
+                    confirmadas.add(user["cedula"])
+                completas.update(c for c in incrementales if c not in confirmadas)
+                incrementales = [c for c in incrementales if c in confirmadas]
+            
+            if incrementales:
+                await self.db.users.update_many(
+                    {"cedula": {"$in": incrementales}},
+                    self.PIPELINE_DERIVADOS
+                )
+                actualizadas.update(incrementales)
+        
+        if completas:
+            cedulas, errores_completas = await self._recalcular_usuarios(
+                {cedula: grupos[cedula] for cedula in completas}
+            )
+            actualizadas.update(cedulas)
+            errores.extend(errores_completas)
         
-        return puntos
+        await self.canje.sincronizar("users", actualizadas)
+        
+        return actualizadas, errores
     
-    @staticmethod
-    def calcular_puntos_canje(puntos_vigentes: int) -> Tuple[int, float]:
+    async def _historial_usuarios(self, cedulas: List[str]) -> Dict[str, List[dict]]:
         """
-        Calcula puntos listos para canje y su equivalente en dólares.
-        - Mínimo 500 puntos para canjear
-        - 50 puntos = $1
+        Lee el historial completo de varios usuarios desde la colección
+        transacciones (índice cedula + fecha), en formato TransaccionResumen.
+        """
+        historial: Dict[str, List[dict]] = {}
+        
+        cursor = self.db.transacciones.find(
+            {"cedula": {"$in": cedulas}},
+            {
+                "cedula": 1,
+                "fecha": 1,
+                "tienda": 1,
+                "articulo": 1,
+                "cantidad": 1,
+                "divisas_venta": 1,
+                "puntos_generados": 1,
+            }
+        ).sort([("cedula", 1), ("fecha", 1)])
+        
+        async for tx in cursor:
+            historial.setdefault(tx["cedula"], []).append({
+                "transaccion_id": str(tx["_id"]),
+                "fecha": tx["fecha"],
+                "tienda": tx.get("tienda", ""),
+                "articulo": tx.get("articulo", ""),
+                "cantidad": tx.get("cantidad", 1),
+                "monto": tx.get("divisas_venta", 0),
+                "puntos_generados": tx.get("puntos_generados", 0),
+            })
+        
+        return historial
+    
+    async def _recalcular_usuarios(
+        self,
+        grupos: Dict[str, Tuple[dict, List[dict]]]
+    ) -> Tuple[Set[str], List[str]]:
+        """
+        Agrega transacciones recalculando todo a partir del historial completo
+        de la colección transacciones y aplica un único bulk_write de upserts.
         
         Returns:
-            Tuple[puntos_listos_canje, dolares_canjeables]
+            Tuple[cedulas_actualizadas, errores]
         """
-        if puntos_vigentes < 500:
-            return 0, 0.0
+        errores = []
+        ahora = datetime.now()
+        cedulas = list(grupos)
+        
+        existentes = {}
+        async for user in self.db.users.find(
+            {"cedula": {"$in": cedulas}},
+            {"cedula": 1, "fecha_suscripcion": 1}
+        ):
+            existentes[user["cedula"]] = user
+        
+        historiales = await self._historial_usuarios(cedulas)
+        
+        # Historial de cada usuario más los resúmenes que aún no están en
+        # la colección (evitar duplicados)
+        fechas_suscripcion = []
+        for cedula, (_, resumenes) in grupos.items():
+            historial = historiales.get(cedula, [])
+            tx_ids = {tx["transaccion_id"] for tx in historial}
+            faltantes = [tx for tx in resumenes if tx["transaccion_id"] not in tx_ids]
+            if faltantes:
+                historiales[cedula] = sorted(historial + faltantes, key=lambda tx: tx["fecha"])
+            
+            # Primera compra = fecha suscripción
+            user = existentes.get(cedula)
+            if user:
+                fechas_suscripcion.append(user.get("fecha_suscripcion", ahora))
+            else:
+                fechas_suscripcion.append(resumenes[0]["fecha"])
+        
+        # Cálculo de todos los usuarios del lote a la vez
+        transacciones = [
+            (i, tx) for i, cedula in enumerate(cedulas) for tx in historiales.get(cedula, [])
+        ]
+        calculados = calculo_puntos.a_documentos(calculo_puntos.calcular_lote(
+            miembro=[i for i, _ in transacciones],
+            fechas=[tx["fecha"] for _, tx in transacciones],
+            puntos=[tx["puntos_generados"] for _, tx in transacciones],
+            montos=[tx["monto"] for _, tx in transacciones],
+            n_miembros=len(cedulas),
+            fechas_suscripcion=fechas_suscripcion,
+            ahora=ahora,
+        ))
+        
+        operaciones = []
+        cedulas_ops = []
+        
+        for cedula, fecha_suscripcion, calculado in zip(cedulas, fechas_suscripcion, calculados):
+            contacto, _ = grupos[cedula]
+            # La suscripción guardada no cambia; el resto se reemplaza
+            del calculado["fecha_suscripcion"]
+            
+            operaciones.append(UpdateOne(
+                {"cedula": cedula},
+                {
+                    "$set": {
+                        **contacto,
+                        **calculado,
+                        "transacciones": historiales.get(cedula, [])[-self.transacciones_recientes:],
+                        "ultima_actualizacion": ahora,
+                    },
+                    "$setOnInsert": {
+                        "fecha_registro": ahora,
+                        "fecha_suscripcion": fecha_suscripcion,
+                    },
+                },
+                upsert=True
+            ))
+            cedulas_ops.append(cedula)
+        
+        if not operaciones:
+            return set(), errores
         
-        puntos_listos = (puntos_vigentes // 500) * 500
-        dolares = puntos_listos / 50
+        fallidas = set()
+        try:
+            await self.db.users.bulk_write(operaciones, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                cedula = cedulas_ops[error["index"]]
+                fallidas.add(cedula)
+                errores.append(f"Error actualizando usuario {cedula}: {error.get('errmsg')}")
         
-        return puntos_listos, dolares
+        return {c for c in cedulas_ops if c not in fallidas}, errores
     
     async def agregar_transaccion_a_usuario(
         self,
@@ -94,10 +383,30 @@ class UserService:
     ) -> dict:
         """
         Agrega una transacción a un usuario existente o crea uno nuevo.
-        Recalcula puntos y nivel automáticamente.
+        Actualiza puntos y nivel de forma incremental.
+        
+        La transacción se guarda primero en la colección transacciones con
+        _id = transaccion_id: si ya estaba (repetida) se ignora. El historial
+        embebido solo tiene las más recientes y no sirve para detectarla.
         """
-        # Buscar usuario existente
-        user = await self.db.users.find_one({"cedula": cedula})
+        # Guardar en el historial: el _id único rechaza la repetida
+        documento = {
+            "_id": ObjectId(transaccion_id) if ObjectId.is_valid(transaccion_id) else transaccion_id,
+            "tienda": tienda,
+            "fecha": fecha,
+            "cedula": cedula,
+            "nombre_razon_social": nombre,
+            "telefono": telefono,
+            "correo_electronico": correo,
+            "articulo": articulo,
+            "cantidad": cantidad,
+            "divisas_venta": monto,
+            "puntos_generados": puntos_generados,
+        }
+        try:
+            await self.db.transacciones.insert_one(documento)
+        except DuplicateKeyError:
+            return {"cedula": cedula, "actualizado": False}
         
         # Crear resumen de transacción
         tx_resumen = {
@@ -109,159 +418,417 @@ class UserService:
             "monto": monto,
             "puntos_generados": puntos_generados
         }
+        contacto = {"nombre": nombre, "telefono": telefono, "correo": correo}
         
-        if user:
-            # Usuario existe - agregar transacción y actualizar
-            transacciones = user.get("transacciones", [])
-            
-            # Verificar si la transacción ya existe (evitar duplicados)
-            tx_ids = [tx.get("transaccion_id") for tx in transacciones]
-            if transaccion_id not in tx_ids:
-                transacciones.append(tx_resumen)
-            
-            # Recalcular totales
-            total_gastado = sum(tx.get("monto", 0) for tx in transacciones)
-            compras_totales = len(transacciones)
-            puntos_totales = sum(tx.get("puntos_generados", 0) for tx in transacciones)
-            
-            # Convertir a objetos TransaccionResumen para cálculo
-            tx_objetos = [
-                TransaccionResumen(
-                    transaccion_id=tx["transaccion_id"],
-                    fecha=tx["fecha"] if isinstance(tx["fecha"], datetime) else datetime.fromisoformat(str(tx["fecha"])),
-                    tienda=tx["tienda"],
-                    articulo=tx["articulo"],
-                    cantidad=tx["cantidad"],
-                    monto=tx["monto"],
-                    puntos_generados=tx["puntos_generados"]
-                )
-                for tx in transacciones
-            ]
-            
-            fecha_suscripcion = user.get("fecha_suscripcion", datetime.now())
-            puntos_vigentes = self.calcular_puntos_vigentes(tx_objetos, fecha_suscripcion)
-            puntos_listos_canje, dolares_canjeables = self.calcular_puntos_canje(puntos_vigentes)
-            nivel = self.calcular_nivel(compras_totales, total_gastado)
-            
-            # Actualizar usuario
-            await self.db.users.update_one(
-                {"cedula": cedula},
-                {
-                    "$set": {
-                        "nombre": nombre,
-                        "telefono": telefono,
-                        "correo": correo,
-                        "transacciones": transacciones,
-                        "total_gastado": total_gastado,
-                        "compras_totales": compras_totales,
-                        "puntos_totales": puntos_totales,
-                        "puntos_vigentes": puntos_vigentes,
-                        "puntos_listos_canje": puntos_listos_canje,
-                        "dolares_canjeables": dolares_canjeables,
-                        "nivel": nivel,
-                        "ultima_actualizacion": datetime.now()
-                    }
-                }
-            )
-            
-        else:
-            # Usuario nuevo
-            puntos_vigentes = puntos_generados  # Primera transacción
-            puntos_listos_canje, dolares_canjeables = self.calcular_puntos_canje(puntos_vigentes)
-            nivel = self.calcular_nivel(1, monto)
+        try:
+            _, errores = await self._aplicar_resumenes({cedula: (contacto, [tx_resumen])})
+        except Exception:
+            # Sin aplicar al usuario se quita del historial: se puede enviar de nuevo
+            await self.db.transacciones.delete_one({"_id": documento["_id"]})
+            raise
+        finally:
+            await invalidar_cedulas(self.cache, "users", [cedula])
+        
+        if errores:
+            await self.db.transacciones.delete_one({"_id": documento["_id"]})
+            raise RuntimeError(errores[0])
+        
+        return {"cedula": cedula, "actualizado": True}
+    
+    async def agregar_transacciones_a_usuarios(
+        self,
+        transacciones: List[dict]
+    ) -> Tuple[Set[str], List[str]]:
+        """
+        Agrega un lote de transacciones ya insertadas a sus usuarios.
+        
+        Solo deben llegar las que este mismo insert agregó a la colección (no
+        las rechazadas por la clave): el incremento no vuelve a verificar
+        duplicados contra el historial completo.
+        
+        Agrupa las transacciones por cédula y aplica las actualizaciones
+        con bulk_write (ver _aplicar_resumenes).
+        
+        Args:
+            transacciones: Documentos de la colección transacciones (con _id)
             
-            nuevo_user = {
-                "cedula": cedula,
-                "nombre": nombre,
-                "telefono": telefono,
-                "correo": correo,
-                "fecha_registro": datetime.now(),
-                "fecha_suscripcion": fecha,  # Primera compra = fecha suscripción
-                "puntos_totales": puntos_generados,
-                "puntos_vigentes": puntos_vigentes,
-                "puntos_listos_canje": puntos_listos_canje,
-                "dolares_canjeables": dolares_canjeables,
-                "nivel": nivel,
-                "transacciones": [tx_resumen],
-                "total_gastado": monto,
-                "compras_totales": 1,
-                "ultima_actualizacion": datetime.now()
+        Returns:
+            Tuple[cedulas_actualizadas, errores]
+        """
+        # Agrupar por cédula conservando el orden del archivo
+        grupos: Dict[str, Tuple[dict, List[dict]]] = {}
+        for tx in transacciones:
+            # Los datos de contacto de la última fila prevalecen
+            contacto = {
+                "nombre": tx["nombre_razon_social"],
+                "telefono": tx["telefono"],
+                "correo": tx["correo_electronico"],
+            }
+            resumen = {
+                "transaccion_id": str(tx["_id"]),
+                "fecha": tx["fecha"],
+                "tienda": tx["tienda"],
+                "articulo": tx["articulo"],
+                "cantidad": tx["cantidad"],
+                "monto": tx["divisas_venta"],
+                "puntos_generados": tx["puntos_generados"],
             }
             
-            await self.db.users.insert_one(nuevo_user)
+            _, resumenes = grupos.get(tx["cedula"], (None, []))
+            resumenes.append(resumen)
+            grupos[tx["cedula"]] = (contacto, resumenes)
         
-        return {"cedula": cedula, "actualizado": True}
+        if not grupos:
+            return set(), []
+        
+        try:
+            return await self._aplicar_resumenes(grupos)
+        finally:
+            await invalidar_cedulas(self.cache, "users", grupos)
     
-    async def obtener_user_puntos(self, cedula: str) -> Optional[UserPuntosResponse]:
-        """Obtiene información de puntos de un usuario por cédula."""
-        user = await self.db.users.find_one({"cedula": cedula})
+    async def obtener_user_puntos(self, cedula: str) -> Optional[dict]:
+        """
+        Obtiene información de puntos de un usuario por cédula, con los
+        campos de UserPuntosResponse.
+        
+        El resultado se guarda en la caché de puntos; las escrituras de
+        transacciones del usuario la invalidan.
+        """
+        clave = clave_puntos("users", cedula)
+        guardado = await self.cache.obtener(clave)
+        if guardado is not None:
+            return guardado
+        
+        user = await self.db.users.find_one({"cedula": cedula}, self.PROYECCION_PUNTOS)
         
         if not user:
             return None
         
-        return UserPuntosResponse(
-            cedula=user["cedula"],
-            nombre=user["nombre"],
-            nivel=user["nivel"],
-            puntos_totales=user["puntos_totales"],
-            puntos_vigentes=user["puntos_vigentes"],
-            puntos_listos_canje=user["puntos_listos_canje"],
-            dolares_canjeables=user["dolares_canjeables"],
-        )
+        respuesta = campos_puntos(user)
+        await self.cache.guardar(clave, respuesta)
+        
+        return respuesta
+    
+    async def obtener_users_puntos(self, cedulas: List[str]) -> Tuple[List[dict], List[str]]:
+        """
+        Obtiene los puntos de varios usuarios con una sola consulta $in
+        (índice único de cedula), sin pasar por la caché.
+        
+        Returns:
+            Tuple[usuarios encontrados en el orden de `cedulas`, cédulas no encontradas]
+        """
+        # Sin repetidas, conservando el orden
+        cedulas = list(dict.fromkeys(cedulas))
+        
+        encontrados = {}
+        async for user in self.db.users.find({"cedula": {"$in": cedulas}}, self.PROYECCION_PUNTOS):
+            encontrados[user["cedula"]] = user
+        
+        users = [campos_puntos(encontrados[cedula]) for cedula in cedulas if cedula in encontrados]
+        no_encontradas = [cedula for cedula in cedulas if cedula not in encontrados]
+        
+        return users, no_encontradas
     
     async def obtener_users_listos_canje(
         self,
         page: int = 1,
-        limit: int = 10
-    ) -> Tuple[List[UserPuntosResponse], int]:
+        limit: int = 10,
+        after: Optional[str] = None,
+        incluir_total: bool = True
+    ) -> Tuple[List[dict], Optional[int], Optional[str]]:
         """
-        Obtiene lista de usuarios con al menos 500 puntos vigentes.
+        Obtiene lista de usuarios con al menos 500 puntos vigentes desde
+        la vista canje_ready (ver CanjeService), con los campos de
+        UserPuntosResponse.
+        
+        Con `after` (cursor de la página anterior) la consulta continúa
+        desde el último (puntos_vigentes, cedula) sin usar skip; `page`
+        solo se usa para la primera consulta.
+        
+        Returns:
+            Tuple[lista_users, total (None si incluir_total es False), cursor_siguiente]
+            
+        Raises:
+            ValueError: si el cursor no es válido
         """
-        skip = (page - 1) * limit
-        filtro = {"puntos_vigentes": {"$gte": 500}}
+        clave = await clave_listado(self.cache, "users-canje", page, limit, after, incluir_total)
+        guardado = await self.cache.obtener(clave) if clave else None
+        if guardado is not None:
+            return guardado["users"], guardado["total"], guardado["siguiente"]
         
-        total = await self.db.users.count_documents(filtro)
+        documentos, total, siguiente = await self.canje.listar(
+            "users", page, limit, after, incluir_total
+        )
         
-        cursor = self.db.users.find(filtro).sort(
-            "puntos_vigentes", -1
-        ).skip(skip).limit(limit)
+        users = [campos_puntos(user) for user in documentos]
         
-        users = []
-        async for user in cursor:
-            users.append(UserPuntosResponse(
-                cedula=user["cedula"],
-                nombre=user["nombre"],
-                nivel=user["nivel"],
-                puntos_totales=user["puntos_totales"],
-                puntos_vigentes=user["puntos_vigentes"],
-                puntos_listos_canje=user["puntos_listos_canje"],
-                dolares_canjeables=user["dolares_canjeables"],
-            ))
+        if clave:
+            await self.cache.guardar(clave, {"users": users, "total": total, "siguiente": siguiente})
         
-        return users, total
+        return users, total, siguiente
     
     async def obtener_user_completo(self, cedula: str) -> Optional[dict]:
-        """Obtiene información completa de un usuario incluyendo transacciones."""
+        """Obtiene información completa de un usuario incluyendo sus transacciones recientes."""
         return await self.db.users.find_one({"cedula": cedula})
     
+    async def obtener_transacciones(
+        self,
+        cedula: str,
+        limit: int = 50,
+        after: Optional[str] = None
+    ) -> Tuple[List[dict], Optional[str]]:
+        """
+        Obtiene el historial de transacciones de un usuario, de la más
+        reciente a la más antigua, paginado por cursor sobre (fecha, _id).
+        
+        Args:
+            after: Cursor retornado por la página anterior
+            
+        Returns:
+            Tuple[transacciones, cursor_siguiente (None si no hay más)]
+            
+        Raises:
+            ValueError: si el cursor no es válido
+        """
+        orden = [("fecha", -1), ("_id", -1)]
+        filtro = {"cedula": cedula}
+        
+        if after:
+            filtro.update(filtro_keyset(orden, decodificar_cursor(after, len(orden))))
+        
+        cursor = self.db.transacciones.find(
+            filtro,
+            {
+                "fecha": 1,
+                "tienda": 1,
+                "articulo": 1,
+                "cantidad": 1,
+                "divisas_venta": 1,
+                "puntos_generados": 1,
+            }
+        ).sort(orden).limit(limit + 1)
+        
+        documentos, siguiente = cortar_pagina(
+            await cursor.to_list(length=limit + 1), limit, orden
+        )
+        
+        transacciones = [
+            {
+                "transaccion_id": str(tx["_id"]),
+                "fecha": tx["fecha"],
+                "tienda": tx.get("tienda", ""),
+                "articulo": tx.get("articulo", ""),
+                "cantidad": tx.get("cantidad", 1),
+                "monto": tx.get("divisas_venta", 0),
+                "puntos_generados": tx.get("puntos_generados", 0),
+            }
+            for tx in documentos
+        ]
+        
+        return transacciones, siguiente
+    
+    async def migrar_historial(self, batch_size: int = 500) -> dict:
+        """
+        Recorta el historial embebido de los usuarios existentes a las
+        transacciones más recientes (el historial completo ya está en la
+        colección transacciones). Procesa los usuarios por lotes de _id.
+        
+        Returns:
+            Estadísticas de la migración
+        """
+        limite = self.transacciones_recientes
+        # Usuarios con más transacciones embebidas que el límite
+        filtro = {f"transacciones.{limite}": {"$exists": True}}
+        
+        usuarios = 0
+        lotes = 0
+        ultimo_id = None
+        
+        while True:
+            filtro_lote = dict(filtro)
+            if ultimo_id is not None:
+                filtro_lote["_id"] = {"$gt": ultimo_id}
+            
+            ids = [
+                user["_id"] async for user in
+                self.db.users.find(filtro_lote, {"_id": 1}).sort("_id", 1).limit(batch_size)
+            ]
+            
+            if not ids:
+                break
+            
+            # Ordenar por fecha y conservar solo las últimas en el servidor
+            result = await self.db.users.update_many(
+                {"_id": {"$in": ids}},
+                {
+                    "$push": {
+                        "transacciones": {
+                            "$each": [],
+                            "$sort": {"fecha": 1},
+                            "$slice": -limite,
+                        }
+                    }
+                }
+            )
+            
+            usuarios += result.modified_count
+            lotes += 1
+            ultimo_id = ids[-1]
+        
+        return {"usuarios_migrados": usuarios, "lotes": lotes, "transacciones_recientes": limite}
+    
+    async def expirar_periodos(
+        self,
+        batch_size: int = 500,
+        ahora: Optional[datetime] = None
+    ) -> dict:
+        """
+        Vence los puntos de los usuarios cuyo período terminó.
+        
+        Solo lee los usuarios vencidos (índice fin_periodo) y los que no
+        tienen período guardado. Para cada lote calcula los períodos nuevos
+        (calculo_puntos), suma en una agregación los puntos de las
+        transacciones que caen en ellos y actualiza puntos vigentes, canje
+        y período con bulk_write.
+        Los totales y el nivel no dependen del período y no se modifican.
+        
+        Returns:
+            Estadísticas del proceso
+        """
+        ahora = ahora or datetime.now()
+        stats = {
+            "usuarios_expirados": 0,
+            "puntos_vencidos": 0,
+            "salieron_de_canje": 0,
+            "lotes": 0,
+            "omitidos": 0,
+        }
+        # Usuarios que cambiaron durante el proceso: no se reintentan
+        omitidos: Set[str] = set()
+        
+        while True:
+            filtro = {"$or": [{"fin_periodo": {"$lte": ahora}}, {"fin_periodo": None}]}
+            if omitidos:
+                filtro["cedula"] = {"$nin": list(omitidos)}
+            
+            vencidos = await self.db.users.find(
+                filtro,
+                {"cedula": 1, "fecha_suscripcion": 1, "fecha_registro": 1, "fin_periodo": 1, "puntos_vigentes": 1}
+            ).sort("fin_periodo", 1).limit(batch_size).to_list(length=batch_size)
+            
+            if not vencidos:
+                break
+            
+            cedulas = [user["cedula"] for user in vencidos]
+            inicios, fines = calculo_puntos.calcular_periodos(
+                np.array([
+                    user.get("fecha_suscripcion") or user.get("fecha_registro") or ahora
+                    for user in vencidos
+                ], dtype="datetime64[us]"),
+                ahora
+            )
+            periodos = dict(zip(cedulas, zip(inicios.astype(object), fines.astype(object))))
+            
+            # Puntos de cada usuario dentro de su período nuevo
+            vigentes = {}
+            async for fila in self.db.transacciones.aggregate([
+                {"$match": {"$or": [
+                    {"cedula": cedula, "fecha": {"$gte": inicio, "$lt": fin}}
+                    for cedula, (inicio, fin) in periodos.items()
+                ]}},
+                {"$group": {"_id": "$cedula", "puntos": {"$sum": "$puntos_generados"}}},
+            ]):
+                vigentes[fila["_id"]] = fila["puntos"]
+            
+            puntos_vigentes = np.array([vigentes.get(cedula, 0) for cedula in cedulas], dtype=np.int64)
+            puntos_listos_canje, dolares_canjeables = calculo_puntos.calcular_canje(puntos_vigentes)
+            
+            operaciones = []
+            for i, user in enumerate(vencidos):
+                inicio, fin = periodos[user["cedula"]]
+                operaciones.append(UpdateOne(
+                    # Si una carga lo modificó mientras tanto, ya quedó al día
+                    {"cedula": user["cedula"], "fin_periodo": user.get("fin_periodo")},
+                    {"$set": {
+                        "inicio_periodo": inicio,
+                        "fin_periodo": fin,
+                        "puntos_vigentes": int(puntos_vigentes[i]),
+                        "puntos_listos_canje": int(puntos_listos_canje[i]),
+                        "dolares_canjeables": float(dolares_canjeables[i]),
+                        "ultima_actualizacion": datetime.now(),
+                    }}
+                ))
+            
+            resultado = await self.db.users.bulk_write(operaciones, ordered=False)
+            
+            canje = await self.canje.sincronizar("users", cedulas)
+            await invalidar_cedulas(self.cache, "users", cedulas)
+            
+            omitidos_lote = set()
+            if resultado.matched_count < len(operaciones):
+                actualizados = {
+                    user["cedula"] async for user in self.db.users.find(
+                        {"cedula": {"$in": cedulas}, "fin_periodo": {"$gt": ahora}},
+                        {"cedula": 1}
+                    )
+                }
+                omitidos_lote = {c for c in cedulas if c not in actualizados}
+                omitidos.update(omitidos_lote)
+            
+            stats["usuarios_expirados"] += resultado.matched_count
+            stats["puntos_vencidos"] += sum(
+                max(user.get("puntos_vigentes", 0) - vigentes.get(user["cedula"], 0), 0)
+                for user in vencidos if user["cedula"] not in omitidos_lote
+            )
+            stats["salieron_de_canje"] += canje["eliminados"]
+            stats["lotes"] += 1
+        
+        stats["omitidos"] = len(omitidos)
+        return stats
+    
     async def obtener_todos_users(
         self,
         page: int = 1,
-        limit: int = 50
-    ) -> Tuple[List[dict], int]:
+        limit: int = 50,
+        after: Optional[str] = None
+    ) -> Tuple[List[dict], int, Optional[str]]:
         """
-        Obtiene todos los usuarios con paginación.
+        Obtiene todos los usuarios ordenados por nombre con paginación.
+        
+        Con `after` (cursor de la página anterior) la consulta continúa
+        desde el último (nombre, cedula) sin usar skip. El total es el
+        estimado de los metadatos de la colección.
+        
+        Returns:
+            Tuple[lista_users, total_estimado, cursor_siguiente]
+            
+        Raises:
+            ValueError: si el cursor no es válido
         """
-        skip = (page - 1) * limit
+        clave = await clave_listado(self.cache, "users", page, limit, after)
+        guardado = await self.cache.obtener(clave) if clave else None
+        if guardado is not None:
+            return guardado["users"], guardado["total"], guardado["siguiente"]
+        
+        orden = [("nombre", 1), ("cedula", 1)]
+        filtro = {}
+        
+        total = await self.db.users.estimated_document_count()
         
-        total = await self.db.users.count_documents({})
+        if after:
+            filtro.update(filtro_keyset(orden, decodificar_cursor(after, len(orden))))
+            cursor = self.db.users.find(filtro, self.PROYECCION_LISTADO).sort(orden).limit(limit + 1)
+        else:
+            cursor = self.db.users.find(filtro, self.PROYECCION_LISTADO).sort(orden).skip(
+                (page - 1) * limit
+            ).limit(limit + 1)
         
-        cursor = self.db.users.find({}).sort(
-            "nombre", 1
-        ).skip(skip).limit(limit)
+        documentos, siguiente = cortar_pagina(
+            await cursor.to_list(length=limit + 1), limit, orden
+        )
         
         users = []
-        async for user in cursor:
+        for user in documentos:
             users.append({
                 "cedula": user["cedula"],
                 "nombre": user["nombre"],
@@ -276,4 +843,7 @@ class UserService:
                 "compras_totales": user.get("compras_totales", 0),
             })
         
-        return users, total
+        if clave:
+            await self.cache.guardar(clave, {"users": users, "total": total, "siguiente": siguiente})
+        
+        return users, total, siguiente
@@ -0,0 +1,136 @@
+"""
+Benchmark de lectura de Excel: pd.read_excel (openpyxl completo) contra los
+motores de LectorTransacciones (openpyxl read_only y python-calamine).
+
+Cada variante lee y normaliza el mismo libro en un proceso aparte, para
+medir también su memoria máxima.
+
+Uso:
+    python benchmarks/bench_excel.py
+    python benchmarks/bench_excel.py --filas 100000
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import multiprocessing
+import importlib.util
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def generar_libro(ruta: str, filas: int, seed: int) -> None:
+    """Libro con las columnas de una exportación de tienda y 4 columnas que no se usan."""
+    from openpyxl import Workbook
+    
+    rng = np.random.default_rng(seed)
+    inicio = datetime(2025, 1, 1)
+    
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet("Ventas")
+    hoja.append([
+        "Tienda", "Marca", "Fecha", "Canal de Venta", "Cedula", "Nombre o Razon Social",
+        "Telefono", "Correo Electronico", "Articulo", "Descripcion Articulo", "Cantidad",
+        "Divisas de Venta", "Categoria", "Numero",
+        "Vendedor", "Observaciones", "Costo", "Margen",
+    ])
+    
+    dias = rng.integers(0, 365, filas).tolist()
+    cedulas = rng.integers(1_000_000, 30_000_000, filas).tolist()
+    montos = rng.uniform(1, 900, filas).round(2).tolist()
+    
+    for i in range(filas):
+        hoja.append([
+            f"Tienda {i % 12}", "Soytechno", inicio + timedelta(days=dias[i]), "Tienda",
+            cedulas[i], f"Cliente {cedulas[i]}", "04141234567", "cliente@correo.com",
+            f"ART-{i % 500}", "Descripción del artículo", 1 + i % 3, montos[i], "Tecnología", 100000 + i,
+            f"Vendedor {i % 30}", "Sin observaciones", montos[i] * 0.7, 0.3,
+        ])
+    
+    libro.save(ruta)
+
+
+def leer(variante: str, ruta: str) -> tuple:
+    """Lee y normaliza el libro; corre en un proceso aparte."""
+    os.environ["EXCEL_MOTOR"] = variante if variante != "pandas" else "openpyxl"
+    
+    from app.services.lector_transacciones import LectorTransacciones
+    lector = LectorTransacciones()
+    
+    inicio = time.perf_counter()
+    filas = 0
+    
+    if variante == "pandas":
+        df = lector._normalizar_columnas(pd.read_excel(ruta))
+        documentos, _ = lector._normalizar_filas(df)
+        filas = len(documentos)
+    else:
+        with open(ruta, "rb") as contenido:
+            for _, documentos, _ in lector.lotes_normalizados(contenido, ruta, 5000):
+                filas += len(documentos)
+    
+    duracion = time.perf_counter() - inicio
+    
+    memoria = None
+    if resource:
+        # ru_maxrss está en KB en Linux
+        memoria = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    
+    return duracion, filas, memoria
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de lectura de Excel")
+    parser.add_argument("--filas", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    
+    print("=" * 50)
+    print(f"📊 Libro de {args.filas:,} filas x 18 columnas (14 usadas)")
+    print("=" * 50)
+    
+    variantes = ["pandas", "openpyxl"]
+    if importlib.util.find_spec("python_calamine"):
+        variantes.append("calamine")
+    else:
+        print("⚠️  python-calamine no está instalado: se omite (pip install python-calamine)")
+    
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, "ventas.xlsx")
+        
+        inicio = time.perf_counter()
+        generar_libro(ruta, args.filas, args.seed)
+        print(f"🧪 Libro generado en {time.perf_counter() - inicio:.1f}s ({os.path.getsize(ruta) / 1e6:.1f} MB)")
+        
+        contexto = multiprocessing.get_context("spawn")
+        resultados = {}
+        for variante in variantes:
+            with contexto.Pool(1) as pool:
+                resultados[variante] = pool.apply(leer, (variante, ruta))
+    
+    base = resultados["pandas"][0]
+    nombres = {
+        "pandas": "pd.read_excel (openpyxl completo)",
+        "openpyxl": "openpyxl read_only",
+        "calamine": "python-calamine",
+    }
+    for variante, (duracion, filas, memoria) in resultados.items():
+        texto_memoria = f", {memoria:.0f} MB máx." if memoria else ""
+        print(
+            f"⏱️  {nombres[variante]}: {duracion:.2f}s, {filas / duracion:,.0f} filas/s "
+            f"({base / duracion:.1f}x{texto_memoria})"
+        )
+
+
+if __name__ == "__main__":
+    main()
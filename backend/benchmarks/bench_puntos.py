@@ -0,0 +1,115 @@
+"""
+Benchmark del cálculo de puntos: motor vectorizado (calculo_puntos.calcular_lote)
+contra el cálculo por miembro recorriendo sus transacciones en Python.
+
+Uso:
+    python benchmarks/bench_puntos.py
+    python benchmarks/bench_puntos.py --transacciones 1000000 --miembros 100000
+"""
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import calculo_puntos
+
+
+def generar(transacciones: int, miembros: int, seed: int):
+    """Transacciones aleatorias de los últimos 3 años, ya agrupadas por miembro."""
+    rng = np.random.default_rng(seed)
+    ahora = np.datetime64(datetime.now(), "us")
+    
+    miembro = rng.integers(0, miembros, transacciones)
+    fechas = ahora - rng.integers(0, 3 * 365 * 24 * 3600, transacciones).astype("timedelta64[s]")
+    montos = np.round(rng.uniform(1, 400, transacciones), 2)
+    puntos = montos.astype(np.int64)
+    
+    # Un tercio de los miembros con suscripción guardada; el resto usa la primera compra
+    fechas_suscripcion = np.full(miembros, np.datetime64("NaT", "us"))
+    fechas_suscripcion[::3] = ahora - np.timedelta64(4 * 365, "D")
+    
+    return miembro, fechas, puntos, montos, fechas_suscripcion
+
+
+def por_miembro(miembro, fechas, puntos, montos, fechas_suscripcion, ahora):
+    """Cálculo previo: agrupar en Python y recorrer las transacciones de cada miembro."""
+    grupos = {}
+    for i, fecha, punto, monto in zip(
+        miembro.tolist(), fechas.astype(object).tolist(), puntos.tolist(), montos.tolist()
+    ):
+        grupos.setdefault(i, []).append((fecha, punto, monto))
+    
+    suscripciones = fechas_suscripcion.astype(object).tolist()
+    resultado = {}
+    for i, movimientos in grupos.items():
+        fecha_suscripcion = suscripciones[i] or min(fecha for fecha, _, _ in movimientos)
+        vigentes = calculo_puntos.calcular_puntos_vigentes(
+            ((fecha, punto) for fecha, punto, _ in movimientos), fecha_suscripcion, ahora
+        )
+        compras = len(movimientos)
+        gastado = sum(monto for _, _, monto in movimientos)
+        resultado[i] = (
+            vigentes,
+            calculo_puntos.calcular_puntos_canje(vigentes),
+            calculo_puntos.calcular_nivel(compras, gastado),
+        )
+    
+    return resultado
+
+
+def medir(nombre, funcion, *args):
+    inicio = time.perf_counter()
+    resultado = funcion(*args)
+    duracion = time.perf_counter() - inicio
+    print(f"⏱️  {nombre}: {duracion:.3f}s")
+    return resultado, duracion
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del cálculo de puntos")
+    parser.add_argument("--transacciones", type=int, default=1_000_000)
+    parser.add_argument("--miembros", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    
+    print("=" * 50)
+    print(f"🧮 {args.transacciones:,} transacciones, {args.miembros:,} miembros")
+    print("=" * 50)
+    
+    miembro, fechas, puntos, montos, fechas_suscripcion = generar(
+        args.transacciones, args.miembros, args.seed
+    )
+    ahora = datetime.now()
+    
+    lote, t_lote = medir(
+        "Vectorizado (calcular_lote)",
+        calculo_puntos.calcular_lote,
+        miembro, fechas, puntos, montos, args.miembros, fechas_suscripcion, ahora
+    )
+    _, t_docs = medir("Conversión a documentos", calculo_puntos.a_documentos, lote)
+    previo, t_previo = medir(
+        "Por miembro en Python",
+        por_miembro,
+        miembro, fechas, puntos, montos, fechas_suscripcion, ahora
+    )
+    
+    # Ambos cálculos deben coincidir
+    diferencias = sum(
+        1 for i, (vigentes, canje, nivel) in previo.items()
+        if (vigentes, canje[0], nivel) != (
+            lote["puntos_vigentes"][i], lote["puntos_listos_canje"][i], lote["nivel"][i]
+        )
+    )
+    
+    print(f"🚀 Aceleración: {t_previo / t_lote:.1f}x ({t_previo / (t_lote + t_docs):.1f}x con conversión)")
+    print(f"📈 {args.transacciones / t_lote:,.0f} transacciones/s")
+    print(f"{'✅' if diferencias == 0 else '❌'} Diferencias: {diferencias}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Benchmark de la serialización de las respuestas más frecuentes: RespuestaJSON
+con dicts (app/respuestas.py) contra el camino previo, modelos Pydantic por
+documento + validación de response_model + jsonable_encoder + json de la
+biblioteca estándar.
+
+Mide páginas de `limit` filas de listos-canje y del listado de usuarios, y
+un usuario con `limit` transacciones embebidas. Verifica que ambos caminos
+produzcan el mismo JSON.
+
+Uso:
+    python benchmarks/bench_respuestas.py
+    python benchmarks/bench_respuestas.py --limit 500 --repeticiones 500
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+from datetime import datetime, timedelta
+from bson import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from app.main import app
+from app.models import UserPuntosResponse, UsersListosCanje
+from app.respuestas import RespuestaJSON, campos_puntos, orjson
+from app.routers.users import format_datetime, format_user_dates
+
+NIVELES = ["Kilobytes", "MegaBytes", "GigaBytes", "TeraBytes"]
+
+
+def generar(limit: int, seed: int):
+    """Documentos como los retorna MongoDB: una página de canje_ready, una del listado y un usuario."""
+    rng = random.Random(seed)
+    ahora = datetime.now().replace(microsecond=0)
+    
+    canje = []
+    listado = []
+    for i in range(limit):
+        vigentes = rng.randint(500, 20000)
+        documento = {
+            "cedula": f"V-{5_000_000 + i * 7}",
+            "nombre": f"Cliente {i}",
+            "nivel": rng.choice(NIVELES),
+            "puntos_totales": vigentes + rng.randint(0, 5000),
+            "puntos_vigentes": vigentes,
+            "puntos_listos_canje": vigentes // 500 * 500,
+            "dolares_canjeables": vigentes // 500 * 10.0,
+        }
+        canje.append(documento)
+        listado.append({
+            **documento,
+            "telefono": f"0414{5_000_000 + i:07d}",
+            "correo": f"cliente{i}@correo.com",
+            "total_gastado": round(rng.uniform(10, 5000), 2),
+            "compras_totales": rng.randint(1, 40),
+        })
+    
+    user = {
+        "_id": ObjectId(),
+        **listado[0],
+        "fecha_registro": ahora - timedelta(days=400),
+        "fecha_suscripcion": ahora - timedelta(days=400),
+        "inicio_periodo": ahora - timedelta(days=35),
+        "fin_periodo": ahora + timedelta(days=330),
+        "ultima_actualizacion": ahora,
+        "transacciones": [
+            {
+                "transaccion_id": str(ObjectId()),
+                "fecha": ahora - timedelta(hours=i * 5),
+                "tienda": "Soytechno Caracas 1",
+                "articulo": f"ART-{i % 10:04d}",
+                "cantidad": 1,
+                "monto": 25.5,
+                "puntos_generados": 25,
+            }
+            for i in range(limit)
+        ],
+    }
+    
+    return canje, listado, user
+
+
+def campo_respuesta(ruta: str):
+    """response_field con el que FastAPI valida la respuesta de la ruta."""
+    return next(r for r in app.routes if getattr(r, "path", None) == ruta).response_field
+
+
+async def previo_canje(canje, campo):
+    users = [
+        UserPuntosResponse(
+            cedula=user["cedula"],
+            nombre=user["nombre"],
+            nivel=user["nivel"],
+            puntos_totales=user["puntos_totales"],
+            puntos_vigentes=user["puntos_vigentes"],
+            puntos_listos_canje=user["puntos_listos_canje"],
+            dolares_canjeables=user["dolares_canjeables"],
+        )
+        for user in canje
+    ]
+    contenido = await serialize_response(
+        field=campo, response_content=UsersListosCanje(total=len(canje), users=users, siguiente="cursor")
+    )
+    return JSONResponse(contenido).body
+
+
+async def nuevo_canje(canje, campo):
+    users = [campos_puntos(user) for user in canje]
+    return RespuestaJSON({"total": len(canje), "users": users, "siguiente": "cursor"}).body
+
+
+async def previo_listado(listado, campo):
+    contenido = {"total": len(listado), "page": 1, "limit": len(listado), "siguiente": "cursor", "users": listado}
+    return JSONResponse(await serialize_response(field=campo, response_content=contenido)).body
+
+
+async def nuevo_listado(listado, campo):
+    contenido = {"total": len(listado), "page": 1, "limit": len(listado), "siguiente": "cursor", "users": listado}
+    return RespuestaJSON(contenido).body
+
+
+async def previo_usuario(user, campo):
+    user = {**user, "_id": str(user["_id"]), "transacciones": [dict(tx) for tx in user["transacciones"]]}
+    for field in ["fecha_registro", "fecha_suscripcion", "ultima_actualizacion"]:
+        if user.get(field):
+            user[field] = format_datetime(user[field])
+    for tx in user["transacciones"]:
+        if tx.get("fecha"):
+            tx["fecha"] = format_datetime(tx["fecha"])
+    
+    return JSONResponse(await serialize_response(field=campo, response_content=user)).body
+
+
+async def nuevo_usuario(user, campo):
+    user = {**user, "_id": str(user["_id"])}
+    return RespuestaJSON(format_user_dates(user)).body
+
+
+async def medir(funcion, datos, campo, repeticiones: int):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        cuerpo = await funcion(datos, campo)
+    return cuerpo, (time.perf_counter() - inicio) / repeticiones
+
+
+async def ejecutar(args):
+    canje, listado, user = generar(args.limit, args.seed)
+    casos = [
+        ("listos-canje", canje, "/api/users/listos-canje/", previo_canje, nuevo_canje),
+        ("listado users", listado, "/api/users/", previo_listado, nuevo_listado),
+        ("usuario completo", user, "/api/users/{cedula}", previo_usuario, nuevo_usuario),
+    ]
+    
+    diferencias = 0
+    for nombre, datos, ruta, previo, nuevo in casos:
+        campo = campo_respuesta(ruta)
+        cuerpo_previo, t_previo = await medir(previo, datos, campo, args.repeticiones)
+        cuerpo_nuevo, t_nuevo = await medir(nuevo, datos, campo, args.repeticiones)
+        
+        iguales = cuerpo_previo == cuerpo_nuevo
+        diferencias += not iguales
+        print(
+            f"{'✅' if iguales else '❌'} {nombre} ({args.limit} filas): "
+            f"{t_previo * 1000:.2f} ms -> {t_nuevo * 1000:.2f} ms ({t_previo / t_nuevo:.1f}x), "
+            f"{len(cuerpo_nuevo) / 1024:.0f} KB"
+        )
+    
+    return diferencias
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la serialización de respuestas")
+    parser.add_argument("--limit", type=int, default=500, help="Filas por página (default: 500)")
+    parser.add_argument("--repeticiones", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    
+    print("=" * 50)
+    print(f"📦 Páginas de {args.limit} filas, {args.repeticiones} repeticiones")
+    print(f"🔧 Serializador: {'orjson' if orjson else 'json (orjson no está instalado)'}")
+    print("=" * 50)
+    
+    diferencias = asyncio.run(ejecutar(args))
+    
+    print(f"{'✅' if diferencias == 0 else '❌'} Respuestas distintas: {diferencias}")
+
+
+if __name__ == "__main__":
+    main()
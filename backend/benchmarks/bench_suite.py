@@ -0,0 +1,283 @@
+"""
+Suite de benchmarks de los caminos críticos del backend: carga de
+archivos CSV/XLSX, agregar una transacción a un usuario, consulta de
+puntos (individual y en lote) y listados listos para canje.
+
+Genera los datos con benchmarks/generador.py y mide contra un MongoDB
+local o, por defecto, uno en memoria (mongomock-motor). El resultado
+(throughput, percentiles de latencia y memoria máxima) se escribe como
+JSON para comparar entre versiones con --comparar.
+
+Uso:
+    python benchmarks/bench_suite.py
+    python benchmarks/bench_suite.py --filas 200000 --miembros 40000 --salida base.json
+    python benchmarks/bench_suite.py --mongodb-url mongodb://localhost:27017 --comparar base.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import numpy as np
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from generador import generar_transacciones, escribir
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def memoria_maxima() -> Optional[float]:
+    """Memoria residente máxima de este proceso en MB (sin los procesos lectores)."""
+    if not resource:
+        return None
+    maxima = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss está en bytes en macOS y en KB en Linux
+    return round(maxima / 1024 / (1024 if sys.platform == "darwin" else 1), 1)
+
+
+async def medir(
+    llamadas: List[Callable[[], Awaitable]],
+    unidades: Optional[int] = None
+) -> dict:
+    """
+    Ejecuta las llamadas una tras otra y mide cada una.
+    
+    Args:
+        llamadas: Funciones sin argumentos que retornan un awaitable
+        unidades: Unidades procesadas en total (ej. filas); por defecto, las llamadas
+    """
+    latencias = []
+    inicio = time.perf_counter()
+    
+    for llamada in llamadas:
+        antes = time.perf_counter()
+        await llamada()
+        latencias.append(time.perf_counter() - antes)
+    
+    segundos = time.perf_counter() - inicio
+    resultado = {
+        "operaciones": len(llamadas),
+        "segundos": round(segundos, 3),
+        "por_segundo": round((unidades or len(llamadas)) / segundos, 1),
+        "rss_max_mb": memoria_maxima(),
+    }
+    if len(latencias) > 1:
+        p50, p95, p99 = np.percentile(np.array(latencias) * 1000, [50, 95, 99])
+        resultado.update({"p50_ms": round(p50, 3), "p95_ms": round(p95, 3), "p99_ms": round(p99, 3)})
+    
+    return resultado
+
+
+async def conectar(args):
+    """Base de datos vacía para el benchmark: (db, función para cerrarla)."""
+    if not args.mongodb_url:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            sys.exit("❌ Instale mongomock-motor (pip install mongomock-motor) o use --mongodb-url")
+        
+        return AsyncMongoMockClient()["bench"], None
+    
+    from motor.motor_asyncio import AsyncIOMotorClient
+    
+    cliente = AsyncIOMotorClient(args.mongodb_url)
+    nombre = f"bench_soytechno_{os.getpid()}"
+    db = cliente[nombre]
+    
+    async def cerrar():
+        if not args.conservar:
+            await cliente.drop_database(nombre)
+        cliente.close()
+    
+    return db, cerrar
+
+
+async def ejecutar(args, directorio: str) -> dict:
+    from app.config import get_settings
+    from app.indices import sincronizar_indices
+    from app.services import ExcelService, UserService, PuntosService, CanjeService
+    from app.services.lector_transacciones import LectorTransacciones, cerrar_pool_lectura
+    
+    rng = random.Random(args.seed)
+    resultados = {}
+    
+    # Dos exportaciones de los mismos miembros que no se solapan
+    rutas = {}
+    for formato, seed, inicio_numero in (("csv", args.seed, 1), ("xlsx", args.seed + 1, args.filas + 1)):
+        df = generar_transacciones(
+            args.filas, args.miembros, args.tiendas, args.dias, seed=seed, inicio_numero=inicio_numero
+        )
+        rutas[formato] = os.path.join(directorio, f"ventas.{formato}")
+        escribir(df, rutas[formato])
+        print(f"🧪 {args.filas:,} filas en {rutas[formato]} ({os.path.getsize(rutas[formato]) / 1e6:.1f} MB)")
+    
+    db, cerrar = await conectar(args)
+    await sincronizar_indices(db)
+    for origen in ("users", "clientes"):
+        await CanjeService(db).reconstruir(origen)
+    
+    try:
+        excel = ExcelService(db)
+        for formato, ruta in rutas.items():
+            nombre = f"carga_{formato}"
+            with open(ruta, "rb") as archivo:
+                resultados[nombre] = await medir(
+                    [lambda: excel.procesar_archivos([(archivo, os.path.basename(ruta))])],
+                    unidades=args.filas
+                )
+            print(f"📤 {nombre}: {resultados[nombre]['por_segundo']:,.0f} filas/s")
+        
+        cedulas = await db.users.distinct("cedula")
+        users = UserService(db)
+        puntos = PuntosService(db)
+        
+        def agregar(i: int):
+            return lambda: users.agregar_transaccion_a_usuario(
+                cedula=rng.choice(cedulas),
+                nombre="Cliente benchmark",
+                telefono=None,
+                correo=None,
+                transaccion_id=f"bench-{i}",
+                fecha=datetime.now(),
+                tienda="Soytechno Caracas 1",
+                articulo="ART-0000",
+                cantidad=1,
+                monto=25.0,
+                puntos_generados=25,
+            )
+        
+        resultados["agregar_transaccion"] = await medir([agregar(i) for i in range(args.operaciones)])
+        
+        # 1 de cada 10 consultas es de una cédula que no existe
+        consultas = [
+            rng.choice(cedulas) if rng.random() < 0.9 else f"V-{rng.randint(1, 999999)}"
+            for _ in range(args.operaciones)
+        ]
+        resultados["puntos"] = await medir([
+            (lambda cedula=cedula: users.obtener_user_puntos(cedula)) for cedula in consultas
+        ])
+        
+        lotes = [rng.sample(cedulas, min(500, len(cedulas))) for _ in range(max(args.operaciones // 50, 2))]
+        resultados["puntos_batch_500"] = await medir(
+            [(lambda lote=lote: users.obtener_users_puntos(lote)) for lote in lotes]
+        )
+        
+        # Recorrido del listado por cursor, como la interfaz: total solo en la primera página
+        for nombre, listar in (
+            ("listos_canje_users", users.obtener_users_listos_canje),
+            ("listos_canje_clientes", puntos.obtener_clientes_listos_canje),
+        ):
+            estado = {"after": None, "pagina": 0}
+            
+            async def pagina(listar=listar, estado=estado):
+                _, _, siguiente = await listar(
+                    limit=50, after=estado["after"], incluir_total=estado["pagina"] == 0
+                )
+                estado["after"] = siguiente
+                estado["pagina"] = estado["pagina"] + 1 if siguiente else 0
+            
+            resultados[nombre] = await medir([pagina] * args.paginas)
+        
+        for nombre in ("agregar_transaccion", "puntos", "puntos_batch_500", "listos_canje_users", "listos_canje_clientes"):
+            resultado = resultados[nombre]
+            print(f"⏱️  {nombre}: {resultado['por_segundo']:,.0f} ops/s, p95 {resultado['p95_ms']:.2f} ms")
+    finally:
+        cerrar_pool_lectura()
+        if cerrar:
+            await cerrar()
+    
+    return {
+        "meta": {
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "backend": "mongod" if args.mongodb_url else "memoria",
+            "filas": args.filas,
+            "miembros": args.miembros,
+            "tiendas": args.tiendas,
+            "dias": args.dias,
+            "operaciones": args.operaciones,
+            "paginas": args.paginas,
+            "seed": args.seed,
+            "upload_procesos": get_settings().upload_procesos,
+            "excel_motor": LectorTransacciones.motor_excel(),
+            "cache": args.cache,
+        },
+        "resultados": resultados,
+    }
+
+
+def comparar(actual: dict, base: dict, tolerancia: float) -> None:
+    """Muestra la variación de throughput y p95 contra un resultado anterior."""
+    print("=" * 50)
+    print(f"📊 Comparación con {base['meta']['fecha']} ({base['meta']['backend']})")
+    print("=" * 50)
+    
+    for nombre, resultado in actual["resultados"].items():
+        anterior = base["resultados"].get(nombre)
+        if not anterior:
+            continue
+        
+        variacion = resultado["por_segundo"] / anterior["por_segundo"] - 1
+        texto = f"{nombre}: {variacion:+.0%} throughput"
+        if "p95_ms" in resultado and "p95_ms" in anterior:
+            texto += f", p95 {resultado['p95_ms'] / anterior['p95_ms'] - 1:+.0%}"
+        
+        print(f"{'⚠️ ' if variacion < -tolerancia else '✅'} {texto}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Suite de benchmarks del backend")
+    parser.add_argument("--filas", type=int, default=50_000, help="Filas de cada archivo (default: 50000)")
+    parser.add_argument("--miembros", type=int, default=10_000)
+    parser.add_argument("--tiendas", type=int, default=10)
+    parser.add_argument("--dias", type=int, default=730)
+    parser.add_argument("--operaciones", type=int, default=1000, help="Llamadas por medición de latencia")
+    parser.add_argument("--paginas", type=int, default=50, help="Páginas de cada listado")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mongodb-url", help="MongoDB local (default: en memoria con mongomock-motor)")
+    parser.add_argument("--conservar", action="store_true", help="No eliminar la base de datos del benchmark")
+    parser.add_argument("--cache", action="store_true", help="Medir con la caché de puntos (default: sin caché)")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (default: se imprime)")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior")
+    parser.add_argument("--tolerancia", type=float, default=0.1, help="Caída de throughput que se marca (default: 0.1)")
+    args = parser.parse_args()
+    
+    # Antes de leer la configuración: sin caché se mide la consulta a MongoDB
+    if not args.cache:
+        os.environ["CACHE_TTL_SEGUNDOS"] = "0"
+    
+    print("=" * 50)
+    print(f"🏁 Benchmarks: {args.filas:,} filas x 2 archivos, {args.miembros:,} miembros")
+    print("=" * 50)
+    
+    with tempfile.TemporaryDirectory() as directorio:
+        resultado = asyncio.run(ejecutar(args, directorio))
+    
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            archivo.write(texto)
+        print(f"💾 Resultados en {args.salida}")
+    else:
+        print(texto)
+    
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as archivo:
+            comparar(resultado, json.load(archivo), args.tolerancia)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Generador de exportaciones sintéticas de ventas Soytechno (CSV y XLSX)
+con las columnas que espera la carga de transacciones.
+
+Incluye los problemas de los archivos reales: cédulas con puntos y
+espacios, fechas en varios formatos (y como fecha de Excel en XLSX),
+y una fracción de filas inválidas (cédula vacía o monto no numérico).
+
+Uso:
+    python benchmarks/generador.py --filas 100000 --salida ventas.csv
+    python benchmarks/generador.py --filas 100000 --miembros 20000 --salida ventas.xlsx
+"""
+
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+CIUDADES = [
+    "Caracas", "Valencia", "Maracaibo", "Barquisimeto", "Maracay",
+    "Puerto La Cruz", "Mérida", "San Cristóbal", "Maturín", "Puerto Ordaz",
+]
+
+ARTICULOS = [
+    ("Teléfonos", "Smartphone 128GB", 180.0),
+    ("Teléfonos", "Smartphone 256GB", 320.0),
+    ("Accesorios", "Cargador USB-C", 12.0),
+    ("Accesorios", "Audífonos inalámbricos", 35.0),
+    ("Accesorios", "Forro protector", 8.0),
+    ("Computación", "Laptop 15\"", 650.0),
+    ("Computación", "Mouse inalámbrico", 15.0),
+    ("Hogar", "Smart TV 50\"", 420.0),
+    ("Hogar", "Router WiFi", 45.0),
+    ("Gaming", "Control inalámbrico", 55.0),
+]
+
+# Formatos de fecha de texto que aparecen en las exportaciones (ver LectorTransacciones.FORMATOS_FECHA)
+FORMATOS_FECHA = ["%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d"]
+
+
+def generar_transacciones(
+    filas: int,
+    miembros: int = 10000,
+    tiendas: int = 10,
+    dias: int = 730,
+    sucias: float = 0.2,
+    invalidas: float = 0.01,
+    seed: int = 42,
+    hasta: datetime = None,
+    inicio_numero: int = 1,
+) -> pd.DataFrame:
+    """
+    Genera filas de una exportación de ventas.
+    
+    Args:
+        filas: Transacciones a generar
+        miembros: Cédulas distintas; pocas concentran muchas compras
+        tiendas: Tiendas distintas
+        dias: Las fechas se reparten en los `dias` anteriores a `hasta`
+        sucias: Fracción de cédulas con puntos/espacios y de fechas en formato no ISO
+        invalidas: Fracción de filas que la carga debe rechazar
+        seed: Semilla (mismos parámetros, mismo archivo)
+        hasta: Fecha más reciente (default: hoy)
+        inicio_numero: Primer número de factura (para archivos que no se solapan)
+    """
+    rng = np.random.default_rng(seed)
+    hasta = hasta or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    
+    # Distribución sesgada: los primeros miembros compran mucho más
+    miembro = (rng.random(filas) ** 2 * miembros).astype(np.int64)
+    numeros_cedula = 5_000_000 + miembro * 7
+    prefijos = np.where(miembro % 10 == 0, "E-", "V-")
+    
+    cedulas = []
+    variantes = rng.random(filas)
+    for prefijo, numero, variante in zip(prefijos.tolist(), numeros_cedula.tolist(), variantes.tolist()):
+        if variante < sucias / 2:
+            cedulas.append(f"{prefijo}{numero:,}".replace(",", "."))
+        elif variante < sucias:
+            cedulas.append(f" {prefijo} {numero} ")
+        else:
+            cedulas.append(f"{prefijo}{numero}")
+    
+    fechas = pd.Series(
+        pd.Timestamp(hasta) - pd.to_timedelta(rng.integers(0, dias, filas), unit="D")
+    )
+    formato = np.where(rng.random(filas) < sucias, rng.integers(1, len(FORMATOS_FECHA), filas), 0)
+    textos_fecha = pd.Series("", index=fechas.index)
+    for i, fmt in enumerate(FORMATOS_FECHA):
+        seleccion = formato == i
+        textos_fecha[seleccion] = fechas[seleccion].dt.strftime(fmt)
+    
+    articulo = rng.integers(0, len(ARTICULOS), filas)
+    precios = np.array([precio for _, _, precio in ARTICULOS])
+    cantidades = np.where(rng.random(filas) < 0.85, 1, rng.integers(2, 5, filas))
+    montos = np.round(precios[articulo] * cantidades * rng.uniform(0.8, 1.2, filas), 2)
+    tienda = rng.integers(0, tiendas, filas)
+    
+    df = pd.DataFrame({
+        "Tienda": [f"Soytechno {CIUDADES[t % len(CIUDADES)]} {t // len(CIUDADES) + 1}" for t in tienda.tolist()],
+        "Marca": "Soytechno",
+        "Fecha": textos_fecha,
+        "Canal de Venta": np.where(rng.random(filas) < 0.7, "Tienda", "Web"),
+        "Cedula": cedulas,
+        "Nombre o Razon Social": [f"Cliente {m}" for m in miembro.tolist()],
+        "Telefono": [f"0414{5_000_000 + m:07d}" for m in miembro.tolist()],
+        "Correo Electronico": [f"cliente{m}@correo.com" for m in miembro.tolist()],
+        "Articulo": [f"ART-{a:04d}" for a in articulo.tolist()],
+        "Descripcion Articulo": [ARTICULOS[a][1] for a in articulo.tolist()],
+        "Cantidad": cantidades,
+        "Divisas de Venta": montos.astype(object),
+        "Categoria": [ARTICULOS[a][0] for a in articulo.tolist()],
+        "Numero": np.arange(inicio_numero, inicio_numero + filas).astype(str),
+    })
+    
+    # Filas inválidas: mitad sin cédula, mitad con monto de texto
+    rechazadas = np.flatnonzero(rng.random(filas) < invalidas)
+    df.loc[rechazadas[::2], "Cedula"] = ""
+    df.loc[rechazadas[1::2], "Divisas de Venta"] = "N/A"
+    
+    # Fechas ISO como datetime: en XLSX quedan como fecha de Excel
+    df["Fecha"] = df["Fecha"].astype(object)
+    iso = formato == 0
+    df.loc[iso, "Fecha"] = fechas[iso].astype(object)
+    
+    return df
+
+
+def escribir(df: pd.DataFrame, ruta: str) -> None:
+    """Escribe el DataFrame como CSV o XLSX según la extensión."""
+    if ruta.lower().endswith(".csv"):
+        salida = df.copy()
+        salida["Fecha"] = [
+            f"{fecha:%Y-%m-%d}" if isinstance(fecha, datetime) else fecha
+            for fecha in salida["Fecha"]
+        ]
+        salida.to_csv(ruta, index=False, encoding="utf-8")
+        return
+    
+    # openpyxl en modo write_only: pandas.to_excel es varias veces más lento
+    from openpyxl import Workbook
+    
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet("Ventas")
+    hoja.append(list(df.columns))
+    for fila in df.itertuples(index=False):
+        hoja.append(list(fila))
+    libro.save(ruta)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generador de exportaciones de ventas sintéticas")
+    parser.add_argument("--filas", type=int, default=100_000)
+    parser.add_argument("--miembros", type=int, default=10_000)
+    parser.add_argument("--tiendas", type=int, default=10)
+    parser.add_argument("--dias", type=int, default=730, help="Días que abarcan las fechas (default: 730)")
+    parser.add_argument("--sucias", type=float, default=0.2, help="Fracción de cédulas y fechas sucias")
+    parser.add_argument("--invalidas", type=float, default=0.01, help="Fracción de filas inválidas")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--salida", required=True, help="Archivo .csv o .xlsx")
+    args = parser.parse_args()
+    
+    if not args.salida.lower().endswith((".csv", ".xlsx")):
+        sys.exit("❌ La salida debe ser .csv o .xlsx")
+    
+    df = generar_transacciones(
+        args.filas, args.miembros, args.tiendas, args.dias, args.sucias, args.invalidas, args.seed
+    )
+    escribir(df, args.salida)
+    
+    print(f"✅ {args.filas:,} filas en {args.salida} ({os.path.getsize(args.salida) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+"""
+Comandos de mantenimiento para el backend Club Soytechno.
+
+Uso:
+    python manage.py migrar-historial
+    python manage.py migrar-historial --batch-size 1000
+    python manage.py reconstruir-canje
+    python manage.py reconstruir-canje --origen users
+    python manage.py reconstruir-canje --si-falta
+    python manage.py expirar
+    python manage.py expirar --intervalo 60
+    python manage.py migrar-claves
+    python manage.py exportar-staging
+    python manage.py replay
+    python manage.py replay --desde 2025-01 --hasta 2025-06
+    python manage.py consultas-lentas
+    python manage.py consultas-lentas --top 20 --desde 2025-06-01
+    python manage.py indexes check
+    python manage.py indexes sync
+    python manage.py indexes drop-unused --confirmar
+"""
+
+import asyncio
+import argparse
+import sys
+import time
+import json
+from datetime import datetime
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+from app.database import connect_to_mongo, close_mongo_connection, get_database
+from app.services import UserService, CanjeService, ExcelService, StagingService
+from app.config import get_settings
+from app.consultas_lentas import resumir
+from app.indices import estado_indices, sincronizar_indices, uso_indices
+
+
+async def migrar_historial(db, args):
+    """Recorta el historial embebido de los usuarios a las transacciones recientes."""
+    service = UserService(db)
+    
+    print(f"📦 Conservando las últimas {service.transacciones_recientes} transacciones por usuario")
+    
+    stats = await service.migrar_historial(batch_size=args.batch_size)
+    
+    print(f"👤 Usuarios migrados: {stats['usuarios_migrados']}")
+    print(f"🧱 Lotes: {stats['lotes']}")
+
+
+async def reconstruir_canje(db, args):
+    """Regenera la vista canje_ready y sus contadores desde users/clientes."""
+    service = CanjeService(db)
+    
+    for origen in args.origen or ["users", "clientes"]:
+        if args.si_falta and await service.construida(origen):
+            print(f"✅ {origen}: la vista ya está construida")
+            continue
+        
+        stats = await service.reconstruir(origen, batch_size=args.batch_size)
+        print(f"🏆 {origen}: {stats['total']} listos para canje ({stats['lotes']} lotes)")
+
+
+async def expirar(db, args):
+    """Vence los puntos de los usuarios cuyo período terminó."""
+    service = UserService(db)
+    
+    while True:
+        inicio = time.perf_counter()
+        stats = await service.expirar_periodos(batch_size=args.batch_size)
+        duracion = time.perf_counter() - inicio
+        
+        print(f"⏳ Usuarios expirados: {stats['usuarios_expirados']} ({stats['lotes']} lotes)")
+        print(f"💸 Puntos vencidos: {stats['puntos_vencidos']}")
+        print(f"🏆 Salieron de listos para canje: {stats['salieron_de_canje']}")
+        if stats["omitidos"]:
+            print(f"⚠️  Omitidos (modificados durante el proceso): {stats['omitidos']}")
+        if stats["usuarios_expirados"]:
+            print(f"🚀 {stats['usuarios_expirados'] / duracion:.0f} usuarios/s")
+        
+        if not args.intervalo:
+            break
+        
+        print(f"💤 Próxima ejecución en {args.intervalo} minutos")
+        await asyncio.sleep(args.intervalo * 60)
+
+
+async def migrar_claves(db, args):
+    """Calcula la clave natural de las transacciones cargadas sin ella."""
+    service = ExcelService(db)
+    
+    stats = await service.migrar_claves(batch_size=args.batch_size)
+    
+    print(f"🔑 Transacciones con clave: {stats['transacciones']} ({stats['lotes']} lotes)")
+    if stats["duplicadas"]:
+        print(f"⚠️  Duplicadas (quedan sin clave): {stats['duplicadas']}")
+
+
+async def exportar_staging(db, args):
+    """Copia la colección transacciones al staging parquet."""
+    service = StagingService(db)
+    
+    stats = await service.exportar(batch_size=args.batch_size)
+    
+    print(f"📦 Transacciones exportadas: {stats['transacciones']} ({stats['lotes']} lotes)")
+    if stats["sin_clave"]:
+        print(f"⚠️  Sin clave (ejecute migrar-claves): {stats['sin_clave']}")
+
+
+async def replay(db, args):
+    """Reconstruye users y clientes desde el staging parquet."""
+    service = StagingService(db)
+    
+    try:
+        stats = await service.replay(desde=args.desde, hasta=args.hasta, batch_size=args.batch_size)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    
+    print(f"📦 Transacciones en staging: {stats['transacciones']}")
+    if stats["transacciones_insertadas"]:
+        print(f"➕ Insertadas en transacciones: {stats['transacciones_insertadas']}")
+    print(f"👤 Miembros reconstruidos: {stats['miembros']} ({stats['lotes']} lotes)")
+    for error in stats["errores"][:20]:
+        print(f"⚠️  {error}")
+    if len(stats["errores"]) > 20:
+        print(f"⚠️  ... y {len(stats['errores']) - 20} errores más")
+
+
+def consultas_lentas(args):
+    """Resume el log de consultas lentas: las formas de consulta con más tiempo acumulado."""
+    ruta = args.log or get_settings().slow_query_log
+    desde = datetime.fromisoformat(args.desde) if args.desde else None
+    
+    try:
+        resumen = resumir(ruta, top=args.top, desde=desde)
+    except FileNotFoundError:
+        print(f"📭 No existe {ruta} (¿SLOW_QUERY_MS está configurado?)")
+        return
+    
+    if not resumen:
+        print(f"📭 Sin consultas lentas en {ruta}")
+        return
+    
+    for i, grupo in enumerate(resumen, 1):
+        veces = f"{grupo['veces']} {'vez' if grupo['veces'] == 1 else 'veces'}"
+        print(f"{i}. {grupo['comando']} {grupo['coleccion']}: {veces}, "
+              f"{grupo['total_ms'] / 1000:.1f}s en total")
+        print(f"   ⏱️  promedio {grupo['promedio_ms']:.0f} ms, p95 {grupo['p95_ms']:.0f} ms, máx {grupo['max_ms']:.0f} ms")
+        for clave, valor in grupo["ejemplo"].items():
+            print(f"   🔎 {clave}: {json.dumps(valor, default=str, ensure_ascii=False)[:200]}")
+        
+        plan = grupo.get("plan")
+        if plan:
+            etapas = " <- ".join(plan["etapas"]) or "?"
+            print(f"   🗺️  plan: {etapas} (índices: {', '.join(plan['indices']) or 'ninguno'})")
+            print(f"   📄 examinados: {plan['docs_examinados']} docs / {plan['claves_examinadas']} claves, "
+                  f"devueltos: {plan['devueltos']}")
+            if "COLLSCAN" in plan["etapas"]:
+                print("   ⚠️  Recorre la colección completa: falta un índice para este filtro/orden")
+            elif plan["devueltos"] and plan["docs_examinados"] > 10 * plan["devueltos"]:
+                print("   ⚠️  Examina más de 10 documentos por cada uno devuelto: índice poco selectivo")
+        if grupo["errores"]:
+            print(f"   ❌ Fallidas: {grupo['errores']}")
+
+
+def _uso(uso, nombre: str) -> str:
+    if uso is None or nombre not in uso:
+        return "uso desconocido"
+    return f"{uso[nombre]['ops']} ops desde {uso[nombre]['since']:%Y-%m-%d %H:%M}"
+
+
+async def indexes(db, args):
+    """Compara, crea o elimina índices según el registro de app/indices.py."""
+    if args.accion == "sync":
+        stats = await sincronizar_indices(db)
+        
+        for nombre in stats["creados"]:
+            print(f"🗂️  Creado: {nombre}")
+        if not stats["creados"]:
+            print("✅ Todos los índices del registro existen")
+        for nombre in stats["distintos"]:
+            print(f"⚠️  {nombre} tiene otras opciones que el registro: elimínelo y ejecute sync de nuevo")
+        if stats["sobrantes"]:
+            print(f"🗑️  Índices fuera del registro: {stats['sobrantes']} (ver indexes check)")
+        return
+    
+    estado = await estado_indices(db)
+    
+    if args.accion == "check":
+        problemas = 0
+        for coleccion, resultado in estado.items():
+            if not any(resultado.values()):
+                continue
+            
+            uso = await uso_indices(db, coleccion)
+            print(f"📁 {coleccion}")
+            for nombre in resultado["presentes"]:
+                print(f"   ✅ {nombre} ({_uso(uso, nombre)})")
+            for modelo in resultado["faltantes"]:
+                print(f"   ❌ Falta: {modelo.document['name']}")
+            for modelo, existente in resultado["distintos"]:
+                print(f"   ⚠️  {existente['name']}: otras opciones que {modelo.document['name']} del registro")
+            for indice in resultado["sobrantes"]:
+                print(f"   🗑️  Fuera del registro: {indice['name']} ({_uso(uso, indice['name'])})")
+            
+            problemas += len(resultado["faltantes"]) + len(resultado["distintos"])
+        
+        if problemas:
+            print(f"❌ {problemas} índices por corregir: python manage.py indexes sync")
+            sys.exit(1)
+        print("✅ Los índices coinciden con el registro")
+        return
+    
+    # drop-unused: índices fuera del registro sin uso desde el arranque del servidor
+    eliminar = []
+    for coleccion, resultado in estado.items():
+        uso = await uso_indices(db, coleccion)
+        for indice in resultado["sobrantes"]:
+            nombre = indice["name"]
+            if not args.forzar:
+                # Sin $indexStats (ej. rol restringido) no se sabe si se usa: se conserva
+                if uso is None or nombre not in uso:
+                    print(f"⏭️  {coleccion}.{nombre}: uso desconocido, se conserva (--forzar para eliminarlo)")
+                    continue
+                if uso[nombre].get("ops"):
+                    print(f"⏭️  {coleccion}.{nombre}: en uso ({_uso(uso, nombre)}), se conserva (--forzar para eliminarlo)")
+                    continue
+            
+            eliminar.append((coleccion, nombre))
+            print(f"🗑️  {coleccion}.{nombre} ({_uso(uso, nombre)})")
+    
+    if not eliminar:
+        print("✅ No hay índices sin uso para eliminar")
+    elif not args.confirmar:
+        print(f"💡 {len(eliminar)} índices a eliminar: ejecute de nuevo con --confirmar")
+    else:
+        for coleccion, nombre in eliminar:
+            await db[coleccion].drop_index(nombre)
+        print(f"✅ Eliminados: {len(eliminar)}")
+
+
+async def ejecutar(comando, args):
+    """Conecta a MongoDB, ejecuta el comando y cierra la conexión."""
+    # indexes y reconstruir-canje verifican por su cuenta lo que construyen
+    await connect_to_mongo(verificar=comando not in (indexes, reconstruir_canje))
+    inicio = time.perf_counter()
+    
+    try:
+        await comando(get_database(), args)
+    finally:
+        print(f"⏱️  Tiempo: {time.perf_counter() - inicio:.2f}s")
+        await close_mongo_connection()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Club Soytechno - comandos de mantenimiento")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+    
+    parser_migrar = subparsers.add_parser(
+        "migrar-historial",
+        help="Mover el historial de transacciones fuera del documento de usuario"
+    )
+    parser_migrar.add_argument(
+        "--batch-size",
+        type=int,
+        default=500,
+        help="Usuarios por lote (default: 500)"
+    )
+    parser_migrar.set_defaults(func=migrar_historial)
+    
+    parser_canje = subparsers.add_parser(
+        "reconstruir-canje",
+        help="Regenerar la vista de miembros listos para canje"
+    )
+    parser_canje.add_argument(
+        "--origen",
+        choices=["users", "clientes"],
+        action="append",
+        help="Colección a reconstruir (default: ambas)"
+    )
+    parser_canje.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="Documentos por lote (default: 1000)"
+    )
+    parser_canje.add_argument(
+        "--si-falta",
+        action="store_true",
+        help="Solo construir los orígenes que aún no tienen vista (para el despliegue)"
+    )
+    parser_canje.set_defaults(func=reconstruir_canje)
+    
+    parser_expirar = subparsers.add_parser(
+        "expirar",
+        help="Vencer los puntos de los usuarios cuyo período terminó"
+    )
+    parser_expirar.add_argument(
+        "--batch-size",
+        type=int,
+        default=500,
+        help="Usuarios por lote (default: 500)"
+    )
+    parser_expirar.add_argument(
+        "--intervalo",
+        type=float,
+        default=0,
+        help="Repetir cada N minutos (default: 0, una sola vez)"
+    )
+    parser_expirar.set_defaults(func=expirar)
+    
+    parser_claves = subparsers.add_parser(
+        "migrar-claves",
+        help="Calcular la clave natural de las transacciones existentes"
+    )
+    parser_claves.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="Transacciones por lote (default: 1000)"
+    )
+    parser_claves.set_defaults(func=migrar_claves)
+    
+    parser_exportar = subparsers.add_parser(
+        "exportar-staging",
+        help="Copiar las transacciones cargadas al staging parquet (STAGING_DIR)"
+    )
+    parser_exportar.add_argument(
+        "--batch-size",
+        type=int,
+        default=5000,
+        help="Transacciones por lote (default: 5000)"
+    )
+    parser_exportar.set_defaults(func=exportar_staging)
+    
+    parser_replay = subparsers.add_parser(
+        "replay",
+        help="Reconstruir users y clientes desde el staging parquet (STAGING_DIR)"
+    )
+    parser_replay.add_argument(
+        "--desde",
+        help="Solo los miembros con compras desde este mes, YYYY-MM (con todo su historial)"
+    )
+    parser_replay.add_argument(
+        "--hasta",
+        help="Solo los miembros con compras hasta este mes, YYYY-MM (con todo su historial)"
+    )
+    parser_replay.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="Miembros por lote (default: 1000)"
+    )
+    parser_replay.set_defaults(func=replay)
+    
+    parser_lentas = subparsers.add_parser(
+        "consultas-lentas",
+        help="Resumir el log de consultas lentas de MongoDB (SLOW_QUERY_LOG)"
+    )
+    parser_lentas.add_argument(
+        "--log",
+        help="Archivo de consultas lentas (default: SLOW_QUERY_LOG)"
+    )
+    parser_lentas.add_argument(
+        "--top",
+        type=int,
+        default=10,
+        help="Consultas a mostrar (default: 10)"
+    )
+    parser_lentas.add_argument(
+        "--desde",
+        help="Ignorar registros anteriores a esta fecha, YYYY-MM-DD"
+    )
+    # Solo lee el archivo: no se conecta a MongoDB
+    parser_lentas.set_defaults(func=consultas_lentas, sin_conexion=True)
+    
+    parser_indexes = subparsers.add_parser(
+        "indexes",
+        help="Comparar (check), crear (sync) o eliminar (drop-unused) índices según app/indices.py"
+    )
+    parser_indexes.add_argument(
+        "accion",
+        choices=["sync", "check", "drop-unused"]
+    )
+    parser_indexes.add_argument(
+        "--confirmar",
+        action="store_true",
+        help="drop-unused: eliminar (sin esta opción solo se listan)"
+    )
+    parser_indexes.add_argument(
+        "--forzar",
+        action="store_true",
+        help="drop-unused: eliminar también los que tienen operaciones desde el arranque del servidor o sin $indexStats"
+    )
+    parser_indexes.set_defaults(func=indexes)
+    
+    args = parser.parse_args()
+    
+    print("=" * 50)
+    print(f"🛠️  Club Soytechno - {args.comando}")
+    print("=" * 50)
+    
+    if getattr(args, "sin_conexion", False):
+        args.func(args)
+    else:
+        asyncio.run(ejecutar(args.func, args))
+
+
+if __name__ == "__main__":
+    main()
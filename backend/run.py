@@ -7,8 +7,11 @@ Uso:
     python run.py --host 0.0.0.0 --port 8000
 """
 
+import os
+import glob
 import uvicorn
 import argparse
+import tempfile
 from dotenv import load_dotenv
 
 # Cargar variables de entorno
@@ -60,6 +63,17 @@ def main():
         workers = 1
         log_level = "debug"
     
+    # Con varios workers, /metrics suma los valores que cada uno escribe en
+    # este directorio; debe existir y estar vacío antes de arrancarlos
+    if workers > 1:
+        directorio = os.environ.setdefault(
+            "PROMETHEUS_MULTIPROC_DIR",
+            tempfile.mkdtemp(prefix="soytechno-metricas-")
+        )
+        os.makedirs(directorio, exist_ok=True)
+        for archivo in glob.glob(os.path.join(directorio, "*.db")):
+            os.remove(archivo)
+    
     print("=" * 50)
     print("🚀 Club Soytechno API")
     print("=" * 50)
@@ -68,6 +82,8 @@ def main():
     print(f"🔄 Auto-reload: {reload}")
     print(f"👷 Workers: {workers}")
     print(f"📝 Log level: {log_level}")
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        print(f"📈 Métricas: {os.environ['PROMETHEUS_MULTIPROC_DIR']}")
     print("=" * 50)
     print(f"🌐 API: http://{args.host}:{args.port}")
     print(f"📚 Docs: http://{args.host}:{args.port}/docs")